@@ -0,0 +1,58 @@
+import time
+from contextlib import nullcontext
+
+from google.genai import types
+
+from config import MAX_ITERS, MAX_CONCURRENT_TOOLS, PREFETCH
+from functions.file_cache import FileCache, use_cache
+from functions.prefetch import Prefetcher, use_prefetcher
+from generate_content import generate_content_async
+from tracing import span
+
+async def run_session(client, user_prompt, available_functions, verbose=False, max_workers=MAX_CONCURRENT_TOOLS, max_iters=MAX_ITERS, file_cache=None, prefetch=PREFETCH):
+  """Async counterpart of main.main's loop. Returns a result dict instead of printing.
+
+  Each session gets a fresh file cache unless one is passed in (the daemon
+  shares one per workspace), and with prefetch its own prefetcher.
+  """
+  with (
+    use_cache(FileCache() if file_cache is None else file_cache) as file_cache,
+    use_prefetcher(Prefetcher()) if prefetch else nullcontext() as prefetcher,
+    span("session", prompt_chars=len(user_prompt)),
+  ):
+    result = await _run_loop(client, user_prompt, available_functions, verbose, max_workers, max_iters)
+  result["file_cache"] = file_cache.stats()
+  if prefetcher:
+    result["prefetch"] = prefetcher.stats()
+  return result
+
+async def _run_loop(client, user_prompt, available_functions, verbose, max_workers, max_iters):
+  messages = [types.Content(role="user", parts=[types.Part(text=user_prompt)])]
+  started = time.perf_counter()
+  errors = []
+
+  for iteration in range(1, max_iters + 1):
+    try:
+      with span("iteration", index=iteration - 1):
+        final_response = await generate_content_async(client, messages, available_functions, verbose, max_workers)
+      if final_response:
+        return {
+          "status": "ok",
+          "response": final_response,
+          "iterations": iteration,
+          "errors": errors,
+          "elapsed": time.perf_counter() - started,
+        }
+    except Exception as e:
+      # Same policy as the sync loop: an error costs one iteration
+      errors.append(f"Error in generate_content: {e}")
+      if verbose:
+        print(errors[-1])
+
+  return {
+    "status": "max_iters",
+    "response": None,
+    "iterations": max_iters,
+    "errors": errors,
+    "elapsed": time.perf_counter() - started,
+  }
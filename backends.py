@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import asyncio
+import threading
+
+from google.genai import types
+
+def create_client(backend="gemini", api_key=None):
+  """Build a model client from a backend spec: "gemini" or "replay:<session.json>"."""
+  if backend == "gemini":
+    from google import genai
+    return genai.Client(api_key=api_key)
+  if backend.startswith("replay:"):
+    return ReplayClient.from_file(backend.removeprefix("replay:"))
+  raise ValueError(f"Unknown model backend: {backend}")
+
+def _response_from_turn(turn):
+  parts = []
+  if text := turn.get("text"):
+    parts.append(types.Part(text=text))
+  for call in turn.get("function_calls", []):
+    parts.append(types.Part(function_call=types.FunctionCall(name=call["name"], args=call.get("args", {}))))
+  return types.GenerateContentResponse(
+    candidates=[types.Candidate(content=types.Content(role="model", parts=parts))],
+    usage_metadata=types.GenerateContentResponseUsageMetadata(
+      prompt_token_count=turn.get("prompt_tokens", 0),
+      candidates_token_count=turn.get("response_tokens", 0),
+    ),
+  )
+
+def _turn_from_responses(responses):
+  """Collapse one response, or all chunks of a streamed response, into a session turn."""
+  turn = {"function_calls": []}
+  text = ""
+  for response in responses:
+    turn["function_calls"].extend({"name": call.name, "args": call.args or {}} for call in response.function_calls or [])
+    if response.candidates and response.candidates[0].content:
+      text += "".join(part.text for part in response.candidates[0].content.parts or [] if part.text)
+    if response.usage_metadata:
+      turn["prompt_tokens"] = response.usage_metadata.prompt_token_count or 0
+      turn["response_tokens"] = response.usage_metadata.candidates_token_count or 0
+  if text:
+    turn["text"] = text
+  return turn
+
+class _ReplayModels:
+  def __init__(self, client):
+    self._client = client
+
+  def generate_content(self, model, contents, config=None):
+    turn = self._client._next_turn(model, contents)
+    if self._client.latency:
+      time.sleep(self._client.latency)
+    return _response_from_turn(turn)
+
+  def generate_content_stream(self, model, contents, config=None):
+    response = self.generate_content(model, contents, config)
+    # One chunk per part, with usage on the last one, like the live API
+    parts = response.candidates[0].content.parts
+    for index, part in enumerate(parts):
+      yield types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))],
+        usage_metadata=response.usage_metadata if index == len(parts) - 1 else None,
+      )
+
+class _ReplayAsyncModels:
+  def __init__(self, client):
+    self._client = client
+
+  async def generate_content(self, model, contents, config=None):
+    turn = self._client._next_turn(model, contents)
+    if self._client.latency:
+      await asyncio.sleep(self._client.latency)
+    return _response_from_turn(turn)
+
+class ReplayClient:
+  """Offline stand-in for genai.Client that replays a scripted or recorded session.
+
+  A session is a list of turns, each {"text": ..., "function_calls": [{"name": ..., "args": {...}}],
+  "prompt_tokens": ..., "response_tokens": ...}. Every model call consumes the next turn.
+  """
+
+  def __init__(self, turns, latency=0.0):
+    self.turns = list(turns)
+    self.latency = latency
+    self.requests = []
+    self._index = 0
+    self._lock = threading.Lock()
+    self.models = _ReplayModels(self)
+    self.aio = type("ReplayAio", (), {})()
+    self.aio.models = _ReplayAsyncModels(self)
+
+  @classmethod
+  def from_file(cls, path, latency=0.0):
+    with open(path, "r") as f:
+      session = json.load(f)
+    return cls(session["turns"] if isinstance(session, dict) else session, latency=latency)
+
+  def _next_turn(self, model, contents):
+    with self._lock:
+      if self._index >= len(self.turns):
+        raise RuntimeError(f"Replay session exhausted after {len(self.turns)} turns")
+      turn = self.turns[self._index]
+      self._index += 1
+      self.requests.append({"model": model, "messages": len(contents)})
+      return turn
+
+class _RecordingModels:
+  def __init__(self, recorder):
+    self._recorder = recorder
+
+  def generate_content(self, model, contents, config=None):
+    response = self._recorder.client.models.generate_content(model=model, contents=contents, config=config)
+    self._recorder.record([response])
+    return response
+
+  def generate_content_stream(self, model, contents, config=None):
+    chunks = []
+    for chunk in self._recorder.client.models.generate_content_stream(model=model, contents=contents, config=config):
+      chunks.append(chunk)
+      yield chunk
+    self._recorder.record(chunks)
+
+class RecordingClient:
+  """Wraps a live client and saves every response as a replayable session file."""
+
+  def __init__(self, client, path):
+    self.client = client
+    self.path = path
+    self.turns = []
+    self.models = _RecordingModels(self)
+
+  def record(self, responses):
+    self.turns.append(_turn_from_responses(responses))
+    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+    with open(self.path, "w") as f:
+      json.dump({"turns": self.turns}, f, indent=2)
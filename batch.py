@@ -0,0 +1,90 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+from contextlib import nullcontext
+from dotenv import load_dotenv
+from google import genai
+from async_agent import run_session
+from rate_limit import RetryingClient
+from routing import default_router
+from workspaces import isolated, summarize
+from call_function import get_available_functions
+from tracing import Tracer, use_tracer
+from tool_registry import TOOLS, ToolRegistry, use_registry
+from config import MAX_ITERS, MAX_CONCURRENT_TOOLS, MAX_CONCURRENT_SESSIONS, WORKING_DIRECTORY
+
+load_dotenv()  # Load environment variables from a .env file if present
+api_key = os.environ.get("GEMINI_API_KEY")
+
+def read_prompts(path):
+  with open(path, "r") as f:
+    for line_number, line in enumerate(f, start=1):
+      if not line.strip():
+        continue
+      entry = json.loads(line)
+      if isinstance(entry, str):
+        entry = {"prompt": entry}
+      entry.setdefault("id", line_number)
+      yield entry
+
+async def run_batch(client, entries, output_path, max_sessions=MAX_CONCURRENT_SESSIONS, max_workers=MAX_CONCURRENT_TOOLS, max_iters=MAX_ITERS, verbose=False, isolate_from=None):
+  """Run every entry's prompt, at most max_sessions at a time.
+
+  With isolate_from, each session works in its own copy-on-write workspace
+  cloned from that directory, and its record carries the changes it made.
+  """
+  available_functions = get_available_functions()
+  in_flight = asyncio.Semaphore(max_sessions)
+
+  with open(output_path, "w") as out:
+    async def run_one(entry):
+      async with in_flight:
+        started = time.perf_counter()
+        try:
+          if isolate_from:
+            async with isolated(isolate_from) as workspace:
+              result = await run_session(client, entry["prompt"], available_functions, verbose, max_workers, max_iters)
+              result.update(await asyncio.to_thread(summarize, workspace))
+          else:
+            result = await run_session(client, entry["prompt"], available_functions, verbose, max_workers, max_iters)
+        except Exception as e:
+          # One failing session must not take the batch down with it
+          result = {"status": "error", "response": None, "errors": [str(e)], "elapsed": time.perf_counter() - started}
+      record = {"id": entry["id"], "prompt": entry["prompt"], **result}
+      # Written as sessions finish; the event loop is single threaded so lines never interleave
+      out.write(json.dumps(record) + "\n")
+      out.flush()
+      return record
+
+    return await asyncio.gather(*(run_one(entry) for entry in entries))
+
+def main():
+  parser = argparse.ArgumentParser(description="Run many AI Code Assistant prompts concurrently")
+  parser.add_argument("prompts", type=str, help='JSONL file with one {"id": ..., "prompt": ...} object per line')
+  parser.add_argument("output", type=str, help="JSONL file to write per-prompt results and timings to")
+  parser.add_argument("--max-sessions", type=int, default=MAX_CONCURRENT_SESSIONS, help="Maximum number of sessions in flight at once")
+  parser.add_argument("--workspace", type=str, default=WORKING_DIRECTORY, help=f"Directory the tools are confined to (default: {WORKING_DIRECTORY})")
+  parser.add_argument("--isolate", action="store_true", help="Give each session its own copy-on-write clone of the workspace and record the diff it made")
+  parser.add_argument("--max-concurrent-tools", type=int, default=MAX_CONCURRENT_TOOLS, help="Maximum number of tool calls run concurrently per turn")
+  parser.add_argument("--verbose", action="store_true", help="Enable verbose output")
+  parser.add_argument("--trace", type=str, metavar="FILE", help="Write spans for all sessions to FILE (JSON lines, or a Chrome trace if FILE ends in .json)")
+  args = parser.parse_args()
+
+  # One client for every session, so the retry and throttle counters cover the whole batch
+  client = RetryingClient(genai.Client(api_key=api_key))
+  entries = list(read_prompts(args.prompts))
+  # Sessions run in tasks copied from this context, so they all see the registry
+  with use_registry(ToolRegistry(TOOLS, workspace=args.workspace)), use_tracer(Tracer(args.trace)) if args.trace else nullcontext():
+    records = asyncio.run(run_batch(client, entries, args.output, args.max_sessions, args.max_concurrent_tools, verbose=args.verbose, isolate_from=args.workspace if args.isolate else None))
+
+  ok = sum(record["status"] == "ok" for record in records)
+  print(f"Completed {ok}/{len(records)} prompts, results written to {args.output}")
+  stats = client.stats()
+  print(f"Model requests: {stats['requests']}, retries: {stats['retries']}, throttled for {stats['throttled_seconds']:.1f}s")
+  for model, model_stats in default_router().stats()["models"].items():
+    print(f"{model}: {model_stats['calls']} calls, {model_stats['failures']} failed, mean latency {model_stats['mean_latency_s']:.2f}s, {model_stats['prompt_tokens']} prompt / {model_stats['response_tokens']} response tokens")
+
+if __name__ == "__main__":
+  main()
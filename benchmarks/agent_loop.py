@@ -0,0 +1,192 @@
+"""End-to-end benchmark of the agent loop against the offline replay backend.
+
+Run from the repository root:
+
+  python -m benchmarks.agent_loop --output bench_results.json
+
+Reports per-iteration overhead (loop time not spent in the model or in tools),
+tool dispatch latency, history serialization cost and memory growth, for the
+calculator fixtures (when present) and synthetic repositories.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+import statistics
+from contextlib import redirect_stdout
+from io import StringIO
+
+from google.genai import types
+
+import call_function as call_function_module
+import generate_content as generate_content_module
+from backends import ReplayClient
+from config import WORKING_DIRECTORY
+from functions.file_cache import FileCache, use_cache
+
+def calculator_session():
+  return [
+    {"function_calls": [{"name": "get_files_info", "args": {}}]},
+    {"function_calls": [{"name": "get_files_info", "args": {"directory": "pkg"}}]},
+    {"function_calls": [
+      {"name": "get_file_content", "args": {"file_path": "main.py"}},
+      {"name": "get_file_content", "args": {"file_path": "pkg/calculator.py"}},
+      {"name": "get_file_content", "args": {"file_path": "pkg/render.py"}},
+    ]},
+    {"function_calls": [{"name": "run_python_file", "args": {"file_path": "tests.py"}}]},
+    {"function_calls": [{"name": "run_python_file", "args": {"file_path": "main.py", "args": ["3 + 5"]}}]},
+    {"function_calls": [{"name": "get_file_content", "args": {"file_path": "pkg/calculator.py"}}]},
+    {"text": "The calculator evaluates infix expressions with operator precedence."},
+  ]
+
+def make_synthetic_repo(root, files, seed=0):
+  rng = random.Random(seed)
+  paths = []
+  for index in range(files):
+    directory = os.path.join(f"pkg{index % 10}", f"sub{index % 7}")
+    os.makedirs(os.path.join(root, directory), exist_ok=True)
+    path = os.path.join(directory, f"module_{index}.py")
+    lines = [f"def function_{index}_{line}(value):\n    return value * {line}\n" for line in range(rng.randint(20, 200))]
+    with open(os.path.join(root, path), "w") as f:
+      f.write("".join(lines))
+    paths.append(path)
+  return paths
+
+def synthetic_session(paths, turns, seed=0):
+  rng = random.Random(seed)
+  session = [{"function_calls": [{"name": "get_files_info", "args": {}}]}]
+  for turn in range(turns):
+    calls = [{"name": "get_file_content", "args": {"file_path": rng.choice(paths)}} for _ in range(rng.randint(1, 4))]
+    calls.append({"name": "get_files_info", "args": {"directory": os.path.dirname(rng.choice(paths))}})
+    if turn % 5 == 4:
+      calls.append({"name": "write_file", "args": {"file_path": f"scratch/notes_{turn}.txt", "content": "x" * 2000}})
+    session.append({"function_calls": calls, "prompt_tokens": 1000 + turn * 500, "response_tokens": 50})
+  session.append({"text": "Done."})
+  return session
+
+def run_session(turns, working_directory, max_workers):
+  """Drive generate_content over a replayed session and collect timings."""
+  client = ReplayClient(turns)
+  available_functions = call_function_module.get_available_functions()
+  messages = [types.Content(role="user", parts=[types.Part(text="Benchmark prompt")])]
+
+  model_time = [0.0]
+  tool_time = [0.0]
+  dispatches = []
+  original_generate = client.models.generate_content
+  original_call_functions = generate_content_module.call_functions
+
+  def timed_generate(*args, **kwargs):
+    started = time.perf_counter()
+    try:
+      return original_generate(*args, **kwargs)
+    finally:
+      model_time[0] += time.perf_counter() - started
+
+  def timed_call_functions(function_calls, **kwargs):
+    started = time.perf_counter()
+    try:
+      return original_call_functions(function_calls, **kwargs)
+    finally:
+      elapsed = time.perf_counter() - started
+      tool_time[0] += elapsed
+      dispatches.append(elapsed / max(1, len(function_calls)))
+
+  client.models.generate_content = timed_generate
+  generate_content_module.call_functions = timed_call_functions
+  call_function_module.WORKING_DIRECTORY = working_directory
+
+  iterations = []
+  tracemalloc.start()
+  try:
+    with use_cache(FileCache()), redirect_stdout(StringIO()):
+      for _ in range(len(turns)):
+        model_time[0] = tool_time[0] = 0.0
+        started = time.perf_counter()
+        final = generate_content_module.generate_content(client, messages, available_functions, max_workers=max_workers)
+        wall = time.perf_counter() - started
+
+        serialize_started = time.perf_counter()
+        payload = json.dumps([message.model_dump(mode="json", exclude_none=True) for message in messages])
+        serialize_time = time.perf_counter() - serialize_started
+
+        iterations.append({
+          "wall": wall,
+          "model": model_time[0],
+          "tools": tool_time[0],
+          "overhead": wall - model_time[0] - tool_time[0],
+          "history_bytes": len(payload),
+          "serialize": serialize_time,
+          "memory": tracemalloc.get_traced_memory()[0],
+        })
+        if final:
+          break
+    peak_memory = tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+    generate_content_module.call_functions = original_call_functions
+    call_function_module.WORKING_DIRECTORY = WORKING_DIRECTORY
+
+  return summarize(iterations, dispatches, peak_memory)
+
+def _stats(values):
+  if not values:
+    return {}
+  ordered = sorted(values)
+  return {
+    "mean": statistics.fmean(ordered),
+    "p50": ordered[len(ordered) // 2],
+    "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+    "max": ordered[-1],
+  }
+
+def summarize(iterations, dispatches, peak_memory):
+  return {
+    "iterations": len(iterations),
+    "iteration_overhead_s": _stats([i["overhead"] for i in iterations]),
+    "tool_dispatch_latency_s": _stats(dispatches),
+    "history_serialize_s": _stats([i["serialize"] for i in iterations]),
+    "final_history_bytes": iterations[-1]["history_bytes"] if iterations else 0,
+    "memory_start_bytes": iterations[0]["memory"] if iterations else 0,
+    "memory_end_bytes": iterations[-1]["memory"] if iterations else 0,
+    "memory_growth_per_iteration_bytes": (
+      (iterations[-1]["memory"] - iterations[0]["memory"]) / max(1, len(iterations) - 1) if iterations else 0
+    ),
+    "memory_peak_bytes": peak_memory,
+  }
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the agent loop against an offline replay backend")
+  parser.add_argument("--output", type=str, help="Write machine-readable results to this JSON file")
+  parser.add_argument("--files", type=int, default=2000, help="Files in the synthetic repository")
+  parser.add_argument("--turns", type=int, default=60, help="Model turns in the synthetic session")
+  parser.add_argument("--max-concurrent-tools", type=int, default=4, help="Tool concurrency limit")
+  args = parser.parse_args()
+
+  results = {
+    "python": sys.version.split()[0],
+    "timestamp": time.time(),
+    "scenarios": {},
+  }
+
+  calculator_dir = os.path.abspath(WORKING_DIRECTORY)
+  if os.path.isdir(calculator_dir):
+    results["scenarios"]["calculator"] = run_session(calculator_session(), calculator_dir, args.max_concurrent_tools)
+
+  with tempfile.TemporaryDirectory() as root:
+    paths = make_synthetic_repo(root, args.files)
+    session = synthetic_session(paths, args.turns)
+    results["scenarios"][f"synthetic_{args.files}_files"] = run_session(session, root, args.max_concurrent_tools)
+
+  report = json.dumps(results, indent=2)
+  if args.output:
+    with open(args.output, "w") as f:
+      f.write(report)
+  print(report)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,116 @@
+"""Size of tool results in the text and compact result formats.
+
+Run from the repository root:
+
+  python -m benchmarks.result_formats --files 200 2000 --output formats.json
+
+Replays the same tool calls against the calculator fixtures (when present)
+and synthetic repositories once per format, and reports the characters and
+estimated tokens of each function response as it is sent to the model.
+Every result stays in the history, so it is paid for again on each later
+turn.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+
+from google.genai import types
+
+from benchmarks.agent_loop import make_synthetic_repo
+from compaction import estimate_tokens
+from config import WORKING_DIRECTORY
+from functions.result_format import RESULT_FORMATS
+from tool_registry import TOOLS, ToolRegistry
+
+COMPACT_TOOLS = ("get_files_info", "get_file_content", "run_python_file", "write_file")
+
+def calculator_calls():
+  return [
+    ("get_files_info", {}),
+    ("get_files_info", {"recursive": True}),
+    ("get_files_info", {"directory": "pkg"}),
+    ("get_file_content", {"file_path": "pkg/calculator.py"}),
+    ("get_file_content", {"file_path": "pkg/calculator.py", "start_line": 1, "end_line": 10}),
+    ("get_file_content", {"file_path": "long.txt"}),
+    ("run_python_file", {"file_path": "tests.py"}),
+    ("run_python_file", {"file_path": "main.py", "args": ["3 + 5"]}),
+    ("write_file", {"file_path": "notes.txt", "content": "x" * 200}),
+  ]
+
+def synthetic_calls(paths):
+  return [
+    ("get_files_info", {}),
+    ("get_files_info", {"recursive": True}),
+    ("get_files_info", {"recursive": True, "cursor": "200"}),
+    ("get_files_info", {"directory": os.path.dirname(paths[0])}),
+    ("get_files_info", {"recursive": True, "include": ["*_1*.py"]}),
+    ("get_file_content", {"file_path": paths[0], "start_line": 1, "end_line": 20}),
+    ("run_python_file", {"file_path": "report.py"}),
+    ("write_file", {"file_path": "scratch/notes.txt", "content": "x" * 200}),
+  ]
+
+def measure(root, calls, result_format):
+  """Run calls in a scratch copy of root and size each function response."""
+  overrides = {name: {"result_format": result_format} for name in COMPACT_TOOLS}
+  with tempfile.TemporaryDirectory() as scratch:
+    workspace = shutil.copytree(root, os.path.join(scratch, "workspace"), ignore=shutil.ignore_patterns("__pycache__"))
+    registry = ToolRegistry(TOOLS, workspace=workspace, overrides=overrides)
+    sizes = []
+    for name, args in calls:
+      part = types.Part.from_function_response(name=name, response=registry.call(name, args))
+      sizes.append({
+        "tool": name,
+        "args": args,
+        "chars": len(part.model_dump_json(exclude_none=True)),
+        "tokens": estimate_tokens(part),
+      })
+  return sizes
+
+def compare(root, calls):
+  by_format = {result_format: measure(root, calls, result_format) for result_format in RESULT_FORMATS}
+  text_tokens = sum(call["tokens"] for call in by_format["text"])
+  scenario = {"calls": len(calls), "formats": {}}
+  for result_format, sizes in by_format.items():
+    tokens = sum(call["tokens"] for call in sizes)
+    scenario["formats"][result_format] = {
+      "chars": sum(call["chars"] for call in sizes),
+      "tokens": tokens,
+      "token_savings": 1 - tokens / text_tokens if text_tokens else 0.0,
+      "per_call": sizes,
+    }
+  return scenario
+
+def main():
+  parser = argparse.ArgumentParser(description="Compare tool result sizes across result formats")
+  parser.add_argument("--files", type=int, nargs="+", default=[200, 2000], help="Sizes of the synthetic repositories")
+  parser.add_argument("--output", type=str, help="Write machine-readable results to this JSON file")
+  args = parser.parse_args()
+
+  results = {"python": sys.version.split()[0], "scenarios": {}}
+
+  calculator_dir = os.path.abspath(WORKING_DIRECTORY)
+  if os.path.isdir(calculator_dir):
+    results["scenarios"]["calculator"] = compare(calculator_dir, calculator_calls())
+
+  for files in args.files:
+    with tempfile.TemporaryDirectory() as root:
+      paths = make_synthetic_repo(root, files)
+      with open(os.path.join(root, "report.py"), "w") as f:
+        f.write("import os\nfor name in sorted(os.listdir('.')):\n  print(name)\n")
+      results["scenarios"][f"synthetic_{files}_files"] = compare(root, synthetic_calls(paths))
+
+  report = json.dumps(results, indent=2)
+  if args.output:
+    with open(args.output, "w") as f:
+      f.write(report)
+  summary = {
+    name: {result_format: stats["tokens"] for result_format, stats in scenario["formats"].items()}
+    for name, scenario in results["scenarios"].items()
+  }
+  print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,77 @@
+"""CLI startup-time benchmark.
+
+Run from the repository root:
+
+  python -m benchmarks.startup --runs 20 --max-overhead-ms 50
+
+Times `main.py --help` and a failed argument parse against a bare
+interpreter, and lists any heavy modules imported on those paths. Exits
+non-zero if the overhead over the bare interpreter exceeds --max-overhead-ms
+or if google.genai is imported before it is needed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("google.genai", "pydantic", "httpx", "dotenv")
+
+def time_command(command, runs):
+  samples = []
+  for _ in range(runs):
+    started = time.perf_counter()
+    subprocess.run(command, cwd=ROOT, capture_output=True)
+    samples.append((time.perf_counter() - started) * 1000)
+  return statistics.median(samples)
+
+def heavy_imports(argv):
+  """Modules from HEAVY_MODULES that main.py imports when run with argv."""
+  probe = (
+    "import sys, json, runpy\n"
+    f"sys.argv = ['main.py', *{argv!r}]\n"
+    "try:\n"
+    "  runpy.run_path('main.py', run_name='__main__')\n"
+    "except SystemExit:\n"
+    "  pass\n"
+    f"print(json.dumps(sorted({{m for m in sys.modules for h in {HEAVY_MODULES!r} if m == h or m.startswith(h + '.')}})))\n"
+  )
+  result = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, capture_output=True, text=True)
+  return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark main.py startup time")
+  parser.add_argument("--runs", type=int, default=10, help="Runs per command; the median is reported")
+  parser.add_argument("--max-overhead-ms", type=float, help="Fail if --help takes this much longer than a bare interpreter")
+  parser.add_argument("--output", type=str, help="Write machine-readable results to this JSON file")
+  args = parser.parse_args()
+
+  baseline = time_command([sys.executable, "-c", "pass"], args.runs)
+  help_ms = time_command([sys.executable, "main.py", "--help"], args.runs)
+  usage_error_ms = time_command([sys.executable, "main.py"], args.runs)
+  results = {
+    "python": sys.version.split()[0],
+    "bare_interpreter_ms": baseline,
+    "help_ms": help_ms,
+    "usage_error_ms": usage_error_ms,
+    "help_overhead_ms": help_ms - baseline,
+    "heavy_imports_on_help": heavy_imports(["--help"]),
+    "heavy_imports_on_usage_error": heavy_imports([]),
+  }
+
+  report = json.dumps(results, indent=2)
+  if args.output:
+    with open(args.output, "w") as f:
+      f.write(report)
+  print(report)
+
+  failed = results["heavy_imports_on_help"] or results["heavy_imports_on_usage_error"]
+  if args.max_overhead_ms is not None and results["help_overhead_ms"] > args.max_overhead_ms:
+    failed = True
+  sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+  main()
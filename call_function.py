@@ -1,6 +1,24 @@
+import os
+import contextvars
+from functools import cache
+from concurrent.futures import ThreadPoolExecutor, wait
+
 from google.genai import types
 
-from functions import get_file_content, get_files_info, run_python_file, write_file
+from config import MAX_CONCURRENT_TOOLS, WORKING_DIRECTORY
+import tracing
+from tool_registry import TOOLS, ToolRegistry, current_registry
+
+@cache
+def _default_registry(working_directory):
+  return ToolRegistry(TOOLS, workspace=working_directory)
+
+def get_registry():
+  """The registry of the current session, or the default one for WORKING_DIRECTORY."""
+  return current_registry() or _default_registry(WORKING_DIRECTORY)
+
+def get_available_functions():
+  return get_registry().tool
 
 def call_function(function_call_part: types.FunctionCall, verbose=False):
   function_name = function_call_part.name or "unknown"
@@ -8,38 +26,80 @@ def call_function(function_call_part: types.FunctionCall, verbose=False):
     print(f"Calling function: {function_name}({function_call_part.args})")
   else:
     print(f" - Calling function: {function_name}")
-    
-  function_map = {
-    "get_files_info": get_files_info.get_files_info,
-    "write_file": write_file.write_file,
-    "get_file_content": get_file_content.get_file_content,
-    "run_python_file": run_python_file.run_python_file,
-  }
-    
-  function_to_call = function_map.get(function_name)
-  
-  if not function_to_call:
-    return types.Content(
-      role="tool",
-      parts=[
-        types.Part.from_function_response(
-          name=function_name,
-          response={"error": f"Unknown function: {function_name}"},
-        )
-      ],
-    )
-    
-  args = function_call_part.args or {}
-  args["working_directory"] = "./calculator"
-  
-  function_result = function_to_call(**args)
+
+  with tracing.span("call_function", tool=function_name) as attrs:
+    response = get_registry().call(function_name, function_call_part.args)
+    attrs["result_bytes"] = len(str(response.get("result", response.get("error"))))
   
   return types.Content(
     role="tool",
     parts=[
       types.Part.from_function_response(
         name=function_name,
-        response={"result": function_result},
+        response=response,
       )
     ],
-)
\ No newline at end of file
+)
+
+
+def _access(function_call_part):
+  """Return (kind, path) describing what a call touches: kind is "read", "write" or "barrier"."""
+  return get_registry().access(function_call_part.name, function_call_part.args)
+
+
+def _overlaps(a, b):
+  if a == b or a == "." or b == ".":
+    return True
+  return a.startswith(b + os.sep) or b.startswith(a + os.sep)
+
+
+class ToolDispatcher:
+  """Runs the function calls of one model turn on a bounded thread pool.
+
+  Read-only calls run in parallel. A call that writes a path waits for every
+  earlier call touching an overlapping path, and barrier calls wait for (and
+  block) everything. Results are returned in submission order.
+  """
+
+  def __init__(self, max_workers=MAX_CONCURRENT_TOOLS, verbose=False):
+    self.verbose = verbose
+    self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="tool")
+    self._submitted = []
+
+  def submit(self, function_call_part):
+    kind, path = _access(function_call_part)
+    deps = [
+      future for prev_kind, prev_path, future in self._submitted
+      if "barrier" in (kind, prev_kind)
+      or ("write" in (kind, prev_kind) and _overlaps(path, prev_path))
+    ]
+    # Tools read session state (e.g. the file cache) from context variables
+    context = contextvars.copy_context()
+    future = self._executor.submit(context.run, self._run, function_call_part, deps)
+    self._submitted.append((kind, path, future))
+    return future
+
+  def _run(self, function_call_part, deps):
+    # Dependencies were submitted earlier, so the FIFO pool has already
+    # started them and waiting here cannot deadlock.
+    wait(deps)
+    return call_function(function_call_part, verbose=self.verbose)
+
+  def results(self):
+    return [future.result() for _, _, future in self._submitted]
+
+  def close(self):
+    self._executor.shutdown(wait=True)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+def call_functions(function_calls, verbose=False, max_workers=MAX_CONCURRENT_TOOLS):
+  with ToolDispatcher(max_workers=max_workers, verbose=verbose) as dispatcher:
+    for function_call in function_calls:
+      dispatcher.submit(function_call)
+    return dispatcher.results()
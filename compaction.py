@@ -0,0 +1,108 @@
+import os
+
+from google.genai import types
+
+from config import COMPACTION_TOKEN_BUDGET, COMPACTION_KEEP_RECENT
+
+CHARS_PER_TOKEN = 4
+ELIDED_PREFIX = "[elided"
+
+def estimate_tokens(part: types.Part):
+  return len(part.model_dump_json(exclude_none=True)) // CHARS_PER_TOKEN
+
+def _is_elided(part: types.Part):
+  response = part.function_response.response or {}
+  result = response.get("result")
+  return isinstance(result, str) and result.startswith(ELIDED_PREFIX)
+
+def _stub(part: types.Part, reason):
+  return types.Part.from_function_response(
+    name=part.function_response.name,
+    response={"result": f"{ELIDED_PREFIX}: {reason}]"},
+  )
+
+def _tool_exchanges(messages):
+  """Yield (message_index, part_index, call_args, response_part) for every tool result.
+
+  Function responses follow the model message that requested them, in the same order.
+  """
+  pending_calls = []
+  for message_index, message in enumerate(messages):
+    parts = message.parts or []
+    if message.role == "model":
+      pending_calls = [part.function_call for part in parts if part.function_call]
+      continue
+    response_index = 0
+    for part_index, part in enumerate(parts):
+      if not part.function_response:
+        continue
+      call = pending_calls[response_index] if response_index < len(pending_calls) else None
+      response_index += 1
+      yield message_index, part_index, (call.args if call else None) or {}, part
+
+def _file_path(args):
+  path = args.get("file_path")
+  return os.path.normpath(str(path)) if path else None
+
+def _written_paths(name, args):
+  if name == "write_file":
+    return [_file_path(args)] if args.get("file_path") else []
+  paths = [_file_path(edit) for edit in args.get("edits") or [] if edit.get("file_path")]
+  for line in str(args.get("patch") or "").splitlines():
+    if line.startswith(("+++ ", "--- ")) and (path := line[4:].split("\t")[0].strip()) != "/dev/null":
+      paths.append(os.path.normpath(path.removeprefix("a/").removeprefix("b/")))
+  return paths
+
+def compact_messages(messages, token_budget=COMPACTION_TOKEN_BUDGET, keep_recent=COMPACTION_KEEP_RECENT):
+  """Shrink old tool results in place so the history stays under token_budget.
+
+  Reads of a file that was read again or rewritten later are always stubbed,
+  since only the latest state of each file matters. If the history is still
+  over budget, the oldest remaining tool results are stubbed until it fits.
+  The last keep_recent tool-result messages are left alone. Returns the
+  estimated number of tokens saved.
+  """
+  if token_budget is None:
+    return 0
+
+  exchanges = list(_tool_exchanges(messages))
+  recent = sorted({message_index for message_index, *_ in exchanges})[-keep_recent:] if keep_recent else []
+  replacements = {}
+
+  # Walk newest to oldest: a read is stale once the same window of the file
+  # was read again or the file was rewritten later
+  later_reads = set()
+  later_writes = set()
+  for message_index, part_index, args, part in reversed(exchanges):
+    name = part.function_response.name
+    if name in ("write_file", "edit_file"):
+      later_writes.update(_written_paths(name, args))
+      continue
+    path = _file_path(args)
+    if not path or name != "get_file_content":
+      continue
+    window = (path, args.get("start_line"), args.get("end_line"))
+    if (window in later_reads or path in later_writes) and message_index not in recent and not _is_elided(part):
+      replacements[(message_index, part_index)] = _stub(part, f"superseded by a later read or write of '{path}'")
+    later_reads.add(window)
+
+  total = sum(estimate_tokens(part) for message in messages for part in (message.parts or []))
+  saved = sum(
+    estimate_tokens(messages[message_index].parts[part_index]) - estimate_tokens(stub)
+    for (message_index, part_index), stub in replacements.items()
+  )
+
+  for message_index, part_index, args, part in exchanges:
+    if total - saved <= token_budget:
+      break
+    key = (message_index, part_index)
+    if message_index in recent or key in replacements or _is_elided(part):
+      continue
+    stub = _stub(part, f"old {part.function_response.name} result dropped to save context")
+    replacements[key] = stub
+    saved += estimate_tokens(part) - estimate_tokens(stub)
+
+  for (message_index, part_index), stub in replacements.items():
+    messages[message_index].parts[part_index] = stub
+
+  return saved
@@ -1,2 +1,94 @@
+import os
+
 MAX = 10000
-MAX_ITERS = 20
\ No newline at end of file
+MAX_ITERS = 20
+# Maximum number of tool calls from a single model turn that run at the same time
+MAX_CONCURRENT_TOOLS = 4
+# Maximum number of agent sessions in flight at once in batch mode
+MAX_CONCURRENT_SESSIONS = 8
+# Approximate token budget for the conversation history sent to the model (None disables compaction)
+COMPACTION_TOKEN_BUDGET = 60000
+# Number of most recent tool-result messages that compaction never touches
+COMPACTION_KEEP_RECENT = 2
+# Byte budget of the per-session cache for file reads and directory listings
+FILE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# Run Python files in pre-started worker interpreters instead of a fresh `python` per call
+PYTHON_WORKER_POOL = False
+# Number of idle worker interpreters kept warm
+PYTHON_WORKER_POOL_SIZE = 2
+# Modules each worker imports before it is handed a file to run
+PYTHON_WORKER_PREIMPORTS = []
+# Directory the tools operate in
+WORKING_DIRECTORY = "./calculator"
+# Entries returned per page by get_files_info
+LISTING_PAGE_SIZE = 200
+# Default depth limit for recursive listings
+LISTING_MAX_DEPTH = 8
+# Where search_files keeps its persistent trigram indexes
+SEARCH_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "python-ai-agent", "search")
+# Files larger than this are not indexed or searched
+SEARCH_MAX_FILE_BYTES = 1024 * 1024
+# Search indexes kept in memory, least recently used saved and dropped first
+SEARCH_INDEX_CACHE_SIZE = 16
+# A search reuses the last walk of the tree for this many seconds; tools that write files keep the index current
+SEARCH_REFRESH_SECONDS = 2.0
+# Maximum number of matching lines returned by one search
+SEARCH_MAX_RESULTS = 50
+# Number of files whose line-offset index is kept in memory for ranged reads
+LINE_INDEX_CACHE_SIZE = 64
+# Directory where session checkpoints are written (None disables checkpointing)
+SESSION_DIR = ".sessions"
+# Per-tool overrides of the registry defaults: timeout (seconds), max_concurrency, result_cap (characters)
+# and result_format ("text", or "compact" for shorter results), e.g. {"get_files_info": {"result_format": "compact"}}
+TOOL_OVERRIDES = {}
+# Default cap on the size of a single tool result sent back to the model
+TOOL_RESULT_CAP = 4 * MAX
+# Model request and token quotas per minute, shared by all sessions in the process (None disables throttling)
+REQUESTS_PER_MINUTE = None
+TOKENS_PER_MINUTE = None
+# How many times a rate-limited or transiently failing model request is retried
+MODEL_MAX_RETRIES = 5
+# Unix socket the agent daemon listens on and main.py --daemon connects to
+DAEMON_SOCKET = os.path.join(os.path.expanduser("~"), ".cache", "python-ai-agent", "agent.sock")
+# run_python_file keeps at most this many bytes of each output stream (half from the start, half from the end)
+RUN_OUTPUT_MAX_BYTES = MAX
+# run_python_file kills a script once it has written this many bytes of output in total
+RUN_OUTPUT_HARD_LIMIT = 64 * 1024 * 1024
+# Per-script resource limits applied with setrlimit (None disables one); process count is per user and does not bind root
+RESOURCE_LIMITS = {
+  "cpu_seconds": 30,
+  "memory_bytes": 2 * 1024 * 1024 * 1024,
+  "open_files": 256,
+  "processes": 512,
+  "file_size_bytes": 64 * 1024 * 1024,
+}
+# Model used for turns no routing rule claims
+MODEL = "gemini-2.5-flash"
+# Routing rules tried in order, first match wins. Keys are routing.Route fields, e.g.
+# {"model": "gemini-2.5-flash-lite", "pending_tool_results": True, "max_history_tokens": 8000}
+MODEL_ROUTES = []
+# Models from weakest to strongest; a failed or malformed call is retried on the next one
+MODEL_ESCALATION = ["gemini-2.5-flash-lite", "gemini-2.5-flash", "gemini-2.5-pro"]
+# Where per-session copy-on-write workspaces are created; None puts them in a hidden
+# directory next to the base tree, on the same device, so reflinks and hardlinks work
+WORKSPACE_DIR = None
+# Directory names never mirrored into session workspaces
+WORKSPACE_EXCLUDE = {".git", "__pycache__", ".sessions"}
+# Replay run_python_file results for identical runs (same script, args, interpreter and workspace contents)
+RUN_CACHE = False
+# How many run_python_file results are kept, least recently used evicted first
+RUN_CACHE_SIZE = 64
+# Working directories whose file hashes the run cache keeps, least recently hashed dropped first
+RUN_CACHE_TREES = 16
+# Read likely-next files (small text files just listed, local modules imported by files just read) in the background
+PREFETCH = False
+# Total size of prefetched files kept for the session, oldest dropped first
+PREFETCH_MAX_BYTES = 4 * 1024 * 1024
+# Larger files are never prefetched
+PREFETCH_MAX_FILE_BYTES = 64 * 1024
+# Files queued per listing or read at most, smallest first for listings
+PREFETCH_MAX_CANDIDATES = 16
+# Extensions of listed files worth prefetching
+PREFETCH_EXTENSIONS = {".py", ".md", ".txt", ".rst", ".toml", ".cfg", ".ini", ".json", ".yaml", ".yml"}
+# Background threads reading prefetched files
+PREFETCH_WORKERS = 2
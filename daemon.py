@@ -0,0 +1,229 @@
+"""Agent daemon: keeps a warm model client, tool registries and file caches
+in memory and runs sessions requested over a Unix socket.
+
+Start it with:
+
+  python daemon.py --socket ~/.cache/python-ai-agent/agent.sock
+
+and send prompts with `python main.py --daemon "..."`. Each connection
+carries one session: the client writes a JSON request line, and the daemon
+answers with JSON lines, one per finished span (model calls, tool calls,
+iterations) followed by a final "result" line. A request with "isolate":
+true runs in a private copy-on-write clone of its workspace and gets the
+clone's changes and diff back; adding "export": true applies them.
+"""
+import os
+import json
+import stat
+import socket
+import argparse
+import itertools
+
+from config import DAEMON_SOCKET, MAX_CONCURRENT_SESSIONS, MAX_CONCURRENT_TOOLS, MAX_ITERS, PREFETCH, WORKING_DIRECTORY
+
+# Only the client half (request_session) runs in main.py's process, so the
+# server's imports are deferred to keep `main.py --daemon` cheap to start
+
+def request_session(socket_path, request):
+  """Send a session request to the daemon and yield its events as they arrive."""
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+    sock.connect(os.path.expanduser(socket_path))
+    sock.sendall(json.dumps(request).encode() + b"\n")
+    with sock.makefile("r") as events:
+      for line in events:
+        yield json.loads(line)
+
+class SocketInUseError(RuntimeError):
+  pass
+
+def _daemon_answers(socket_path):
+  """True if a daemon is accepting connections on socket_path, False if there is no socket or a stale one."""
+  try:
+    if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+      raise SocketInUseError(f"{socket_path} exists and is not a socket")
+  except FileNotFoundError:
+    return False
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+    try:
+      sock.connect(socket_path)
+    except OSError:
+      return False
+  return True
+
+class _ProgressTracer:
+  """Tracer that forwards each finished span to emit, and to parent if tracing is on."""
+
+  def __init__(self, emit, parent=None):
+    self.emit = emit
+    self.parent = parent
+    self._ids = parent._ids if parent else itertools.count(1)
+
+  def record(self, name, span_id, parent_id, start_ns, duration_ns, attrs):
+    self.emit({"type": "span", "name": name, "duration_ms": duration_ns / 1e6, **attrs})
+    if self.parent:
+      self.parent.record(name, span_id, parent_id, start_ns, duration_ns, attrs)
+
+  def close(self):
+    # The parent tracer outlives the session
+    pass
+
+class AgentDaemon:
+  """Runs agent sessions for socket clients, sharing one model client.
+
+  Tool registries and file caches are kept per workspace and reused across
+  sessions; the cache revalidates every entry against the file's signature,
+  so edits made between sessions are picked up.
+  """
+
+  def __init__(self, client, workspace=WORKING_DIRECTORY, max_sessions=MAX_CONCURRENT_SESSIONS, verbose=False):
+    import asyncio
+
+    self.client = client
+    self.workspace = workspace
+    self.verbose = verbose
+    self.sessions = 0
+    self._in_flight = asyncio.Semaphore(max_sessions)
+    self._registries = {}
+    self._caches = {}
+
+  async def start(self, socket_path):
+    import asyncio
+    import shutil
+    import tempfile
+
+    socket_path = os.path.expanduser(socket_path)
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if _daemon_answers(socket_path):
+      raise SocketInUseError(f"Another daemon is already serving on {socket_path}")
+
+    # Sessions run arbitrary code in the workspace, so only the owner may
+    # connect: the socket is bound in a private directory and restricted
+    # before it is moved into place, so it is never reachable with the
+    # umask's permissions
+    private = tempfile.mkdtemp(dir=directory, prefix=".agent-sock.")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      bound_path = os.path.join(private, "sock")
+      sock.bind(bound_path)
+      os.chmod(bound_path, 0o600)
+      os.replace(bound_path, socket_path)
+    except BaseException:
+      sock.close()
+      raise
+    finally:
+      shutil.rmtree(private, ignore_errors=True)
+    return await asyncio.start_unix_server(self._handle, sock=sock)
+
+  def _workspace(self, workspace):
+    from functions.file_cache import FileCache
+    from tool_registry import TOOLS, ToolRegistry
+
+    workspace = os.path.abspath(workspace)
+    if workspace not in self._registries:
+      self._registries[workspace] = ToolRegistry(TOOLS, workspace=workspace)
+      self._caches[workspace] = FileCache()
+    return self._registries[workspace], self._caches[workspace]
+
+  async def _handle(self, reader, writer):
+    import asyncio
+    import tracing
+    from async_agent import run_session
+    from tool_registry import use_registry
+    from workspaces import isolated, summarize
+
+    loop = asyncio.get_running_loop()
+
+    def emit(event):
+      # Spans finish on tool threads as well as on the event loop
+      data = json.dumps(event, default=str).encode() + b"\n"
+      loop.call_soon_threadsafe(writer.write, data)
+
+    try:
+      request = json.loads(await reader.readline())
+      prompt = request.get("prompt")
+      workspace = request.get("workspace") or self.workspace
+      if not prompt:
+        raise ValueError("a prompt is required")
+      if not os.path.isdir(workspace):
+        raise ValueError(f"workspace '{workspace}' is not a directory")
+      registry, file_cache = self._workspace(workspace)
+
+      async def session():
+        return await run_session(
+          self.client,
+          prompt,
+          registry.tool,
+          request.get("verbose", self.verbose),
+          request.get("max_concurrent_tools", MAX_CONCURRENT_TOOLS),
+          request.get("max_iters", MAX_ITERS),
+          file_cache=None if request.get("isolate") else file_cache,
+          prefetch=request.get("prefetch", PREFETCH),
+        )
+
+      async with self._in_flight:
+        self.sessions += 1
+        with tracing.use_tracer(_ProgressTracer(emit, tracing.current_tracer())):
+          if request.get("isolate"):
+            # A private clone of the workspace; its changes come back as a
+            # diff and are applied to the workspace only if asked to
+            async with isolated(workspace) as clone:
+              result = await session()
+              result.update(await asyncio.to_thread(summarize, clone))
+              if request.get("export"):
+                result["export"] = await asyncio.to_thread(clone.export)
+          else:
+            with use_registry(registry):
+              result = await session()
+      event = {"type": "result", **result}
+    except Exception as e:
+      event = {"type": "error", "error": str(e)}
+
+    try:
+      # Let spans queued from tool threads go out before the result
+      await asyncio.sleep(0)
+      writer.write(json.dumps(event, default=str).encode() + b"\n")
+      await writer.drain()
+      writer.close()
+      await writer.wait_closed()
+    except ConnectionError:
+      # The client went away; the session's work is done regardless
+      pass
+
+def main():
+  parser = argparse.ArgumentParser(description="Serve AI Code Assistant sessions over a Unix socket")
+  parser.add_argument("--socket", type=str, default=DAEMON_SOCKET, help=f"Unix socket to listen on (default: {DAEMON_SOCKET})")
+  parser.add_argument("--workspace", type=str, default=WORKING_DIRECTORY, help=f"Default directory the tools are confined to (default: {WORKING_DIRECTORY})")
+  parser.add_argument("--backend", type=str, default="gemini", help='Model backend: "gemini" or "replay:<session.json>"')
+  parser.add_argument("--max-sessions", type=int, default=MAX_CONCURRENT_SESSIONS, help="Maximum number of sessions in flight at once")
+  parser.add_argument("--verbose", action="store_true", help="Enable verbose output")
+  parser.add_argument("--trace", type=str, metavar="FILE", help="Write spans for all sessions to FILE (JSON lines, or a Chrome trace if FILE ends in .json)")
+  args = parser.parse_args()
+
+  import asyncio
+  from contextlib import nullcontext
+  from dotenv import load_dotenv
+  from backends import create_client
+  from rate_limit import RetryingClient
+  from tracing import Tracer, use_tracer
+
+  load_dotenv()  # Load environment variables from a .env file if present
+  client = RetryingClient(create_client(args.backend, api_key=os.environ.get("GEMINI_API_KEY")))
+
+  async def serve():
+    daemon = AgentDaemon(client, args.workspace, args.max_sessions, args.verbose)
+    server = await daemon.start(args.socket)
+    print(f"Serving sessions on {args.socket}")
+    async with server:
+      await server.serve_forever()
+
+  with use_tracer(Tracer(args.trace)) if args.trace else nullcontext():
+    try:
+      asyncio.run(serve())
+    except SocketInUseError as e:
+      parser.exit(1, f"Error: {e}\n")
+    except KeyboardInterrupt:
+      pass
+
+if __name__ == "__main__":
+  main()
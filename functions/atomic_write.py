@@ -0,0 +1,29 @@
+import os
+import tempfile
+
+# Read once at import time: os.umask can only be queried by setting it, which
+# is not safe once tool threads are running
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def atomic_write(path, content):
+  """Write content to path via a temp file and rename, so readers never see a partial file."""
+  directory = os.path.dirname(path)
+  fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+  try:
+    # newline="" writes line endings exactly as they are in content
+    with os.fdopen(fd, "wb") if isinstance(content, bytes) else os.fdopen(fd, "w", newline="") as f:
+      f.write(content)
+      f.flush()
+      os.fsync(f.fileno())
+    try:
+      os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+    except FileNotFoundError:
+      os.chmod(temp_path, 0o666 & ~_UMASK)
+    os.replace(temp_path, path)
+  except BaseException:
+    try:
+      os.unlink(temp_path)
+    except FileNotFoundError:
+      pass
+    raise
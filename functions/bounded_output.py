@@ -0,0 +1,116 @@
+import time
+import threading
+from dataclasses import dataclass
+from subprocess import TimeoutExpired
+
+from config import RUN_OUTPUT_MAX_BYTES, RUN_OUTPUT_HARD_LIMIT
+
+READ_CHUNK = 64 * 1024
+
+class BoundedBuffer:
+  """Keeps the first and last max_bytes / 2 bytes of a stream and counts the rest."""
+
+  def __init__(self, max_bytes=RUN_OUTPUT_MAX_BYTES):
+    self.head_bytes = max_bytes // 2
+    self.tail_bytes = max_bytes - self.head_bytes
+    self.head = bytearray()
+    self.tail = bytearray()
+    self.total = 0
+
+  def write(self, data):
+    self.total += len(data)
+    if len(self.head) < self.head_bytes:
+      room = self.head_bytes - len(self.head)
+      self.head += data[:room]
+      data = data[room:]
+    if data:
+      self.tail += data[-self.tail_bytes:] if self.tail_bytes else b""
+      if len(self.tail) > self.tail_bytes:
+        del self.tail[:len(self.tail) - self.tail_bytes]
+
+  @property
+  def truncated(self):
+    return self.total > len(self.head) + len(self.tail)
+
+  def text(self):
+    head = self.head.decode(errors="replace")
+    tail = self.tail.decode(errors="replace")
+    if self.truncated:
+      omitted = self.total - len(self.head) - len(self.tail)
+      return f"{head}\n[... {omitted} bytes omitted ...]\n{tail}"
+    return head + tail
+
+@dataclass
+class CapturedOutput:
+  stdout: str
+  stderr: str
+  returncode: int
+  elapsed: float
+  output_bytes: int
+  truncated: bool
+  killed: bool
+
+def capture(process, input=None, timeout=None, max_bytes=RUN_OUTPUT_MAX_BYTES, hard_limit=RUN_OUTPUT_HARD_LIMIT):
+  """Read a binary Popen's stdout and stderr incrementally into bounded buffers.
+
+  Each stream keeps at most max_bytes. The process is killed once it has
+  written more than hard_limit bytes in total; on timeout it is killed and
+  TimeoutExpired is raised, carrying the output read so far.
+  """
+  started = time.perf_counter()
+  buffers = {"stdout": BoundedBuffer(max_bytes), "stderr": BoundedBuffer(max_bytes)}
+  lock = threading.Lock()
+  state = {"bytes": 0, "killed": False}
+
+  def drain(pipe, buffer):
+    while data := pipe.read1(READ_CHUNK):
+      with lock:
+        state["bytes"] += len(data)
+        over = state["bytes"] > hard_limit
+        if over and not state["killed"]:
+          state["killed"] = True
+          process.kill()
+      if not over:
+        buffer.write(data)
+    pipe.close()
+
+  readers = [
+    threading.Thread(target=drain, args=(getattr(process, name), buffer), daemon=True)
+    for name, buffer in buffers.items()
+  ]
+  for reader in readers:
+    reader.start()
+
+  if process.stdin:
+    try:
+      if input:
+        process.stdin.write(input)
+      process.stdin.close()
+    except BrokenPipeError:
+      # The process exited without reading its input; its output says why
+      pass
+
+  try:
+    process.wait(timeout=timeout)
+  except TimeoutExpired:
+    process.kill()
+    process.wait()
+    _join(readers)
+    raise TimeoutExpired(process.args, timeout, output=buffers["stdout"].text(), stderr=buffers["stderr"].text())
+  _join(readers)
+
+  return CapturedOutput(
+    stdout=buffers["stdout"].text(),
+    stderr=buffers["stderr"].text(),
+    returncode=process.returncode,
+    elapsed=time.perf_counter() - started,
+    output_bytes=state["bytes"],
+    truncated=any(buffer.truncated for buffer in buffers.values()) or state["killed"],
+    killed=state["killed"],
+  )
+
+def _join(readers):
+  # A grandchild that inherited the pipes can keep them open after the
+  # process exits; don't wait on it forever
+  for reader in readers:
+    reader.join(timeout=1)
@@ -0,0 +1,251 @@
+import os
+import re
+import difflib
+from functions.atomic_write import atomic_write
+from functions.file_cache import current_cache
+from functions.search_index import notify_changed
+from functions.paths import resolve_in
+
+schema_edit_file = {
+  "name": "edit_file",
+  "description": "Edits one or more files in place with search/replace hunks or a unified diff, constrained to the working directory. All edits are applied together or not at all. Prefer this over write_file for small changes to existing files.",
+  "parameters": {
+    "type": "OBJECT",
+    "properties": {
+      "edits": {
+        "type": "ARRAY",
+        "description": "Search/replace hunks, applied in order.",
+        "items": {
+          "type": "OBJECT",
+          "properties": {
+            "file_path": {
+              "type": "STRING",
+              "description": "The file to edit, relative to the working directory.",
+            },
+            "search": {
+              "type": "STRING",
+              "description": "Exact text to replace; it must occur exactly once in the file. Leave empty to create a new file.",
+            },
+            "replace": {
+              "type": "STRING",
+              "description": "The replacement text.",
+            },
+          },
+          "required": ["file_path"],
+        },
+      },
+      "patch": {
+        "type": "STRING",
+        "description": "A unified diff (as produced by `diff -u` or `git diff`) to apply instead of, or in addition to, edits.",
+      },
+    },
+  },
+}
+
+MAX_SUMMARY_LINES = 40
+
+class EditError(Exception):
+  pass
+
+def edit_file(working_directory, edits=None, patch=None):
+  if not edits and not patch:
+    return "Error: Provide at least one search/replace edit or a patch"
+
+  working_directory_abs = os.path.realpath(working_directory)
+  originals = {}
+  updated = {}
+
+  def load(file_path, create=False):
+    full_file_path = resolve_in(working_directory_abs, file_path)
+    if full_file_path is None:
+      raise EditError(f"Cannot edit '{file_path}' as it is outside the permitted working directory")
+    if full_file_path not in updated:
+      if os.path.isfile(full_file_path):
+        # newline="" keeps CRLF line endings, so an edit only changes the lines it touches
+        with open(full_file_path, "r", newline="") as f:
+          originals[full_file_path] = f.read()
+      elif create:
+        originals[full_file_path] = None
+      else:
+        raise EditError(f"File not found: '{file_path}'")
+      updated[full_file_path] = originals[full_file_path]
+    return full_file_path
+
+  try:
+    for edit in edits or []:
+      file_path = edit.get("file_path")
+      if not file_path:
+        raise EditError("Every edit needs a file_path")
+      search = edit.get("search") or ""
+      replace = edit.get("replace") or ""
+      full_file_path = load(file_path, create=not search)
+      updated[full_file_path] = _apply_search_replace(file_path, updated[full_file_path], search, replace)
+
+    for file_path, hunks, deleted in _parse_unified_diff(patch or ""):
+      full_file_path = load(file_path, create=True)
+      updated[full_file_path] = None if deleted else _apply_hunks(file_path, updated[full_file_path] or "", hunks)
+  except EditError as e:
+    return f"Error: {e}; no files were changed"
+  except Exception as e:
+    return f"Error: Cannot apply edits: {e}; no files were changed"
+
+  changed = [path for path in updated if updated[path] != originals[path]]
+  try:
+    _commit(changed, originals, updated)
+  except Exception as e:
+    return f"Error: Cannot write edits, all files were restored: {e}"
+  finally:
+    cache = current_cache()
+    for path in changed:
+      if cache:
+        cache.invalidate(path)
+      notify_changed(working_directory_abs, path)
+
+  if not changed:
+    return "No changes: the edits leave every file as it was"
+  return _summarize(working_directory_abs, changed, originals, updated)
+
+def _apply_search_replace(file_path, content, search, replace):
+  if content is None:
+    if search:
+      raise EditError(f"File not found: '{file_path}'")
+    return replace
+  if not search:
+    raise EditError(f"'{file_path}' already exists; give the text to replace in search")
+  if "\r\n" in content and "\r" not in search + replace and search.replace("\n", "\r\n") in content:
+    # The model writes "\n"; match and keep the file's CRLF line endings
+    search, replace = search.replace("\n", "\r\n"), replace.replace("\n", "\r\n")
+  count = content.count(search)
+  if count != 1:
+    raise EditError(f"search text occurs {count} times in '{file_path}', it must occur exactly once")
+  return content.replace(search, replace, 1)
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+def _strip_prefix(path):
+  path = path.split("\t")[0].strip()
+  if path.startswith(("a/", "b/")):
+    path = path[2:]
+  return path
+
+def _parse_unified_diff(patch):
+  """Yield (file_path, hunks, deleted) for each file in a unified diff.
+
+  Each hunk is (old_start, old_lines, new_lines), with lines kept without
+  their newline.
+  """
+  lines = patch.splitlines()
+  i = 0
+  while i < len(lines):
+    if not lines[i].startswith("--- ") or i + 1 >= len(lines) or not lines[i + 1].startswith("+++ "):
+      i += 1
+      continue
+    old_path = _strip_prefix(lines[i][4:])
+    new_path = _strip_prefix(lines[i + 1][4:])
+    i += 2
+    hunks = []
+    while i < len(lines) and (match := _HUNK_HEADER.match(lines[i])):
+      old_start = int(match.group(1))
+      old_count = int(match.group(2) or 1)
+      new_count = int(match.group(4) or 1)
+      old_lines, new_lines = [], []
+      i += 1
+      while i < len(lines) and (len(old_lines) < old_count or len(new_lines) < new_count):
+        line = lines[i]
+        i += 1
+        if line.startswith("\\"):
+          continue
+        tag, text = (line[0], line[1:]) if line else (" ", "")
+        if tag not in " -+":
+          raise EditError(f"Malformed hunk line in patch: {line!r}")
+        if tag in " -":
+          old_lines.append(text)
+        if tag in " +":
+          new_lines.append(text)
+      hunks.append((old_start, old_lines, new_lines))
+    if new_path == "/dev/null":
+      yield old_path, hunks, True
+    else:
+      yield new_path, hunks, False
+
+def _apply_hunks(file_path, content, hunks):
+  # Each line keeps its own ending; added lines get the file's (CRLF if it has any)
+  newline = "\r\n" if "\r\n" in content else "\n"
+  lines = content.split("\n")
+  endings = ["\r\n" if line.endswith("\r") else "\n" for line in lines]
+  lines = [line.removesuffix("\r") for line in lines]
+  trailing_newline = content.endswith("\n") or not content
+  if trailing_newline:
+    lines.pop()
+    endings.pop()
+  else:
+    # The unterminated last line needs an ending if lines are added after it
+    endings[-1] = newline
+  offset = 0
+  for old_start, old_lines, new_lines in hunks:
+    # A hunk with no old lines inserts after line old_start
+    stated = old_start - 1 if old_lines else old_start
+    position = _find_hunk(lines, old_lines, max(0, stated + offset))
+    if position is None:
+      raise EditError(f"Hunk at line {old_start} does not match the current contents of '{file_path}'")
+    lines[position:position + len(old_lines)] = new_lines
+    endings[position:position + len(old_lines)] = [newline] * len(new_lines)
+    # Later hunks drift by however far this one moved plus the lines it added
+    offset = position - stated + len(new_lines) - len(old_lines)
+  if not lines:
+    return ""
+  if not trailing_newline:
+    endings[-1] = ""
+  return "".join(text + ending for text, ending in zip(lines, endings))
+
+def _find_hunk(lines, old_lines, expected):
+  """Find old_lines at the expected position, or the closest place they match exactly."""
+  if not old_lines:
+    return min(expected, len(lines))
+  size = len(old_lines)
+  candidates = sorted(range(len(lines) - size + 1), key=lambda start: abs(start - expected))
+  for start in candidates:
+    if lines[start:start + size] == old_lines:
+      return start
+  return None
+
+def _commit(changed, originals, updated):
+  """Write every changed file with temp-file-plus-rename; roll back all of them on failure."""
+  done = []
+  try:
+    for path in changed:
+      if updated[path] is None:
+        os.remove(path)
+      else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, updated[path])
+      done.append(path)
+  except BaseException:
+    for path in reversed(done):
+      if originals[path] is None:
+        os.remove(path)
+      else:
+        atomic_write(path, originals[path])
+    raise
+
+def _summarize(working_directory_abs, changed, originals, updated):
+  summary = []
+  diff_lines = []
+  for path in changed:
+    relative_path = os.path.relpath(path, working_directory_abs)
+    before = (originals[path] or "").splitlines()
+    after = (updated[path] or "").splitlines()
+    diff = list(difflib.unified_diff(before, after, f"a/{relative_path}", f"b/{relative_path}", n=1, lineterm=""))
+    added = sum(1 for line in diff if line.startswith("+") and not line.startswith("+++"))
+    removed = sum(1 for line in diff if line.startswith("-") and not line.startswith("---"))
+    status = "created" if originals[path] is None else "deleted" if updated[path] is None else "edited"
+    summary.append(f"- {relative_path}: {status}, +{added} -{removed} lines")
+    diff_lines.extend(diff)
+
+  result = [f"Successfully applied edits to {len(changed)} file(s):", *summary]
+  if diff_lines:
+    result.append("Diff:")
+    result.extend(diff_lines[:MAX_SUMMARY_LINES])
+    if len(diff_lines) > MAX_SUMMARY_LINES:
+      result.append(f"[... {len(diff_lines) - MAX_SUMMARY_LINES} more diff lines]")
+  return "\n".join(result)
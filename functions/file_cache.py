@@ -0,0 +1,106 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import FILE_CACHE_MAX_BYTES
+
+_current_cache = ContextVar("file_cache", default=None)
+
+def current_cache():
+  return _current_cache.get()
+
+@contextmanager
+def use_cache(cache):
+  """Make cache the file cache for the current session (context)."""
+  token = _current_cache.set(cache)
+  try:
+    yield cache
+  finally:
+    _current_cache.reset(token)
+
+def _signature(path):
+  st = os.stat(path)
+  return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+class FileCache:
+  """LRU cache of file reads and directory listings for one agent session.
+
+  Entries are keyed by (kind, resolved path) and validated against the
+  path's (mtime_ns, size, inode) on every lookup. A directory's mtime does
+  not change when a child file is modified in place, so listings rely on
+  explicit invalidation from the tools that modify files.
+  """
+
+  def __init__(self, max_bytes=FILE_CACHE_MAX_BYTES):
+    self.max_bytes = max_bytes
+    self._entries = OrderedDict()
+    self._bytes = 0
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.invalidations = 0
+    self.bytes_saved = 0
+
+  def get(self, kind, path, loader, size_of=len):
+    """Return the cached value for path, calling loader() on a miss or a stale entry."""
+    path = os.path.realpath(path)
+    key = (kind, path)
+    signature = _signature(path)
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry and entry[0] == signature:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.bytes_saved += entry[2]
+        return entry[1]
+      self.misses += 1
+
+    value = loader()
+    size = size_of(value)
+    with self._lock:
+      self._discard(key)
+      if size <= self.max_bytes:
+        self._entries[key] = (signature, value, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+          _, (_, _, evicted_size) = self._entries.popitem(last=False)
+          self._bytes -= evicted_size
+          self.evictions += 1
+    return value
+
+  def _discard(self, key):
+    if entry := self._entries.pop(key, None):
+      self._bytes -= entry[2]
+
+  def invalidate(self, path):
+    """Drop entries for path and for any directory listing that contains it."""
+    path = os.path.realpath(path)
+    with self._lock:
+      stale = [
+        key for key in self._entries
+        if key[1] == path or path.startswith(key[1].rstrip(os.sep) + os.sep)
+      ]
+      for key in stale:
+        self._discard(key)
+      self.invalidations += len(stale)
+
+  def clear(self):
+    with self._lock:
+      self.invalidations += len(self._entries)
+      self._entries.clear()
+      self._bytes = 0
+
+  def stats(self):
+    with self._lock:
+      return {
+        "hits": self.hits,
+        "misses": self.misses,
+        "evictions": self.evictions,
+        "invalidations": self.invalidations,
+        "bytes_saved": self.bytes_saved,
+        "entries": len(self._entries),
+        "bytes": self._bytes,
+      }
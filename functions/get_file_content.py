@@ -1,38 +1,110 @@
 import os
+from bisect import bisect_right
 from config import MAX
-from google.genai import types
-
-schema_get_file_content = types.FunctionDeclaration(
-  name="get_file_content",
-  description="Reads the content of a specified file, constrained to the working directory.",
-  parameters=types.Schema(
-    type=types.Type.OBJECT,
-    properties={
-      "file_path": types.Schema(
-        type=types.Type.STRING,
-        description="The file path to read from, relative to the working directory.",
-      ),
+from functions.file_cache import current_cache
+from functions.line_index import get_line_index, is_binary
+from functions.paths import resolve_in
+from functions.prefetch import current_prefetcher
+
+schema_get_file_content = {
+  "name": "get_file_content",
+  "description": "Reads the content of a specified file, constrained to the working directory.",
+  "parameters": {
+    "type": "OBJECT",
+    "properties": {
+      "file_path": {
+        "type": "STRING",
+        "description": "The file path to read from, relative to the working directory.",
+      },
+      "start_line": {
+        "type": "INTEGER",
+        "description": "First line to read (1-based). Use with end_line to read part of a large file.",
+      },
+      "end_line": {
+        "type": "INTEGER",
+        "description": "Last line to read (1-based, inclusive). Defaults to as many lines as fit in the size limit.",
+      },
     },
-  ),
-)
+    "required": ["file_path"],
+  },
+}
 
-def get_file_content(working_directory, file_path):
-  working_directory_abs = os.path.abspath(working_directory)
-  full_file_path = os.path.abspath(os.path.join(working_directory_abs, file_path))
+def get_file_content(working_directory, file_path, start_line=None, end_line=None, result_format="text"):
+  full_file_path = resolve_in(working_directory, file_path)
   
-  if not full_file_path.startswith(working_directory_abs):
+  if full_file_path is None:
     return f"Error: Cannot read '{file_path}' as it is outside the permitted working directory"
   
   if not os.path.isfile(full_file_path):
     return f"Error: File not found or is not a regular file: '{file_path}'"
   
   try:
-    with open(full_file_path, "r") as f:
-      file_contents = f.read(MAX)
-      if more_contents := f.read(1):
-        file_contents += f"[...File '{file_path}' truncated at {MAX} characters]"
-      
+    if is_binary(full_file_path):
+      return f"Error: '{file_path}' appears to be a binary file and cannot be read as text"
+  except Exception as e:
+    return f"Error: Cannot open file '{file_path}': {e}"
+
+  if start_line is not None or end_line is not None:
+    return _read_lines(full_file_path, file_path, start_line, end_line, result_format)
+
+  prefetcher = current_prefetcher()
+
+  def load():
+    if prefetcher and (prefetched := prefetcher.take(full_file_path)) is not None:
+      return prefetched
+    return _read(full_file_path)
+
+  try:
+    if cache := current_cache():
+      file_contents, truncated = cache.get("content", full_file_path, load, size_of=lambda value: len(value[0]))
+    else:
+      file_contents, truncated = load()
   except Exception as e:
     return f"Error: Cannot open file '{file_path}': {e}"
+
+  if prefetcher:
+    prefetcher.after_read(working_directory, full_file_path, file_contents)
+
+  if truncated:
+    file_contents += f"[truncated at {MAX} chars]" if result_format == "compact" else f"[...File '{file_path}' truncated at {MAX} characters]"
   
-  return file_contents
\ No newline at end of file
+  return file_contents
+
+def _read(full_file_path):
+  with open(full_file_path, "r") as f:
+    file_contents = f.read(MAX)
+    return file_contents, bool(f.read(1))
+
+def _read_lines(full_file_path, file_path, start_line, end_line, result_format):
+  try:
+    index = get_line_index(full_file_path)
+  except Exception as e:
+    return f"Error: Cannot open file '{file_path}': {e}"
+
+  start = max(1, int(start_line or 1))
+  if start > index.line_count:
+    return f"Error: start_line {start} is past the end of '{file_path}' ({index.line_count} lines)"
+  end = min(index.line_count, int(end_line) if end_line is not None else index.line_count)
+  if end < start:
+    return f"Error: end_line {end} is before start_line {start}"
+
+  # Never decode more bytes than could possibly fit in MAX characters, even
+  # when a single line (e.g. minified code) is longer than that
+  max_bytes = MAX * 4
+  end_limit = min(end, max(start, bisect_right(index.offsets, index.offsets[start - 1] + max_bytes) - 1))
+  cut_in_line = index.offsets[end_limit] - index.offsets[start - 1] > max_bytes
+  contents = index.read(start, end_limit, max_bytes=max_bytes).decode("utf-8", errors="replace")
+
+  if end_limit == end and not cut_in_line and len(contents) <= MAX:
+    if result_format == "compact":
+      return f"[{start}-{end}/{index.line_count}]\n{contents}"
+    return f"[Lines {start}-{end} of {index.line_count} in '{file_path}']\n{contents}"
+
+  # Cut back to whole lines unless a single line is already over the limit
+  contents = contents[:MAX]
+  if "\n" in contents:
+    contents = contents[:contents.rfind("\n") + 1]
+  shown_end = max(start, start + contents.count("\n") - 1)
+  if result_format == "compact":
+    return f"[{start}-{shown_end}/{index.line_count}, truncated at {MAX} chars]\n{contents}"
+  return f"[Lines {start}-{shown_end} of {index.line_count} in '{file_path}', truncated at {MAX} characters]\n{contents}"
@@ -1,32 +1,52 @@
 import os
-from pathlib import Path
-from google.genai import types
-
-schema_get_files_info = types.FunctionDeclaration(
-  name="get_files_info",
-  description="Lists files in the specified directory along with their sizes, constrained to the working directory.",
-  parameters=types.Schema(
-    type=types.Type.OBJECT,
-    properties={
-      "directory": types.Schema(
-          type=types.Type.STRING,
-          description="The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself.",
-      ),
+from fnmatch import fnmatch
+from config import LISTING_PAGE_SIZE, LISTING_MAX_DEPTH
+from functions.file_cache import current_cache
+from functions.gitignore import GitIgnore
+from functions.paths import resolve_in
+from functions.prefetch import current_prefetcher
+from functions.result_format import tree_lines
+
+schema_get_files_info = {
+  "name": "get_files_info",
+  "description": "Lists files in the specified directory along with their sizes, constrained to the working directory. Can walk subdirectories recursively; long listings are returned in pages.",
+  "parameters": {
+    "type": "OBJECT",
+    "properties": {
+      "directory": {
+        "type": "STRING",
+        "description": "The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself.",
+      },
+      "recursive": {
+        "type": "BOOLEAN",
+        "description": "List the whole tree below the directory instead of a single level. Files ignored by .gitignore are skipped.",
+      },
+      "max_depth": {
+        "type": "INTEGER",
+        "description": f"How many directory levels a recursive listing descends. Defaults to {LISTING_MAX_DEPTH}.",
+      },
+      "include": {
+        "type": "ARRAY",
+        "description": "Only list files matching one of these glob patterns, e.g. ['*.py'].",
+        "items": {"type": "STRING"},
+      },
+      "exclude": {
+        "type": "ARRAY",
+        "description": "Skip files and directories matching any of these glob patterns.",
+        "items": {"type": "STRING"},
+      },
+      "cursor": {
+        "type": "STRING",
+        "description": "Continuation cursor from a previous, truncated listing.",
+      },
     },
-  ),
-)
+  },
+}
 
-def get_files_info(working_directory, directory="."):
-  target_directory = os.path.join(working_directory, directory)
-  
-  # Resolve to absolute path to prevent path traversal
-  try:
-    resolved_target = Path(target_directory).resolve()
-    resolved_working = Path(working_directory).resolve()
-  except Exception:
-    return f"Error: Invalid path '{directory}'"
-  
-  if not resolved_target.is_relative_to(resolved_working):
+def get_files_info(working_directory, directory=".", recursive=False, max_depth=None, include=None, exclude=None, cursor=None, respect_gitignore=None, page_size=LISTING_PAGE_SIZE, result_format="text"):
+  target_directory = resolve_in(working_directory, directory)
+
+  if target_directory is None:
     return f"Error: Cannot list '{directory}' as it is outside the permitted working directory"
   if not os.path.exists(target_directory):
     return f"Error: Directory '{directory}' does not exist"
@@ -34,20 +54,109 @@ def get_files_info(working_directory, directory="."):
     return f"Error: '{directory}' is not a directory"
 
   try:
-    items = os.listdir(target_directory)
+    offset = int(cursor) if cursor else 0
+  except ValueError:
+    return f"Error: Invalid cursor '{cursor}'"
+
+  depth = 1
+  if recursive:
+    depth = int(max_depth) if max_depth is not None else LISTING_MAX_DEPTH
+    if depth < 1:
+      return f"Error: max_depth must be at least 1, got {max_depth}"
+  if respect_gitignore is None:
+    respect_gitignore = bool(recursive)
+  options = (depth, tuple(include or ()), tuple(exclude or ()), respect_gitignore)
+  root = os.path.realpath(working_directory)
+  ignore = GitIgnore(root) if respect_gitignore else None
+
+  def scan():
+    return _scan(target_directory, depth, options[1], options[2], ignore, root)
+
+  try:
+    if cache := current_cache():
+      entries, skipped = cache.get(("listing", *options), target_directory, scan, size_of=_listing_size)
+    else:
+      entries, skipped = scan()
   except Exception as e:
     return f"Error: Unable to list directory '{directory}': {str(e)}"
 
+  page = entries[offset:offset + page_size]
+  if prefetcher := current_prefetcher():
+    # The next call is most likely a read of one of these files
+    prefetcher.after_listing(target_directory, page)
+  remaining = len(entries) - offset - page_size
+  if result_format == "compact":
+    return _compact(directory, page, skipped, remaining, offset + page_size)
+
   dir_info = [f"""Result for {"current" if directory == "." else f"'{directory}'"} directory:"""]
-  
-  for item in items:
-    try:
-        item_path = os.path.join(target_directory, item)
-        item_info = f"- {item}: file_size={os.path.getsize(item_path)} bytes, is_dir={os.path.isdir(item_path)}"
-    except Exception as e:
-        return f"Error: Unable to get file info for '{item}': {str(e)}"
-    dir_info.append(item_info)
-      
+  dir_info.extend(f"- {name}: file_size={size} bytes, is_dir={is_dir}" for name, size, is_dir in page)
+
+  if skipped:
+    dir_info.append(f"[Skipped {skipped} unreadable entries]")
+  if remaining > 0:
+    dir_info.append(f"[... {remaining} more entries, call again with cursor='{offset + page_size}']")
+
   info_str = "\n".join(dir_info)
   return info_str
-    
\ No newline at end of file
+
+def _compact(directory, page, skipped, remaining, next_cursor):
+  lines = [] if directory == "." else [f"{directory}:"]
+  lines.extend(tree_lines(page) or ["(empty)"])
+  if skipped:
+    lines.append(f"[{skipped} unreadable]")
+  if remaining > 0:
+    lines.append(f"[+{remaining} more, cursor='{next_cursor}']")
+  return "\n".join(lines)
+
+def _scan(target_directory, max_depth, include, exclude, ignore, root):
+  """Walk target_directory with os.scandir, reusing each entry's cached stat.
+
+  Symlinked directories are listed but not descended into, and links that
+  resolve outside root are left out, so the walk stays inside the workspace.
+  Returns a sorted list of (relative path, size, is_dir) and the number of
+  entries that could not be read.
+  """
+  entries = []
+  skipped = 0
+  pending = [("", 1)]
+  while pending:
+    relative_dir, depth = pending.pop()
+    try:
+      with os.scandir(os.path.join(target_directory, relative_dir)) as iterator:
+        children = list(iterator)
+    except OSError:
+      skipped += 1
+      continue
+
+    for entry in children:
+      relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+      try:
+        is_dir = entry.is_dir()
+        size = entry.stat().st_size
+        is_link = entry.is_symlink()
+      except OSError:
+        skipped += 1
+        continue
+      if is_link and resolve_in(root, entry.path) is None:
+        continue
+
+      if exclude and _matches(relative_path, exclude):
+        continue
+      if ignore and ignore.ignored(os.path.join(target_directory, relative_path), is_dir):
+        continue
+      if is_dir and not is_link and depth < max_depth:
+        pending.append((relative_path, depth + 1))
+      if include and (is_dir or not _matches(relative_path, include)):
+        continue
+      entries.append((relative_path, size, is_dir))
+
+  entries.sort()
+  return entries, skipped
+
+def _matches(relative_path, patterns):
+  name = relative_path.rsplit("/", 1)[-1]
+  return any(fnmatch(name, pattern) or fnmatch(relative_path, pattern) for pattern in patterns)
+
+def _listing_size(listing):
+  entries, _ = listing
+  return sum(len(name) + 16 for name, _, _ in entries)
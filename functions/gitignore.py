@@ -0,0 +1,41 @@
+import os
+from fnmatch import fnmatch
+
+class GitIgnore:
+  """The subset of .gitignore semantics that matters for listing and searching files.
+
+  Supports the root .gitignore with comments, negation, directory-only
+  patterns and anchored patterns. The .git directory is always ignored.
+  """
+
+  def __init__(self, root):
+    self.root = root
+    self.rules = []
+    try:
+      with open(os.path.join(root, ".gitignore"), "r") as f:
+        lines = f.read().splitlines()
+    except OSError:
+      lines = []
+    for line in lines:
+      line = line.strip()
+      if not line or line.startswith("#"):
+        continue
+      negated = line.startswith("!")
+      line = line.removeprefix("!")
+      directory_only = line.endswith("/")
+      line = line.rstrip("/")
+      anchored = "/" in line
+      self.rules.append((line.lstrip("/"), negated, directory_only, anchored))
+
+  def ignored(self, path, is_dir):
+    relative_path = os.path.relpath(path, self.root).replace(os.sep, "/")
+    if relative_path == ".git" or relative_path.startswith(".git/"):
+      return True
+    name = relative_path.rsplit("/", 1)[-1]
+    ignored = False
+    for pattern, negated, directory_only, anchored in self.rules:
+      if directory_only and not is_dir:
+        continue
+      if fnmatch(relative_path, pattern) if anchored else fnmatch(name, pattern):
+        ignored = not negated
+    return ignored
@@ -0,0 +1,68 @@
+import os
+import re
+import mmap
+import threading
+from array import array
+from collections import OrderedDict
+
+from config import LINE_INDEX_CACHE_SIZE
+
+_NEWLINE = re.compile(b"\n")
+BINARY_SNIFF_BYTES = 8192
+
+def is_binary(path):
+  """Cheap binary check: a NUL byte near the start of the file."""
+  with open(path, "rb") as f:
+    return b"\0" in f.read(BINARY_SNIFF_BYTES)
+
+class LineIndex:
+  """Byte offsets of every line start in a file, plus a sentinel at the end."""
+
+  def __init__(self, path):
+    st = os.stat(path)
+    self.path = path
+    self.signature = (st.st_mtime_ns, st.st_size)
+    self.offsets = array("Q", [0])
+    if st.st_size:
+      with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        self.offsets.extend(match.end() for match in _NEWLINE.finditer(mm))
+    if self.offsets[-1] != st.st_size:
+      self.offsets.append(st.st_size)
+
+  @property
+  def line_count(self):
+    return len(self.offsets) - 1
+
+  def read(self, start_line, end_line, max_bytes=None):
+    """Return the bytes of lines start_line..end_line (1-based, inclusive) without reading the rest.
+
+    With max_bytes, at most that many bytes from the start of start_line are returned.
+    """
+    start = self.offsets[start_line - 1]
+    end = self.offsets[end_line]
+    if max_bytes is not None:
+      end = min(end, start + max_bytes)
+    if start == end:
+      return b""
+    with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+      return mm[start:end]
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+def get_line_index(path):
+  """Return a LineIndex for path, rebuilding it only when (mtime_ns, size) changes."""
+  path = os.path.realpath(path)
+  st = os.stat(path)
+  with _lock:
+    index = _indexes.get(path)
+    if index and index.signature == (st.st_mtime_ns, st.st_size):
+      _indexes.move_to_end(path)
+      return index
+  index = LineIndex(path)
+  with _lock:
+    _indexes[path] = index
+    _indexes.move_to_end(path)
+    while len(_indexes) > LINE_INDEX_CACHE_SIZE:
+      _indexes.popitem(last=False)
+  return index
@@ -0,0 +1,16 @@
+import os
+
+def resolve_in(working_directory, path):
+  """Resolve path against working_directory, or return None if it escapes it.
+
+  Symlinks are resolved first, so a link inside the workspace cannot be used
+  to reach files outside it. Every tool checks its paths through here, and
+  the tools that walk a tree (listings, search) do not descend into
+  symlinked directories and check symlinked files through here too, which
+  is what confines a session to its own workspace root.
+  """
+  root = os.path.realpath(working_directory)
+  full_path = os.path.realpath(os.path.join(root, path))
+  if os.path.commonpath([full_path, root]) != root:
+    return None
+  return full_path
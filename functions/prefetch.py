@@ -0,0 +1,192 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import MAX, PREFETCH_MAX_BYTES, PREFETCH_MAX_FILE_BYTES, PREFETCH_MAX_CANDIDATES, PREFETCH_EXTENSIONS, PREFETCH_WORKERS
+from functions.line_index import is_binary
+from functions.paths import resolve_in
+
+_current_prefetcher = ContextVar("prefetcher", default=None)
+
+def current_prefetcher():
+  return _current_prefetcher.get()
+
+@contextmanager
+def use_prefetcher(prefetcher):
+  """Make prefetcher the current session's prefetcher, stopping it on exit."""
+  token = _current_prefetcher.set(prefetcher)
+  try:
+    yield prefetcher
+  finally:
+    _current_prefetcher.reset(token)
+    prefetcher.close()
+
+# `import a.b, c` and `from .a.b import c, d`; the names of a from-import may be submodules
+_IMPORT = re.compile(r"^[ \t]*(?:from[ \t]+(\.*)([\w.]*)[ \t]+import[ \t]+\(?([\w., \t]+)|import[ \t]+([\w., \t]+))", re.MULTILINE)
+
+def _signature(st):
+  return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def _load(path):
+  """Read path the way get_file_content does: (contents, truncated), or None for binary files."""
+  if is_binary(path):
+    return None
+  with open(path, "r") as f:
+    contents = f.read(MAX)
+    return contents, bool(f.read(1))
+
+class Prefetcher:
+  """Reads files the model is likely to ask for next while it is still thinking.
+
+  Tool calls report what they listed and read; small text files from a
+  listing and the local modules a Python file imports are then read on
+  background threads into a bounded store. A later get_file_content takes
+  its file from the store if the file has not changed since, and each
+  prefetched file is served at most once.
+
+  Hit rate is the share of file reads that found their file prefetched;
+  wasted bytes were prefetched but evicted, gone stale or never read.
+  """
+
+  def __init__(self, max_bytes=PREFETCH_MAX_BYTES, max_file_bytes=PREFETCH_MAX_FILE_BYTES, max_candidates=PREFETCH_MAX_CANDIDATES, extensions=PREFETCH_EXTENSIONS, workers=PREFETCH_WORKERS):
+    self.max_bytes = max_bytes
+    self.max_file_bytes = max_file_bytes
+    self.max_candidates = max_candidates
+    self.extensions = set(extensions)
+    self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+    self._store = OrderedDict()
+    self._bytes = 0
+    self._pending = set()
+    # Files the session has read are in its file cache from then on
+    self._read = set()
+    self._lock = threading.Lock()
+    self._closed = False
+    self.scheduled = 0
+    self.prefetched = 0
+    self.prefetched_bytes = 0
+    self.hits = 0
+    self.hit_bytes = 0
+    self.misses = 0
+    self.wasted_bytes = 0
+
+  def after_listing(self, directory, entries):
+    """Queue the smallest text files among (relative path, size, is_dir) entries listed in directory."""
+    files = sorted(
+      (size, relative_path) for relative_path, size, is_dir in entries
+      if not is_dir and size <= self.max_file_bytes and os.path.splitext(relative_path)[1] in self.extensions
+    )
+    self._schedule(os.path.join(directory, relative_path) for _, relative_path in files)
+
+  def after_read(self, working_directory, path, contents):
+    """Queue the workspace modules imported by the Python file at path."""
+    if path.endswith(".py"):
+      self._schedule(_imported_files(os.path.realpath(working_directory), path, contents))
+
+  def take(self, path):
+    """Return the prefetched (contents, truncated) for path, or None if it isn't ready or has changed."""
+    path = os.path.realpath(path)
+    with self._lock:
+      self._read.add(path)
+      entry = self._store.pop(path, None)
+      if entry:
+        self._bytes -= entry[2]
+    try:
+      current = _signature(os.stat(path)) if entry else None
+    except OSError:
+      current = None
+    with self._lock:
+      if entry and entry[0] == current:
+        self.hits += 1
+        self.hit_bytes += entry[2]
+        return entry[1]
+      self.misses += 1
+      if entry:
+        self.wasted_bytes += entry[2]
+    return None
+
+  def _schedule(self, paths):
+    queued = 0
+    for path in paths:
+      if queued >= self.max_candidates:
+        break
+      path = os.path.realpath(path)
+      with self._lock:
+        if self._closed or path in self._pending or path in self._store or path in self._read:
+          continue
+        self._pending.add(path)
+        self.scheduled += 1
+      queued += 1
+      self._executor.submit(self._fetch, path)
+
+  def _fetch(self, path):
+    try:
+      st = os.stat(path)
+      loaded = _load(path) if st.st_size <= self.max_file_bytes else None
+    except (OSError, UnicodeDecodeError):
+      loaded = None
+    with self._lock:
+      self._pending.discard(path)
+      if loaded is None or self._closed:
+        return
+      size = len(loaded[0])
+      self._store[path] = (_signature(st), loaded, size)
+      self._bytes += size
+      self.prefetched += 1
+      self.prefetched_bytes += size
+      while self._bytes > self.max_bytes:
+        _, (_, _, evicted_size) = self._store.popitem(last=False)
+        self._bytes -= evicted_size
+        self.wasted_bytes += evicted_size
+
+  def close(self):
+    with self._lock:
+      self._closed = True
+    self._executor.shutdown(wait=False, cancel_futures=True)
+
+  def stats(self):
+    with self._lock:
+      reads = self.hits + self.misses
+      return {
+        "scheduled": self.scheduled,
+        "prefetched": self.prefetched,
+        "prefetched_bytes": self.prefetched_bytes,
+        "hits": self.hits,
+        "misses": self.misses,
+        "hit_rate": self.hits / reads if reads else 0.0,
+        "hit_bytes": self.hit_bytes,
+        # Anything still in the store has not been used yet
+        "wasted_bytes": self.wasted_bytes + self._bytes,
+      }
+
+def _imported_files(working_directory, path, contents):
+  """Files in the workspace that the imports in contents could refer to."""
+  directory = os.path.dirname(path)
+  for match in _IMPORT.finditer(contents):
+    dots, module, names, plain = match.groups()
+    if plain is not None:
+      modules = [name.split()[0] for name in plain.split(",") if name.strip()]
+      bases = [directory, working_directory]
+      names = []
+    else:
+      modules = [module]
+      names = [name.split()[0] for name in names.split(",") if name.strip()]
+      if dots:
+        base = directory
+        for _ in range(len(dots) - 1):
+          base = os.path.dirname(base)
+        bases = [base]
+      else:
+        bases = [directory, working_directory]
+    for base in bases:
+      for module in modules:
+        module_dir = os.path.join(base, *module.split(".")) if module else base
+        candidates = [module_dir + ".py", os.path.join(module_dir, "__init__.py")] if module else []
+        candidates.extend(os.path.join(module_dir, name + ".py") for name in names)
+        for candidate in candidates:
+          full_path = resolve_in(working_directory, candidate)
+          if full_path and os.path.isfile(full_path):
+            yield full_path
@@ -0,0 +1,105 @@
+import json
+import atexit
+import threading
+from subprocess import Popen, PIPE
+
+from config import PYTHON_WORKER_POOL_SIZE, PYTHON_WORKER_PREIMPORTS, RESOURCE_LIMITS
+from functions.bounded_output import capture
+from functions.resource_limits import preexec_fn
+
+# Runs inside each worker: import the warm-up modules, then block until a job
+# arrives on stdin and run it as __main__, the same way `python file.py` would.
+_BOOTSTRAP = r"""
+import contextlib, importlib, io, json, os, runpy, sys, traceback
+with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+  for name in sys.argv[1:]:
+    try:
+      importlib.import_module(name)
+    except Exception:
+      pass
+job = json.loads(sys.stdin.readline())
+os.chdir(job["cwd"])
+sys.argv = [job["file"], *job["args"]]
+sys.path[0] = os.path.dirname(job["file"])
+try:
+  runpy.run_path(job["file"], run_name="__main__")
+except SystemExit:
+  raise
+except BaseException as e:
+  # Hide the bootstrap frames so tracebacks match a plain interpreter run
+  tb = e.__traceback__
+  while tb is not None and tb.tb_frame.f_code.co_filename != job["file"]:
+    tb = tb.tb_next
+  traceback.print_exception(type(e), e, tb or e.__traceback__)
+  sys.exit(1)
+"""
+
+class PythonWorkerPool:
+  """Keeps warm Python interpreters ready to run one file each.
+
+  Every worker has already paid interpreter startup and the configured
+  pre-imports. A worker runs exactly one file and is then discarded, so no
+  state leaks between runs; a replacement is started in the background.
+  """
+
+  def __init__(self, size=PYTHON_WORKER_POOL_SIZE, preimports=PYTHON_WORKER_PREIMPORTS, python="python", limits=RESOURCE_LIMITS):
+    self.size = size
+    self.preimports = list(preimports)
+    self.python = python
+    # Applied when a worker starts, so pre-imports count against them too
+    self.limits = limits
+    self._preexec_fn = preexec_fn(limits)
+    self._idle = []
+    self._lock = threading.Lock()
+    self._closed = False
+    for _ in range(size):
+      self._idle.append(self._spawn())
+
+  def _spawn(self):
+    return Popen([self.python, "-c", _BOOTSTRAP, *self.preimports], stdin=PIPE, stdout=PIPE, stderr=PIPE, preexec_fn=self._preexec_fn)
+
+  def _refill(self):
+    worker = self._spawn()
+    with self._lock:
+      if self._closed or len(self._idle) >= self.size:
+        worker.kill()
+        worker.wait()
+        return
+      self._idle.append(worker)
+
+  def _acquire(self):
+    with self._lock:
+      while self._idle:
+        worker = self._idle.pop(0)
+        if worker.poll() is None:
+          break
+        worker.wait()
+      else:
+        worker = None
+    threading.Thread(target=self._refill, daemon=True).start()
+    return worker or self._spawn()
+
+  def run(self, file_path, args, cwd, timeout, **limits):
+    """Run file_path like `python file_path *args` would; limits go to bounded_output.capture."""
+    worker = self._acquire()
+    job = json.dumps({"file": file_path, "args": list(args), "cwd": cwd})
+    return capture(worker, (job + "\n").encode(), timeout=timeout, **limits)
+
+  def close(self):
+    with self._lock:
+      self._closed = True
+      idle, self._idle = self._idle, []
+    for worker in idle:
+      worker.kill()
+      worker.wait()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+  global _pool
+  with _pool_lock:
+    if _pool is None:
+      _pool = PythonWorkerPool()
+      atexit.register(_pool.close)
+    return _pool
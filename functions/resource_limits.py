@@ -0,0 +1,70 @@
+import signal
+
+try:
+  import resource
+except ImportError:
+  # Not available on Windows; scripts run without resource limits there
+  resource = None
+
+from config import RESOURCE_LIMITS
+
+# RESOURCE_LIMITS key -> (rlimit name, description used when the limit is hit)
+_RLIMITS = {
+  "cpu_seconds": ("RLIMIT_CPU", "CPU time limit of {} seconds"),
+  "memory_bytes": ("RLIMIT_AS", "memory (address space) limit of {} bytes"),
+  "open_files": ("RLIMIT_NOFILE", "open files limit of {}"),
+  "processes": ("RLIMIT_NPROC", "process count limit of {}"),
+  "file_size_bytes": ("RLIMIT_FSIZE", "output file size limit of {} bytes"),
+}
+
+def preexec_fn(limits=RESOURCE_LIMITS):
+  """Return a Popen preexec_fn applying limits with setrlimit, or None if there are none.
+
+  Every value is resolved here in the parent: between fork and exec the
+  child must not import or allocate, since another thread may hold a lock
+  it would need.
+  """
+  if resource is None or not limits or not any(limits.values()):
+    return None
+
+  settings = []
+  for name, value in limits.items():
+    if not value:
+      continue
+    which = getattr(resource, _RLIMITS[name][0])
+    _, hard = resource.getrlimit(which)
+    if hard != resource.RLIM_INFINITY:
+      value = min(value, hard)
+    # The CPU soft limit sends SIGXCPU; the hard limit one second later is a SIGKILL
+    # for scripts that catch it
+    ceiling = value + 1 if name == "cpu_seconds" and (hard == resource.RLIM_INFINITY or value < hard) else value
+    settings.append((which, (value, ceiling)))
+
+  def apply():
+    for which, limit in settings:
+      resource.setrlimit(which, limit)
+  return apply
+
+def limit_hit(returncode, stderr, limits=RESOURCE_LIMITS):
+  """Describe the resource limit a finished script most likely ran into, or None.
+
+  Signals identify the CPU limit; the others surface as Python exceptions,
+  so they are recognized from the script's stderr.
+  """
+  if resource is None or not limits:
+    return None
+  causes = []
+  if returncode in (-signal.SIGXCPU, -signal.SIGKILL):
+    causes.append("cpu_seconds")
+  if "MemoryError" in stderr or "Cannot allocate memory" in stderr:
+    causes.append("memory_bytes")
+  if "Too many open files" in stderr:
+    causes.append("open_files")
+  if "BlockingIOError" in stderr or "Resource temporarily unavailable" in stderr:
+    causes.append("processes")
+  if "File too large" in stderr or returncode == -signal.SIGXFSZ:
+    causes.append("file_size_bytes")
+  for name in causes:
+    if limits.get(name):
+      return _RLIMITS[name][1].format(limits[name])
+  return None
@@ -0,0 +1,41 @@
+# Tool results are resent with every later turn, so the compact format trades
+# the self-describing text for fewer characters: tables without repeated field
+# names, paths grouped under their directory, and rounded sizes
+RESULT_FORMATS = ("text", "compact")
+
+def check_format(result_format):
+  if result_format not in RESULT_FORMATS:
+    raise ValueError(f"Unknown result format '{result_format}', expected one of {', '.join(RESULT_FORMATS)}")
+  return result_format
+
+def human_size(size):
+  """Round a byte count to two significant figures: 812, 4.1K, 37K, 1.2M."""
+  for unit in ("", "K", "M", "G"):
+    if size < 1000 or unit == "G":
+      break
+    size /= 1024
+  if not unit:
+    return str(size)
+  return f"{size:.1f}{unit}" if size < 10 else f"{size:.0f}{unit}"
+
+def tree_lines(entries):
+  """Render (relative path, size, is_dir) entries as an indented tree.
+
+  Each line holds only a name, so a directory's path is written once rather
+  than on every entry below it. Directories end in "/" and have no size;
+  parents missing from entries (e.g. filtered out) are still shown.
+  """
+  lines = []
+  shown = []
+  for relative_path, size, is_dir in sorted(entries, key=lambda entry: entry[0].split("/")):
+    parts = relative_path.split("/")
+    parents = parts[:-1]
+    common = 0
+    while common < min(len(shown), len(parents)) and shown[common] == parents[common]:
+      common += 1
+    for depth in range(common, len(parents)):
+      lines.append(f"{' ' * depth}{parents[depth]}/")
+    indent = " " * len(parents)
+    lines.append(f"{indent}{parts[-1]}/" if is_dir else f"{indent}{parts[-1]} {human_size(size)}")
+    shown = parts if is_dir else parents
+  return lines
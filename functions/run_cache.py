@@ -0,0 +1,130 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import RUN_CACHE_SIZE, RUN_CACHE_TREES, WORKSPACE_EXCLUDE
+
+class FileHasher:
+  """Content hashes of files, recomputed only when a file's (mtime_ns, size, inode) changes.
+
+  Hashes are kept per tree, for the max_trees most recently hashed trees,
+  and each walk keeps only the files it found, so deleted files and trees
+  don't accumulate.
+  """
+
+  def __init__(self, max_trees=RUN_CACHE_TREES):
+    self.max_trees = max_trees
+    self._trees = OrderedDict()
+    self._lock = threading.Lock()
+
+  def _digest(self, known, path, st):
+    signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+    cached = known.get(path)
+    if cached and cached[0] == signature:
+      return cached
+    with open(path, "rb") as f:
+      return signature, hashlib.file_digest(f, "blake2b").digest()
+
+  def tree_digest(self, root):
+    """One hash over the relative path and contents of every file under root."""
+    root = os.path.realpath(root)
+    with self._lock:
+      known = self._trees.get(root, {})
+    hashes = {}
+    entries = []
+    pending = [root]
+    while pending:
+      directory = pending.pop()
+      try:
+        with os.scandir(directory) as iterator:
+          children = list(iterator)
+      except OSError:
+        continue
+      for entry in children:
+        if entry.is_dir(follow_symlinks=False):
+          if entry.name not in WORKSPACE_EXCLUDE:
+            pending.append(entry.path)
+          continue
+        try:
+          if entry.is_symlink():
+            digest = os.readlink(entry.path).encode()
+          else:
+            hashes[entry.path] = self._digest(known, entry.path, entry.stat(follow_symlinks=False))
+            digest = hashes[entry.path][1]
+        except OSError:
+          continue
+        entries.append((os.path.relpath(entry.path, root), digest))
+
+    with self._lock:
+      self._trees[root] = hashes
+      self._trees.move_to_end(root)
+      while len(self._trees) > self.max_trees:
+        self._trees.popitem(last=False)
+
+    tree = hashlib.blake2b()
+    for relative_path, digest in sorted(entries):
+      tree.update(relative_path.encode() + b"\0" + digest)
+    return tree.hexdigest()
+
+  def forget(self, root):
+    with self._lock:
+      self._trees.pop(os.path.realpath(root), None)
+
+class RunCache:
+  """LRU of run_python_file results keyed by script, arguments, interpreter and workspace hash.
+
+  An entry is only stored for runs that exited with status 0 and left the
+  workspace as they found it, so replaying one never skips a side effect
+  the caller relies on, and a failure is always reproduced by a real run.
+  """
+
+  def __init__(self, max_entries=RUN_CACHE_SIZE):
+    self.max_entries = max_entries
+    self.hasher = FileHasher()
+    self.hits = 0
+    self.misses = 0
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      if key in self._entries:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._entries[key]
+      self.misses += 1
+      return None
+
+  def put(self, key, result):
+    with self._lock:
+      self._entries[key] = result
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def forget(self, root):
+    """Drop the hashes and results of every script under root, e.g. a removed workspace."""
+    root = os.path.realpath(root)
+    self.hasher.forget(root)
+    with self._lock:
+      for key in [key for key in self._entries if key[0].startswith(root + os.sep)]:
+        del self._entries[key]
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+  def stats(self):
+    with self._lock:
+      return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+_run_cache = None
+_run_cache_lock = threading.Lock()
+
+def get_run_cache():
+  global _run_cache
+  with _run_cache_lock:
+    if _run_cache is None:
+      _run_cache = RunCache()
+    return _run_cache
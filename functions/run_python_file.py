@@ -1,35 +1,51 @@
 import os
-from subprocess import run
-from google.genai import types
-
-schema_run_python_file = types.FunctionDeclaration(
-  name="run_python_file",
-  description="Runs a specified Python file with optional arguments, constrained to the working directory.",
-  parameters=types.Schema(
-    type=types.Type.OBJECT,
-    properties={
-      "file_path": types.Schema(
-        type=types.Type.STRING,
-        description="The file path to run, relative to the working directory.",
-      ),
-      "args": types.Schema(
-        type=types.Type.ARRAY,
-        items=types.Schema(type=types.Type.STRING),
-        description="Optional arguments to pass to the Python file.",
-      ),
+import shutil
+from subprocess import Popen, PIPE, DEVNULL
+from config import PYTHON_WORKER_POOL, RUN_OUTPUT_MAX_BYTES, RUN_OUTPUT_HARD_LIMIT, RESOURCE_LIMITS, RUN_CACHE
+from functions.bounded_output import capture
+from functions.file_cache import current_cache
+from functions.python_workers import get_pool
+from functions.resource_limits import limit_hit, preexec_fn
+from functions.paths import resolve_in
+from functions.run_cache import get_run_cache
+from functions.search_index import notify_changed
+
+CACHED_MARKER = "[Cached result of an identical earlier run; pass bypass_cache=true to run it again]"
+COMPACT_CACHED_MARKER = "[cached; bypass_cache=true reruns]"
+
+schema_run_python_file = {
+  "name": "run_python_file",
+  "description": "Runs a specified Python file with optional arguments, constrained to the working directory.",
+  "parameters": {
+    "type": "OBJECT",
+    "properties": {
+      "file_path": {
+        "type": "STRING",
+        "description": "The file path to run, relative to the working directory.",
+      },
+      "args": {
+        "type": "ARRAY",
+        "description": "Optional arguments to pass to the Python file.",
+        "items": {"type": "STRING"},
+      },
+      "bypass_cache": {
+        "type": "BOOLEAN",
+        "description": "Run the file even if an identical earlier run's result is cached.",
+      },
     },
-  ),
-)
+    "required": ["file_path"],
+  },
+}
 
-def run_python_file(working_directory, file_path, args=None):
+def run_python_file(working_directory, file_path, args=None, use_worker_pool=PYTHON_WORKER_POOL, timeout=30, max_output_bytes=RUN_OUTPUT_MAX_BYTES, hard_limit=RUN_OUTPUT_HARD_LIMIT, limits=RESOURCE_LIMITS, memoize=RUN_CACHE, bypass_cache=False, result_format="text"):
   # sourcery skip: extract-method
   if args is None:
     args = []
   
-  working_directory_abs = os.path.abspath(working_directory)
-  full_file_path = os.path.abspath(os.path.join(working_directory_abs, file_path))
+  working_directory_abs = os.path.realpath(working_directory)
+  full_file_path = resolve_in(working_directory_abs, file_path)
   
-  if os.path.commonpath([full_file_path, working_directory_abs]) != working_directory_abs:
+  if full_file_path is None:
     return f'Error: Cannot execute "{file_path}" as it is outside the permitted working directory'
   
   if not os.path.exists(full_file_path):
@@ -38,21 +54,80 @@ def run_python_file(working_directory, file_path, args=None):
   if not file_path.endswith(".py"):
     return f'Error: "{file_path}" is not a Python file.'
   
+  if use_worker_pool:
+    # Pool workers were started under the pool's own limits
+    limits = get_pool().limits
+  if not memoize:
+    return _run(full_file_path, args, working_directory_abs, use_worker_pool, timeout, max_output_bytes, hard_limit, limits, result_format)[0]
+  
+  # Same script, arguments, interpreter, workspace contents and limits: same result
+  run_cache = get_run_cache()
+  python = get_pool().python if use_worker_pool else "python"
+  digest = run_cache.hasher.tree_digest(working_directory_abs)
+  key = (
+    full_file_path, tuple(args), shutil.which(python) or python, digest,
+    timeout, max_output_bytes, hard_limit, tuple(sorted((limits or {}).items())), result_format,
+  )
+  if not bypass_cache and (cached := run_cache.get(key)) is not None:
+    return f"{COMPACT_CACHED_MARKER if result_format == 'compact' else CACHED_MARKER}\n{cached}"
+  
+  output, succeeded = _run(full_file_path, args, working_directory_abs, use_worker_pool, timeout, max_output_bytes, hard_limit, limits, result_format)
+  # Failures are always rerun, and runs that changed the workspace aren't
+  # replayable: a hit would skip their side effects
+  if succeeded and run_cache.hasher.tree_digest(working_directory_abs) == digest:
+    run_cache.put(key, output)
+  return output
+
+def _run(full_file_path, args, working_directory_abs, use_worker_pool, timeout, max_output_bytes, hard_limit, limits, result_format):
+  """Run the script and return (output, whether it exited with status 0)."""
   try:
-    result = run(args=["python", full_file_path, *args], text=True, timeout=30, capture_output=True, cwd=working_directory)
+    # Output is read incrementally and bounded, so a chatty script can't
+    # exhaust memory or flood the model's context
+    if use_worker_pool:
+      result = get_pool().run(full_file_path, args, working_directory_abs, timeout=timeout, max_bytes=max_output_bytes, hard_limit=hard_limit)
+    else:
+      process = Popen(["python", full_file_path, *args], stdin=DEVNULL, stdout=PIPE, stderr=PIPE, cwd=working_directory_abs, preexec_fn=preexec_fn(limits))
+      result = capture(process, timeout=timeout, max_bytes=max_output_bytes, hard_limit=hard_limit)
     
+    succeeded = result.returncode == 0 and not result.killed
+    if result_format == "compact":
+      return _compact(result, max_output_bytes, hard_limit, limits), succeeded
+
     output = []
     if result.stdout:
         output.append(f"STDOUT:\n{result.stdout}")
     if result.stderr:
         output.append(f"STDERR:\n{result.stderr}")
 
-    if result.returncode != 0:
+    if result.killed:
+        output.append(f"Process killed after {result.elapsed:.2f}s for writing more than {hard_limit} bytes of output")
+    elif result.returncode != 0:
         output.append(f"Process exited with code {result.returncode}")
+        if hit := limit_hit(result.returncode, result.stderr, limits):
+            output.append(f"Resource limit hit: {hit}")
+    if result.truncated and not result.killed:
+        output.append(f"[Output truncated to {max_output_bytes} bytes per stream, {result.output_bytes} bytes written in {result.elapsed:.2f}s]")
 
-    return "\n".join(output) if output else "No output produced."
+    return "\n".join(output) if output else "No output produced.", succeeded
     
   except Exception as e:
-    return f"Error: executing Python file: {e}"
-  
-  
\ No newline at end of file
+    return f"Error: executing Python file: {e}", False
+  finally:
+    # The script may have changed any file in the working directory
+    if cache := current_cache():
+      cache.clear()
+    notify_changed(working_directory_abs)
+
+def _compact(result, max_output_bytes, hard_limit, limits):
+  # stdout goes first without a header; everything else is a bracketed note
+  output = [result.stdout.rstrip("\n")] if result.stdout else []
+  if stderr := result.stderr.rstrip("\n"):
+    output.append(f"[stderr]\n{stderr}")
+  if result.killed:
+    output.append(f"[killed after {result.elapsed:.2f}s: over {hard_limit} bytes of output]")
+  elif result.returncode != 0:
+    hit = limit_hit(result.returncode, result.stderr, limits)
+    output.append(f"[exit {result.returncode}{f', {hit}' if hit else ''}]")
+  if result.truncated and not result.killed:
+    output.append(f"[truncated to {max_output_bytes} bytes/stream of {result.output_bytes}]")
+  return "\n".join(output) if output else "(no output)"
@@ -0,0 +1,119 @@
+import os
+import re
+from fnmatch import fnmatch
+from config import SEARCH_MAX_FILE_BYTES, SEARCH_MAX_RESULTS
+from functions.paths import resolve_in
+from functions.search_index import get_index, required_literals
+
+schema_search_files = {
+  "name": "search_files",
+  "description": "Searches the contents of files in the working directory for a literal string or regular expression and returns matching lines with surrounding context.",
+  "parameters": {
+    "type": "OBJECT",
+    "properties": {
+      "pattern": {
+        "type": "STRING",
+        "description": "The text or regular expression to search for.",
+      },
+      "regex": {
+        "type": "BOOLEAN",
+        "description": "Treat pattern as a Python regular expression instead of a literal string.",
+      },
+      "case_sensitive": {
+        "type": "BOOLEAN",
+        "description": "Match case exactly. Searches are case-insensitive by default.",
+      },
+      "include": {
+        "type": "ARRAY",
+        "description": "Only search files matching one of these glob patterns, e.g. ['*.py'].",
+        "items": {"type": "STRING"},
+      },
+      "context_lines": {
+        "type": "INTEGER",
+        "description": "Number of lines of context to show around each match. Defaults to 2.",
+      },
+    },
+    "required": ["pattern"],
+  },
+}
+
+def search_files(working_directory, pattern, regex=False, case_sensitive=False, include=None, context_lines=2, max_results=SEARCH_MAX_RESULTS):
+  if not pattern:
+    return "Error: Search pattern must not be empty"
+
+  flags = 0 if case_sensitive else re.IGNORECASE
+  try:
+    compiled = re.compile(pattern if regex else re.escape(pattern), flags)
+  except re.error as e:
+    return f"Error: Invalid regular expression '{pattern}': {e}"
+
+  index = get_index(working_directory)
+  index.refresh()
+  candidates = index.candidates(required_literals(pattern) if regex else [pattern])
+  oversized = [relative_path for relative_path in index.oversized() if _included(relative_path, include)]
+  index.save()
+
+  context_lines = max(0, int(context_lines or 0))
+  blocks = []
+  matches = 0
+  files_matched = 0
+  truncated = False
+
+  for relative_path in candidates:
+    if not _included(relative_path, include):
+      continue
+    # The file may have been replaced by a link leading out since the index was refreshed
+    full_path = resolve_in(index.root, relative_path)
+    if full_path is None:
+      continue
+    try:
+      with open(full_path, "r", errors="replace") as f:
+        lines = f.read().splitlines()
+    except OSError:
+      continue
+
+    hits = [number for number, line in enumerate(lines) if compiled.search(line)]
+    if not hits:
+      continue
+    files_matched += 1
+    if matches + len(hits) > max_results:
+      hits = hits[:max_results - matches]
+      truncated = True
+    matches += len(hits)
+    blocks.append(_format_hits(relative_path, lines, hits, context_lines))
+    if truncated:
+      break
+
+  if not matches:
+    result = f"No matches found for '{pattern}'"
+  else:
+    header = f"Found {matches} matching lines in {files_matched} files for '{pattern}':"
+    result = "\n--\n".join([header, *blocks])
+  if truncated:
+    result += f"\n[... stopped after {max_results} matches, narrow the pattern or use include to see more]"
+  if oversized:
+    shown = ", ".join(oversized[:5]) + (", ..." if len(oversized) > 5 else "")
+    result += f"\n[Skipped {len(oversized)} files over {SEARCH_MAX_FILE_BYTES} bytes, read them with get_file_content: {shown}]"
+  return result
+
+def _included(relative_path, include):
+  return not include or any(fnmatch(relative_path, glob) or fnmatch(os.path.basename(relative_path), glob) for glob in include)
+
+def _format_hits(relative_path, lines, hits, context_lines):
+  """Render hits grep-style: path:line: for matches and path-line- for context."""
+  hit_set = set(hits)
+  shown = []
+  for number in hits:
+    for line_number in range(max(0, number - context_lines), min(len(lines), number + context_lines + 1)):
+      if not shown or line_number > shown[-1]:
+        shown.append(line_number)
+
+  output = []
+  previous = None
+  for line_number in shown:
+    if previous is not None and line_number != previous + 1:
+      output.append("--")
+    separator = ":" if line_number in hit_set else "-"
+    output.append(f"{relative_path}{separator}{line_number + 1}{separator} {lines[line_number]}")
+    previous = line_number
+  return "\n".join(output)
@@ -0,0 +1,285 @@
+import os
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import SEARCH_INDEX_DIR, SEARCH_MAX_FILE_BYTES, SEARCH_INDEX_CACHE_SIZE, SEARCH_REFRESH_SECONDS
+from functions.gitignore import GitIgnore
+from functions.paths import resolve_in
+
+_INDEX_VERSION = 2
+
+def trigrams(text):
+  text = text.lower()
+  return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class TrigramIndex:
+  """Persistent trigram index over the text files below a root directory.
+
+  Each file is indexed by the set of lowercased 3-character substrings it
+  contains. A search only has to open files containing every trigram of the
+  literals the pattern requires, plus text files too short to have any.
+  Files over SEARCH_MAX_FILE_BYTES are not indexed and are reported by
+  oversized() instead of being searched. Files are re-indexed when their
+  (mtime_ns, size) changes, so refreshing a mostly unchanged tree costs one
+  stat per file. Tools that modify files update the index directly, so a
+  walk younger than SEARCH_REFRESH_SECONDS is reused unless something that
+  may have touched any file (a script run) marked the index stale.
+  """
+
+  def __init__(self, root, index_dir=SEARCH_INDEX_DIR):
+    self.root = os.path.realpath(root)
+    self.index_path = self.path_for(self.root, index_dir)
+    self.files = {}
+    self.postings = {}
+    self.lock = threading.Lock()
+    self._dirty = False
+    self._refreshed = None
+    self._load()
+
+  @staticmethod
+  def path_for(root, index_dir):
+    if not index_dir:
+      return None
+    digest = hashlib.sha1(root.encode()).hexdigest()[:16]
+    return os.path.join(index_dir, f"{digest}.pickle")
+
+  def _load(self):
+    if not self.index_path or not os.path.exists(self.index_path):
+      return
+    try:
+      with open(self.index_path, "rb") as f:
+        version, root, files, postings = pickle.load(f)
+    except Exception:
+      # A truncated or corrupt index is rebuilt like a missing one
+      return
+    if version == _INDEX_VERSION and root == self.root:
+      self.files, self.postings = files, postings
+
+  def save(self):
+    """Persist the index if it changed; best effort, an unwritable cache only costs the next load."""
+    with self.lock:
+      if not self.index_path or not self._dirty:
+        return
+      temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+      try:
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        with open(temp_path, "wb") as f:
+          pickle.dump((_INDEX_VERSION, self.root, self.files, self.postings), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.index_path)
+      except OSError:
+        try:
+          os.remove(temp_path)
+        except OSError:
+          pass
+        return
+      self._dirty = False
+
+  def _walk(self):
+    ignore = GitIgnore(self.root)
+    pending = [self.root]
+    while pending:
+      directory = pending.pop()
+      try:
+        with os.scandir(directory) as iterator:
+          children = list(iterator)
+      except OSError:
+        continue
+      for entry in children:
+        try:
+          # Symlinked directories are not descended into: they can point
+          # outside the root or back up the tree
+          is_dir = entry.is_dir(follow_symlinks=False)
+          if ignore.ignored(entry.path, is_dir) or entry.name == "__pycache__":
+            continue
+          if is_dir:
+            pending.append(entry.path)
+          elif entry.is_file() and (not entry.is_symlink() or resolve_in(self.root, entry.path)):
+            st = entry.stat()
+            yield os.path.relpath(entry.path, self.root), st
+        except OSError:
+          continue
+
+  def refresh(self, max_age=SEARCH_REFRESH_SECONDS):
+    """Bring the index up to date with the tree, re-indexing only changed files."""
+    with self.lock:
+      if self._refreshed is not None and time.monotonic() - self._refreshed < max_age:
+        return
+      seen = set()
+      for relative_path, st in self._walk():
+        seen.add(relative_path)
+        entry = self.files.get(relative_path)
+        if entry is None or entry[:2] != (st.st_mtime_ns, st.st_size):
+          self._index_file(relative_path, st)
+      for relative_path in set(self.files) - seen:
+        self._remove(relative_path)
+      self._refreshed = time.monotonic()
+
+  def mark_stale(self):
+    with self.lock:
+      self._refreshed = None
+
+  def update(self, path):
+    """Re-index a single file, e.g. right after a tool wrote it."""
+    relative_path = os.path.relpath(os.path.realpath(path), self.root)
+    with self.lock:
+      try:
+        self._index_file(relative_path, os.stat(os.path.join(self.root, relative_path)))
+      except OSError:
+        self._remove(relative_path)
+
+  def _index_file(self, relative_path, st):
+    self._remove(relative_path)
+    grams = frozenset()
+    kind = "large" if st.st_size > SEARCH_MAX_FILE_BYTES else "text"
+    if kind == "text":
+      try:
+        with open(os.path.join(self.root, relative_path), "rb") as f:
+          data = f.read()
+        # Binary files are recorded with no trigrams and never searched
+        if b"\0" in data[:8192]:
+          kind = "binary"
+        else:
+          grams = frozenset(trigrams(data.decode("utf-8", errors="replace")))
+      except OSError:
+        pass
+    self.files[relative_path] = (st.st_mtime_ns, st.st_size, grams, kind)
+    for gram in grams:
+      self.postings.setdefault(gram, set()).add(relative_path)
+    self._dirty = True
+
+  def _remove(self, relative_path):
+    entry = self.files.pop(relative_path, None)
+    if entry is None:
+      return
+    for gram in entry[2]:
+      if paths := self.postings.get(gram):
+        paths.discard(relative_path)
+        if not paths:
+          del self.postings[gram]
+    self._dirty = True
+
+  def candidates(self, literals):
+    """Paths that may contain every literal; literals shorter than 3 characters don't narrow the result.
+
+    Text files with no trigrams at all are always included, since a short
+    pattern can still match them.
+    """
+    with self.lock:
+      result = None
+      for literal in literals:
+        for gram in trigrams(literal):
+          paths = self.postings.get(gram, set())
+          result = set(paths) if result is None else result & paths
+          if not result:
+            break
+      if result is None:
+        result = {path for path, entry in self.files.items() if entry[3] == "text"}
+      else:
+        result |= {path for path, entry in self.files.items() if entry[3] == "text" and not entry[2]}
+      return sorted(result)
+
+  def oversized(self):
+    """Paths of files too large to index, which searches skip."""
+    with self.lock:
+      return sorted(path for path, entry in self.files.items() if entry[3] == "large")
+
+# Most recently used indexes, kept in memory; older ones are saved and dropped
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def get_index(root):
+  root = os.path.realpath(root)
+  with _indexes_lock:
+    if root in _indexes:
+      _indexes.move_to_end(root)
+      return _indexes[root]
+    index = _indexes[root] = TrigramIndex(root, index_dir=SEARCH_INDEX_DIR)
+    evicted = _indexes.popitem(last=False)[1] if len(_indexes) > SEARCH_INDEX_CACHE_SIZE else None
+  if evicted is not None:
+    evicted.save()
+  return index
+
+def notify_changed(working_directory, path=None):
+  """Keep an already loaded index in sync after a tool modified path, or any file if path is None."""
+  with _indexes_lock:
+    index = _indexes.get(os.path.realpath(working_directory))
+  if index is None:
+    return
+  if path is None:
+    index.mark_stale()
+  else:
+    index.update(path)
+
+def drop_index(root):
+  """Forget the index of a directory that is going away, in memory and on disk."""
+  root = os.path.realpath(root)
+  with _indexes_lock:
+    index = _indexes.pop(root, None)
+  index_path = index.index_path if index else TrigramIndex.path_for(root, SEARCH_INDEX_DIR)
+  if index_path:
+    try:
+      os.remove(index_path)
+    except FileNotFoundError:
+      pass
+
+def required_literals(pattern):
+  """Conservatively extract substrings every match of regex pattern must contain.
+
+  Only literal runs outside groups, character classes and alternations are
+  used; anything that could make a run optional ends it early.
+  """
+  literals = []
+  current = ""
+  depth = 0
+  i = 0
+  while i < len(pattern):
+    char = pattern[i]
+    if char == "\\" and i + 1 < len(pattern):
+      escaped = pattern[i + 1]
+      i += 2
+      if depth == 0 and not escaped.isalnum():
+        current += escaped
+        continue
+      literals.append(current)
+      current = ""
+      continue
+    if char == "[":
+      # Skip the character class, allowing a literal ] right after [ or [^
+      end = i + 1
+      if end < len(pattern) and pattern[end] == "^":
+        end += 1
+      if end < len(pattern) and pattern[end] == "]":
+        end += 1
+      while end < len(pattern) and pattern[end] != "]":
+        end += 2 if pattern[end] == "\\" else 1
+      i = end + 1
+      literals.append(current)
+      current = ""
+      continue
+    if char == "(":
+      depth += 1
+    elif char == ")":
+      depth -= 1
+    elif char == "|" and depth == 0:
+      return []
+    elif char in "*?{" and depth == 0:
+      # The previous character is optional (or repeated an unknown number of times)
+      current = current[:-1]
+      if char == "{":
+        i = pattern.find("}", i)
+        if i == -1:
+          break
+    elif char in ".^$+" or depth:
+      pass
+    else:
+      current += char
+      i += 1
+      continue
+    literals.append(current)
+    current = ""
+    i += 1
+  literals.append(current)
+  return [literal for literal in literals if len(literal) >= 3]
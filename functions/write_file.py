@@ -1,29 +1,33 @@
 import os
-from google.genai import types
+from functions.atomic_write import atomic_write
+from functions.file_cache import current_cache
+from functions.search_index import notify_changed
+from functions.paths import resolve_in
 
-schema_write_file = types.FunctionDeclaration(
-  name="write_file",
-  description="Writes content to a specified file, constrained to the working directory.",
-  parameters=types.Schema(
-    type=types.Type.OBJECT,
-    properties={
-      "file_path": types.Schema(
-        type=types.Type.STRING,
-        description="The file path to write to, relative to the working directory.",
-      ),
-      "content": types.Schema(
-        type=types.Type.STRING,
-        description="The content to write to the file.",
-      ),
+schema_write_file = {
+  "name": "write_file",
+  "description": "Writes content to a specified file, constrained to the working directory.",
+  "parameters": {
+    "type": "OBJECT",
+    "properties": {
+      "file_path": {
+        "type": "STRING",
+        "description": "The file path to write to, relative to the working directory.",
+      },
+      "content": {
+        "type": "STRING",
+        "description": "The content to write to the file.",
+      },
     },
-  ),
-)
+    "required": ["file_path", "content"],
+  },
+}
 
-def write_file(working_directory, file_path, content):
-  working_directory_abs = os.path.abspath(working_directory)
-  full_file_path = os.path.abspath(os.path.join(working_directory_abs, file_path))
+def write_file(working_directory, file_path, content, result_format="text"):
+  working_directory_abs = os.path.realpath(working_directory)
+  full_file_path = resolve_in(working_directory_abs, file_path)
 
-  if not full_file_path.startswith(working_directory_abs):
+  if full_file_path is None:
     return f"Error: Cannot write to '{file_path}' as it is outside the permitted working directory"
 
   parent_dir = os.path.dirname(full_file_path) or working_directory_abs
@@ -33,9 +37,14 @@ def write_file(working_directory, file_path, content):
     return f"Error: Cannot create directories at path '{parent_dir}': {e}"
 
   try:
-    with open(full_file_path, "w") as f:
-      f.write(content)
+    atomic_write(full_file_path, content)
   except Exception as e:
     return f"Error: Cannot write content to '{full_file_path}': {e}"
+  finally:
+    if cache := current_cache():
+      cache.invalidate(full_file_path)
+    notify_changed(working_directory_abs, full_file_path)
 
+  if result_format == "compact":
+    return f"wrote {file_path} ({len(content)} chars)"
   return f"Successfully wrote to '{full_file_path}' ({len(content)} characters written)"
\ No newline at end of file
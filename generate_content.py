@@ -1,14 +1,204 @@
-from call_function import call_function
+import time
+import asyncio
+
+from call_function import ToolDispatcher, call_functions
+from compaction import compact_messages
+from config import MAX_CONCURRENT_TOOLS, COMPACTION_TOKEN_BUDGET
 from google.genai import types
 from prompts import system_prompt
+from rate_limit import is_retryable
+from routing import default_router
+import tracing
 
-def generate_content(client, messages, available_functions, verbose=False):
-  response = client.models.generate_content(
-    model="gemini-2.5-flash", 
-    contents=messages, 
-    config=types.GenerateContentConfig(tools=[available_functions], system_instruction=system_prompt),
-  )
+def _generate_content_config(available_functions):
+  return types.GenerateContentConfig(tools=[available_functions], system_instruction=system_prompt)
+
+def generate_content(client, messages, available_functions, verbose=False, max_workers=MAX_CONCURRENT_TOOLS, token_budget=COMPACTION_TOKEN_BUDGET, stream=False, router=None):
+  _compact(messages, token_budget, verbose)
+  router = router or default_router()
+  model, route = _route(router, messages, verbose)
+
+  if stream:
+    return _generate_content_stream(client, messages, available_functions, verbose, max_workers, router, model, route)
+
+  # A failed or malformed call is retried on the next stronger model, if any
+  while True:
+    with tracing.span("model_call", model=model, route=route, stream=False) as attrs:
+      started = time.perf_counter()
+      try:
+        response = client.models.generate_content(
+          model=model, 
+          contents=messages, 
+          config=_generate_content_config(available_functions),
+        )
+        _check_response(response)
+      except Exception as e:
+        model, route = _escalate(router, model, e, time.perf_counter() - started, attrs, verbose)
+        continue
+      router.record(model, time.perf_counter() - started, response)
+      _trace_response(attrs, response, messages)
+    break
   
+  if (final_text := _handle_response(response, messages, verbose)) is not None:
+    return final_text
+
+  # Handle function calls
+  if response.function_calls:
+    # Calls run concurrently, but results come back in the original call order
+    results = call_functions(response.function_calls, verbose=verbose, max_workers=max_workers)
+    _append_function_responses(messages, results, verbose)
+  
+  # Not finished yet, return None to continue the loop
+  return None
+
+async def generate_content_async(client, messages, available_functions, verbose=False, max_workers=MAX_CONCURRENT_TOOLS, token_budget=COMPACTION_TOKEN_BUDGET, router=None):
+  _compact(messages, token_budget, verbose)
+  router = router or default_router()
+  model, route = _route(router, messages, verbose)
+
+  while True:
+    with tracing.span("model_call", model=model, route=route, stream=False) as attrs:
+      started = time.perf_counter()
+      try:
+        response = await client.aio.models.generate_content(
+          model=model,
+          contents=messages,
+          config=_generate_content_config(available_functions),
+        )
+        _check_response(response)
+      except Exception as e:
+        model, route = _escalate(router, model, e, time.perf_counter() - started, attrs, verbose)
+        continue
+      router.record(model, time.perf_counter() - started, response)
+      _trace_response(attrs, response, messages)
+    break
+
+  if (final_text := _handle_response(response, messages, verbose)) is not None:
+    return final_text
+
+  if response.function_calls:
+    # Tools are blocking, so run them off the event loop
+    results = await asyncio.to_thread(call_functions, response.function_calls, verbose=verbose, max_workers=max_workers)
+    _append_function_responses(messages, results, verbose)
+
+  return None
+
+def _generate_content_stream(client, messages, available_functions, verbose, max_workers, router, model, route):
+  """Stream one turn. Failures are not escalated: output was already printed and tools started."""
+  started = time.perf_counter()
+  time_to_first_token = None
+  usage_metadata = None
+  parts = []
+
+  with tracing.span("model_call", model=model, route=route, stream=True) as attrs, ToolDispatcher(max_workers=max_workers, verbose=verbose) as dispatcher:
+    try:
+      for chunk in client.models.generate_content_stream(
+        model=model,
+        contents=messages,
+        config=_generate_content_config(available_functions),
+      ):
+        if time_to_first_token is None:
+          time_to_first_token = time.perf_counter() - started
+        if chunk.usage_metadata:
+          usage_metadata = chunk.usage_metadata
+        if not chunk.candidates or not chunk.candidates[0].content:
+          continue
+
+        for part in chunk.candidates[0].content.parts or []:
+          if part.function_call:
+            # Function calls arrive whole in a single chunk, so dispatch right away
+            dispatcher.submit(part.function_call)
+            parts.append(part)
+          elif _is_plain_text(part):
+            print(part.text, end="", flush=True)
+            if parts and _is_plain_text(parts[-1]):
+              parts[-1] = types.Part(text=parts[-1].text + part.text)
+            else:
+              parts.append(part)
+          else:
+            parts.append(part)
+    except Exception as e:
+      router.record(model, time.perf_counter() - started, error=e)
+      raise
+
+    results = dispatcher.results()
+
+    # Rebuild the response the non-streaming call would have returned, so both
+    # paths leave exactly the same history behind
+    response = types.GenerateContentResponse(
+      candidates=[types.Candidate(content=types.Content(role="model", parts=parts))],
+      usage_metadata=usage_metadata,
+    )
+    router.record(model, time.perf_counter() - started, response)
+    attrs["time_to_first_token_s"] = time_to_first_token
+    _trace_response(attrs, response, messages)
+
+  print()
+  if verbose and time_to_first_token is not None:
+    print(f"Time to first token: {time_to_first_token:.3f}s")
+
+  if (final_text := _handle_response(response, messages, verbose)) is not None:
+    return final_text
+
+  if results:
+    _append_function_responses(messages, results, verbose)
+
+  return None
+
+def _route(router, messages, verbose):
+  model, route = router.choose(messages)
+  if verbose:
+    print(f"Model: {model} ({route})")
+  return model, route
+
+class MalformedResponseError(RuntimeError):
+  pass
+
+def _escalate(router, model, error, elapsed, attrs, verbose):
+  """Record a failed call and return (model, route) to retry on.
+
+  Only malformed responses and transient errors the client has already
+  retried are escalated; anything else (a bad request, bad credentials)
+  would fail the same way on every model, so error is re-raised, as it is
+  when there is no stronger model.
+  """
+  escalable = isinstance(error, MalformedResponseError) or is_retryable(error)
+  stronger = router.escalate(model) if escalable else None
+  router.record(model, elapsed, error=error, escalated=stronger is not None)
+  attrs["error"] = repr(error)
+  if stronger is None:
+    raise error
+  attrs["escalated_to"] = stronger
+  if verbose:
+    print(f"{model} failed ({error}); escalating to {stronger}")
+  return stronger, f"escalated from {model}"
+
+def _check_response(response):
+  if not response.usage_metadata:
+    raise MalformedResponseError("Gemini API response appears to be malformed")
+  if response.candidates and response.candidates[0].finish_reason == types.FinishReason.MALFORMED_FUNCTION_CALL:
+    raise MalformedResponseError("Model produced a malformed function call")
+
+def _is_plain_text(part):
+  return part.text is not None and not part.thought
+
+def _trace_response(attrs, response, messages):
+  if not tracing.enabled():
+    return
+  if response.usage_metadata:
+    attrs["prompt_tokens"] = response.usage_metadata.prompt_token_count
+    attrs["response_tokens"] = response.usage_metadata.candidates_token_count
+  attrs["function_calls"] = len(response.function_calls or [])
+  # Serializing the history is only worth paying for when someone is looking
+  attrs["payload_bytes"] = sum(len(message.model_dump_json(exclude_none=True)) for message in messages)
+
+def _compact(messages, token_budget, verbose):
+  with tracing.span("compaction") as attrs:
+    saved = attrs["saved_tokens"] = compact_messages(messages, token_budget)
+  if verbose and saved:
+    print(f"Compaction saved ~{saved} tokens")
+
+def _handle_response(response, messages, verbose):
   if not response.usage_metadata:
     raise RuntimeError("Gemini API response appears to be malformed")
 
@@ -23,30 +213,26 @@ def generate_content(client, messages, available_functions, verbose=False):
   # Add model responses to messages
   if response.candidates:
     messages.extend(candidate.content for candidate in response.candidates if candidate.content)
-    
-  # Handle function calls
-  if response.function_calls:
-    function_response_parts = []
 
-    for function_call in response.function_calls:
-      call_function_result = call_function(function_call, verbose=verbose)
+  return None
 
-      if not call_function_result or not call_function_result.parts or not call_function_result.parts[0].function_response or not call_function_result.parts[0].function_response.response:
-        raise ValueError("No valid response from function call.")
+def _append_function_responses(messages, call_function_results, verbose):
+  function_response_parts = []
 
-      # Collect the entire part, not just the response value
-      function_response_parts.append(call_function_result.parts[0])
+  for call_function_result in call_function_results:
+    if not call_function_result or not call_function_result.parts or not call_function_result.parts[0].function_response or not call_function_result.parts[0].function_response.response:
+      raise ValueError("No valid response from function call.")
 
-      if verbose:
-        print(f"-> {call_function_result.parts[0].function_response.response}")
+    # Collect the entire part, not just the response value
+    function_response_parts.append(call_function_result.parts[0])
 
-    # Add function responses as a user message
-    function_response_content = types.Content(
-      role="user",
-      parts=function_response_parts,
-    )
-    
-    messages.append(function_response_content)
+    if verbose:
+      print(f"-> {call_function_result.parts[0].function_response.response}")
+
+  # Add function responses as a user message
+  function_response_content = types.Content(
+    role="user",
+    parts=function_response_parts,
+  )
   
-  # Not finished yet, return None to continue the loop
-  return None
\ No newline at end of file
+  messages.append(function_response_content)
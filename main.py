@@ -1,40 +1,148 @@
 import os
 import argparse
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-from prompts import system_prompt
-from functions.get_files_info import schema_get_files_info
-from functions.write_file import schema_write_file
-from functions.get_file_content import schema_get_file_content
-from functions.run_python_file import schema_run_python_file
-from generate_content import generate_content
-from config import MAX_ITERS
-
-load_dotenv()  # Load environment variables from a .env file if present
-api_key = os.environ.get("GEMINI_API_KEY")
+from config import DAEMON_SOCKET, MAX_ITERS, MAX_CONCURRENT_TOOLS, PREFETCH, SESSION_DIR, WORKING_DIRECTORY
 
-def main():
-  client = genai.Client(api_key=api_key)
+# Heavy imports (google.genai, the tools and the agent loop) happen inside
+# main() after argument parsing, so --help and usage errors return quickly
 
+def build_parser():
   parser = argparse.ArgumentParser(description="AI Code Assistant")
-  parser.add_argument("user_prompt", type=str, help="Prompt to send to Gemini")
+  parser.add_argument("user_prompt", type=str, nargs="?", help="Prompt to send to Gemini")
   parser.add_argument("--verbose", action="store_true", help="Enable verbose output")
+  parser.add_argument("--stream", action="store_true", help="Print the model's output as it arrives")
+  parser.add_argument("--workspace", type=str, default=WORKING_DIRECTORY, help=f"Directory the tools are confined to (default: {WORKING_DIRECTORY})")
+  parser.add_argument("--max-concurrent-tools", type=int, default=MAX_CONCURRENT_TOOLS, help="Maximum number of tool calls run concurrently per turn")
+  parser.add_argument("--backend", type=str, default="gemini", help='Model backend: "gemini" or "replay:<session.json>"')
+  parser.add_argument("--record", type=str, metavar="SESSION", help="Save model responses to a session file that --backend replay: can play back")
+  parser.add_argument("--session", type=str, metavar="FILE", help=f"Where to checkpoint the conversation after each turn (default: a new file in {SESSION_DIR})")
+  parser.add_argument("--resume", type=str, metavar="FILE", help="Reload a checkpointed session and continue it")
+  parser.add_argument("--trace", type=str, metavar="FILE", help="Write per-turn spans to FILE (JSON lines, or a Chrome trace if FILE ends in .json)")
+  parser.add_argument("--daemon", action="store_true", help="Run the session on a running agent daemon (see daemon.py) instead of in this process")
+  parser.add_argument("--socket", type=str, default=DAEMON_SOCKET, help=f"Unix socket the agent daemon listens on (default: {DAEMON_SOCKET})")
+  parser.add_argument("--prefetch", action=argparse.BooleanOptionalAction, default=PREFETCH, help="Read files the model is likely to ask for next in the background")
+  parser.add_argument("--profile", type=str, metavar="PREFIX", help="Profile the session with cProfile and tracemalloc, writing PREFIX.prof and PREFIX.txt")
+  return parser
+
+def main():
+  parser = build_parser()
   args = parser.parse_args()
+  if not args.user_prompt and not args.resume:
+    parser.error("a prompt is required unless --resume is given")
+  if args.resume and args.session:
+    parser.error("--session cannot be used with --resume; a resumed session is saved to the file it was resumed from")
+  if not os.path.isdir(args.workspace):
+    parser.error(f"workspace '{args.workspace}' is not a directory")
+  if args.daemon:
+    return run_remote(parser, args)
+
+  from contextlib import nullcontext
+  from dotenv import load_dotenv
+  from google.genai import types
+  from backends import RecordingClient, create_client
+  from functions.file_cache import FileCache, use_cache
+  from functions.prefetch import Prefetcher, use_prefetcher
+  from generate_content import generate_content
+  from rate_limit import RetryingClient
+  from routing import default_router
+  from session_store import SessionStore, default_session_path
+  from tool_registry import TOOLS, ToolRegistry, use_registry
+  from tracing import Tracer, profiling, span, use_tracer
+
+  load_dotenv()  # Load environment variables from a .env file if present
+  api_key = os.environ.get("GEMINI_API_KEY")
+
+  client = model_client = RetryingClient(create_client(args.backend, api_key=api_key))
+  if args.record:
+    client = RecordingClient(client, args.record)
+
+  if args.resume:
+    session = SessionStore.load(args.resume)
+    if session.final is not None:
+      print(session.final)
+      return
+    user_prompt = session.prompt
+    messages = session.messages
+  else:
+    user_prompt = args.user_prompt
+    session_path = args.session or (default_session_path(SESSION_DIR) if SESSION_DIR else None)
+    session = SessionStore.create(session_path, user_prompt) if session_path else None
+    messages = [types.Content(role="user", parts=[types.Part(text=user_prompt)])]
+
+  registry = ToolRegistry(TOOLS, workspace=args.workspace)
+  available_functions = registry.tool
+
+  with (
+    use_registry(registry),
+    use_tracer(Tracer(args.trace)) if args.trace else nullcontext(),
+    profiling(args.profile) if args.profile else nullcontext(),
+    use_cache(FileCache()) as file_cache,
+    use_prefetcher(Prefetcher()) if args.prefetch else nullcontext() as prefetcher,
+    span("session", prompt_chars=len(user_prompt)),
+  ):
+    for iteration in range(MAX_ITERS):
+      with span("iteration", index=iteration):
+        try:
+          final_response = generate_content(client, messages, available_functions, args.verbose, args.max_concurrent_tools, stream=args.stream)
+        except Exception as e:
+          final_response = None
+          print(f"Error in generate_content: {e}")
+        if session:
+          session.save(messages)
+        if final_response:
+          if session:
+            session.finish(final_response)
+          # Streamed text has already been printed as it arrived
+          if not args.stream:
+            print(final_response)
+          break
 
-  user_prompt = args.user_prompt
+  if session:
+    session.close()
+    if session.final is None:
+      print(f"Session not finished; continue it with --resume {session.path}")
+  if args.verbose:
+    print("File cache:", file_cache.stats())
+    if prefetcher:
+      print("Prefetch:", prefetcher.stats())
+    print("Model client:", model_client.stats())
+    print("Models:", default_router().stats())
 
-  messages = [types.Content(role="user", parts=[types.Part(text=user_prompt)])]
+def run_remote(parser, args):
+  """Send the prompt to an agent daemon and print its progress and answer."""
+  from daemon import request_session
 
-  available_functions = types.Tool(function_declarations=[schema_get_files_info, schema_write_file, schema_get_file_content, schema_run_python_file])
+  local_only = {"--stream": args.stream, "--resume": args.resume, "--record": args.record, "--session": args.session, "--trace": args.trace, "--profile": args.profile}
+  if unsupported := [flag for flag, value in local_only.items() if value]:
+    parser.error(f"{', '.join(unsupported)} cannot be used with --daemon")
+  if args.backend != "gemini":
+    parser.error("the daemon's backend is chosen when it starts; drop --backend")
 
-  for _ in range(MAX_ITERS):
-    try:
-      if final_response := generate_content(client, messages, available_functions, args.verbose):
-        print(final_response)
-        break
-    except Exception as e:
-      print(f"Error in generate_content: {e}")
+  request = {
+    "prompt": args.user_prompt,
+    "workspace": os.path.abspath(args.workspace),
+    "verbose": args.verbose,
+    "max_concurrent_tools": args.max_concurrent_tools,
+    "prefetch": args.prefetch,
+  }
+  try:
+    for event in request_session(args.socket, request):
+      if event["type"] == "span" and event["name"] == "call_function":
+        print(f" - Calling function: {event['tool']}" + (f" ({event['duration_ms']:.0f} ms)" if args.verbose else ""))
+      elif event["type"] == "result":
+        for error in event["errors"]:
+          print(error)
+        if event["response"] is None:
+          parser.exit(1, f"No final response after {event['iterations']} iterations\n")
+        print(event["response"])
+        if args.verbose:
+          print(f"Iterations: {event['iterations']}, elapsed: {event['elapsed']:.2f}s")
+          print("File cache:", event["file_cache"])
+          if "prefetch" in event:
+            print("Prefetch:", event["prefetch"])
+      elif event["type"] == "error":
+        parser.exit(1, f"Daemon error: {event['error']}\n")
+  except OSError as e:
+    parser.exit(1, f"Cannot reach the agent daemon at {args.socket}: {e}; start it with `python daemon.py`\n")
 
 if __name__ == "__main__":
   main()
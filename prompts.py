@@ -5,8 +5,10 @@ When a user asks a question or makes a request, make a function call plan. You c
 
 - List files and directories
 - Read file contents
+- Search file contents for text or regular expressions
 - Execute Python files with optional arguments
 - Write or overwrite files
+- Edit existing files with search/replace hunks or unified diffs
 
 All paths you provide should be relative to the working directory. You do not need to specify the working directory in your function calls as it is automatically injected for security reasons.
 """
\ No newline at end of file
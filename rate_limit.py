@@ -0,0 +1,214 @@
+import re
+import time
+import sys
+import random
+import asyncio
+import threading
+from functools import cache
+
+import httpx
+from google.genai import errors
+
+from compaction import estimate_tokens
+from config import MODEL_MAX_RETRIES, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE
+
+# 408 and 429 are throttling, the 5xx codes are transient server trouble
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+class TokenBucket:
+  """Thread-safe token bucket refilled continuously at rate_per_minute.
+
+  take() reserves tokens immediately and returns how long the caller must
+  wait before using them, so sync and async callers can sleep in their own
+  way without holding the lock. Reservations may drive the balance
+  negative, which makes later callers queue up behind earlier ones.
+  """
+
+  def __init__(self, rate_per_minute, capacity=None):
+    self.rate = rate_per_minute / 60
+    self.capacity = capacity or rate_per_minute
+    self._tokens = self.capacity
+    self._updated = time.monotonic()
+    self._lock = threading.Lock()
+
+  def take(self, amount=1):
+    with self._lock:
+      now = time.monotonic()
+      self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+      self._updated = now
+      # A request larger than the bucket can only ever wait for a full one
+      self._tokens -= min(amount, self.capacity)
+      return max(0.0, -self._tokens / self.rate)
+
+  def give_back(self, amount):
+    with self._lock:
+      self._tokens = min(self.capacity, self._tokens + amount)
+
+class RateLimiter:
+  """Request and token budgets shared by every session in the process."""
+
+  def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+    self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+    self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+  def reserve(self, estimated_tokens):
+    """Reserve one request and estimated_tokens; returns the seconds to wait first."""
+    delays = [0.0]
+    if self.requests:
+      delays.append(self.requests.take(1))
+    if self.tokens:
+      delays.append(self.tokens.take(estimated_tokens))
+    return max(delays)
+
+  def refund(self, estimated_tokens):
+    """Return the token reservation of an attempt that failed without using it."""
+    if self.tokens and estimated_tokens:
+      self.tokens.give_back(estimated_tokens)
+
+  def settle(self, estimated_tokens, response):
+    """Correct the token reservation once the response reports actual usage."""
+    usage = getattr(response, "usage_metadata", None)
+    if not self.tokens or not usage:
+      return
+    actual = (usage.prompt_token_count or 0) + (usage.candidates_token_count or 0)
+    if actual < estimated_tokens:
+      self.tokens.give_back(estimated_tokens - actual)
+    elif actual > estimated_tokens:
+      self.tokens.take(actual - estimated_tokens)
+
+@cache
+def shared_limiter():
+  return RateLimiter()
+
+def is_retryable(error):
+  if isinstance(error, errors.APIError):
+    return error.code in RETRYABLE_STATUS
+  # The SDK's transports raise their own connection and timeout errors,
+  # which don't derive from the builtin ones
+  transient = [ConnectionError, TimeoutError, httpx.TransportError]
+  if aiohttp := sys.modules.get("aiohttp"):
+    # Checked only if the SDK already loaded aiohttp for its async transport; never imported here
+    transient.extend([aiohttp.ClientConnectionError, aiohttp.ClientPayloadError])
+  return isinstance(error, tuple(transient))
+
+def _server_delay(error):
+  """The retry delay the server asked for (google.rpc.RetryInfo), if any."""
+  details = getattr(error, "details", None)
+  if isinstance(details, dict):
+    details = details.get("error", details).get("details")
+  for detail in details if isinstance(details, list) else []:
+    if isinstance(detail, dict) and (match := re.fullmatch(r"([\d.]+)s", str(detail.get("retryDelay", "")))):
+      return float(match.group(1))
+  return 0.0
+
+def _estimate(contents):
+  return sum(estimate_tokens(part) for content in contents for part in content.parts or [])
+
+class _RetryingModels:
+  def __init__(self, owner):
+    self._owner = owner
+
+  def generate_content(self, model, contents, config=None):
+    owner = self._owner
+    for attempt in range(owner.max_retries + 1):
+      estimated = owner._throttle(contents)
+      try:
+        response = owner.client.models.generate_content(model=model, contents=contents, config=config)
+      except Exception as e:
+        owner.limiter.refund(estimated)
+        time.sleep(owner._backoff(e, attempt))
+        continue
+      owner.limiter.settle(estimated, response)
+      return response
+
+  def generate_content_stream(self, model, contents, config=None):
+    owner = self._owner
+    for attempt in range(owner.max_retries + 1):
+      estimated = owner._throttle(contents)
+      started = False
+      try:
+        for chunk in owner.client.models.generate_content_stream(model=model, contents=contents, config=config):
+          started = True
+          yield chunk
+      except Exception as e:
+        # Chunks already handed to the caller cannot be taken back
+        if started:
+          raise
+        owner.limiter.refund(estimated)
+        time.sleep(owner._backoff(e, attempt))
+        continue
+      if started:
+        owner.limiter.settle(estimated, chunk)
+      return
+
+class _RetryingAsyncModels:
+  def __init__(self, owner):
+    self._owner = owner
+
+  async def generate_content(self, model, contents, config=None):
+    owner = self._owner
+    for attempt in range(owner.max_retries + 1):
+      estimated, delay = owner._reserve(contents)
+      if delay:
+        owner._count("throttled_seconds", delay)
+        await asyncio.sleep(delay)
+      try:
+        response = await owner.client.aio.models.generate_content(model=model, contents=contents, config=config)
+      except Exception as e:
+        owner.limiter.refund(estimated)
+        await asyncio.sleep(owner._backoff(e, attempt))
+        continue
+      owner.limiter.settle(estimated, response)
+      return response
+
+class RetryingClient:
+  """Wraps a model client with rate limiting and retries of transient errors.
+
+  Every request first reserves capacity from the (process-wide by default)
+  RateLimiter. Retryable errors (429, 5xx, connection drops) are retried up
+  to max_retries times with full-jitter exponential backoff, waiting at
+  least as long as the server asked; anything else is raised at once.
+  """
+
+  def __init__(self, client, limiter=None, max_retries=MODEL_MAX_RETRIES, base_delay=1.0, max_delay=60.0):
+    self.client = client
+    self.limiter = limiter or shared_limiter()
+    self.max_retries = max_retries
+    self.base_delay = base_delay
+    self.max_delay = max_delay
+    self.counters = {"requests": 0, "retries": 0, "failures": 0, "throttled_seconds": 0.0, "backoff_seconds": 0.0}
+    self._lock = threading.Lock()
+    self.models = _RetryingModels(self)
+    if hasattr(client, "aio"):
+      self.aio = type("RetryingAio", (), {})()
+      self.aio.models = _RetryingAsyncModels(self)
+
+  def stats(self):
+    with self._lock:
+      return dict(self.counters)
+
+  def _count(self, name, amount=1):
+    with self._lock:
+      self.counters[name] += amount
+
+  def _reserve(self, contents):
+    self._count("requests")
+    estimated = _estimate(contents) if self.limiter.tokens else 0
+    return estimated, self.limiter.reserve(estimated)
+
+  def _throttle(self, contents):
+    estimated, delay = self._reserve(contents)
+    if delay:
+      self._count("throttled_seconds", delay)
+      time.sleep(delay)
+    return estimated
+
+  def _backoff(self, error, attempt):
+    """Return how long to wait before retrying error, or re-raise it."""
+    if not is_retryable(error) or attempt >= self.max_retries:
+      self._count("failures")
+      raise error
+    delay = max(_server_delay(error), random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+    self._count("retries")
+    self._count("backoff_seconds", delay)
+    return delay
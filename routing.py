@@ -0,0 +1,121 @@
+import threading
+from functools import cache
+from dataclasses import dataclass
+
+from compaction import estimate_tokens
+from config import MODEL, MODEL_ROUTES, MODEL_ESCALATION
+
+@dataclass(frozen=True)
+class Route:
+  """Send a turn to model when every condition that is set holds.
+
+  turn counts the model replies already in the history. pending_tool_results
+  is whether the turn only has tool results to digest. errors counts tool
+  results in the history that reported an error.
+  """
+  model: str
+  min_turn: int | None = None
+  max_turn: int | None = None
+  pending_tool_results: bool | None = None
+  min_history_tokens: int | None = None
+  max_history_tokens: int | None = None
+  min_errors: int | None = None
+
+  def describe(self):
+    conditions = [f"{name}={value}" for name, value in vars(self).items() if name != "model" and value is not None]
+    return ", ".join(conditions) or "always"
+
+class _Turn:
+  """What the routing rules look at; history_tokens is only computed if a rule needs it."""
+
+  def __init__(self, messages):
+    self.messages = messages
+    self.turn = sum(1 for message in messages if message.role == "model")
+    last = messages[-1] if messages else None
+    self.pending_tool_results = bool(last and last.role == "user" and any(part.function_response for part in last.parts or []))
+    self.errors = sum(1 for message in messages for part in message.parts or [] if _is_error(part))
+    self._history_tokens = None
+
+  @property
+  def history_tokens(self):
+    if self._history_tokens is None:
+      self._history_tokens = sum(estimate_tokens(part) for message in self.messages for part in message.parts or [])
+    return self._history_tokens
+
+def _is_error(part):
+  response = part.function_response.response if part.function_response else None
+  if not response:
+    return False
+  result = response.get("result")
+  return "error" in response or (isinstance(result, str) and result.startswith("Error"))
+
+def _matches(route, turn):
+  return (
+    (route.min_turn is None or turn.turn >= route.min_turn)
+    and (route.max_turn is None or turn.turn <= route.max_turn)
+    and (route.pending_tool_results is None or turn.pending_tool_results == route.pending_tool_results)
+    and (route.min_errors is None or turn.errors >= route.min_errors)
+    and (route.min_history_tokens is None or turn.history_tokens >= route.min_history_tokens)
+    and (route.max_history_tokens is None or turn.history_tokens <= route.max_history_tokens)
+  )
+
+class Router:
+  """Picks the model for each turn and the next stronger one when a call fails.
+
+  Routes are tried in order and the first match wins; otherwise the default
+  model is used. escalation lists models from weakest to strongest. Stats
+  are kept per model and shared by every session using the router.
+  """
+
+  def __init__(self, routes=(), default=MODEL, escalation=()):
+    self.routes = [route if isinstance(route, Route) else Route(**route) for route in routes]
+    self.default = default
+    self.escalation = list(escalation)
+    self.escalations = 0
+    self._stats = {}
+    self._lock = threading.Lock()
+
+  def choose(self, messages):
+    """Return (model, reason) for the next turn."""
+    turn = _Turn(messages)
+    for route in self.routes:
+      if _matches(route, turn):
+        return route.model, route.describe()
+    return self.default, "default"
+
+  def escalate(self, model):
+    """The next stronger model after model, or None if there is none."""
+    if model not in self.escalation:
+      # Anything off the ladder escalates to its top, unless that is where it already is
+      stronger = self.escalation[-1] if self.escalation else None
+      return stronger if stronger != model else None
+    index = self.escalation.index(model)
+    return self.escalation[index + 1] if index + 1 < len(self.escalation) else None
+
+  def record(self, model, elapsed, response=None, error=None, escalated=False):
+    with self._lock:
+      stats = self._stats.setdefault(model, {"calls": 0, "failures": 0, "latency_s": 0.0, "prompt_tokens": 0, "response_tokens": 0})
+      stats["calls"] += 1
+      stats["latency_s"] += elapsed
+      if error is not None:
+        stats["failures"] += 1
+      usage = response.usage_metadata if response is not None else None
+      if usage:
+        stats["prompt_tokens"] += usage.prompt_token_count or 0
+        stats["response_tokens"] += usage.candidates_token_count or 0
+      if escalated:
+        self.escalations += 1
+
+  def stats(self):
+    with self._lock:
+      return {
+        "escalations": self.escalations,
+        "models": {
+          model: {**stats, "mean_latency_s": stats["latency_s"] / stats["calls"]}
+          for model, stats in self._stats.items()
+        },
+      }
+
+@cache
+def default_router():
+  return Router(MODEL_ROUTES, MODEL, MODEL_ESCALATION)
@@ -0,0 +1,87 @@
+import os
+import json
+import time
+
+from google.genai import types
+
+SESSION_VERSION = 1
+
+class SessionStore:
+  """Append-only JSON-lines checkpoint of one conversation.
+
+  The first line describes the session, every later line is one message
+  (or the final answer), so saving a turn only writes that turn's messages.
+  A line torn by a crash is dropped when the session is loaded.
+  """
+
+  def __init__(self, path, prompt, messages=None, final=None, valid_bytes=None):
+    self.path = path
+    self.prompt = prompt
+    self.messages = messages or []
+    self.final = final
+    self._saved = len(self.messages)
+    if valid_bytes is None:
+      os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+      self._file = open(path, "w")
+      self._write({"type": "session", "version": SESSION_VERSION, "prompt": prompt, "created": time.time()})
+    else:
+      self._file = open(path, "r+")
+      # Cut off a partially written last line before appending after it
+      self._file.truncate(valid_bytes)
+      self._file.seek(valid_bytes)
+
+  @classmethod
+  def create(cls, path, prompt):
+    return cls(path, prompt)
+
+  @classmethod
+  def load(cls, path):
+    prompt = None
+    messages = []
+    final = None
+    valid_bytes = 0
+    with open(path, "rb") as f:
+      for raw_line in f:
+        try:
+          record = json.loads(raw_line)
+        except ValueError:
+          break
+        if not raw_line.endswith(b"\n"):
+          break
+        valid_bytes += len(raw_line)
+        if record["type"] == "session":
+          if record.get("version") != SESSION_VERSION:
+            raise ValueError(f"Unsupported session version in '{path}': {record.get('version')}")
+          prompt = record["prompt"]
+        elif record["type"] == "message":
+          messages.append(types.Content.model_validate(record["content"]))
+        elif record["type"] == "final":
+          final = record["text"]
+    if prompt is None:
+      raise ValueError(f"'{path}' is not a session file")
+    return cls(path, prompt, messages, final, valid_bytes)
+
+  def _write(self, record):
+    self._file.write(json.dumps(record) + "\n")
+
+  def save(self, messages):
+    """Append messages added since the last save. Earlier messages are never rewritten."""
+    for message in messages[self._saved:]:
+      self._write({"type": "message", "content": message.model_dump(mode="json", exclude_none=True)})
+    self._saved = len(messages)
+    self._sync()
+
+  def finish(self, final_text):
+    self.final = final_text
+    self._write({"type": "final", "text": final_text})
+    self._sync()
+
+  def _sync(self):
+    self._file.flush()
+    os.fsync(self._file.fileno())
+
+  def close(self):
+    self._file.close()
+
+def default_session_path(session_dir):
+  return os.path.join(session_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl")
@@ -1,10 +1,46 @@
 import pytest
 import os
+import sys
+import subprocess
+import json
+import stat
+import socket
+import asyncio
+import threading
+import time
 from pathlib import Path
+from collections import OrderedDict
+from google.genai import types
+import call_function as call_function_module
+from generate_content import generate_content
+from backends import ReplayClient, RecordingClient
+from batch import run_batch
+from compaction import compact_messages
+from session_store import SessionStore
+from daemon import AgentDaemon, SocketInUseError, request_session
+from rate_limit import RateLimiter, RetryingClient, TokenBucket
+from google.genai import errors as genai_errors
+from routing import Route, Router
+from workspaces import create_workspace, isolated
+from tool_registry import TOOLS, ToolRegistry, ToolSpec, use_registry
+import tracing
+from functions.file_cache import FileCache, use_cache
+from functions.python_workers import PythonWorkerPool
+from functions.bounded_output import BoundedBuffer
+import functions.python_workers as python_workers
 from functions.get_files_info import get_files_info
 from functions.get_file_content import get_file_content
+from functions.line_index import LineIndex
 from functions.write_file import write_file
-from functions.run_python_file import run_python_file
+from functions.edit_file import edit_file
+from functions.search_files import search_files
+import functions.search_files as search_files_module
+import functions.search_index as search_index
+from functions.run_python_file import CACHED_MARKER, run_python_file
+from functions.run_cache import FileHasher, RunCache
+import functions.run_cache as run_cache
+from functions.result_format import human_size, tree_lines
+from functions.prefetch import Prefetcher, use_prefetcher
 from config import MAX
 
 
@@ -129,6 +165,167 @@ class TestGetFilesInfo:
     return get_files_info(calculator_dir, arg1)
 
 
+class TestGetFilesInfoRecursive:
+  """Tests for recursive, filtered and paged listings."""
+
+  @pytest.fixture
+  def tree(self, tmp_path):
+    for path in ("a.py", "notes.txt", "pkg/b.py", "pkg/sub/c.py", "build/out.o", ".git/HEAD"):
+      (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+      (tmp_path / path).write_text("x" * 10)
+    (tmp_path / ".gitignore").write_text("# build output\nbuild/\n*.txt\n")
+    return str(tmp_path)
+
+  def _paths(self, result):
+    return [line[2:].split(":")[0] for line in result.splitlines() if line.startswith("- ")]
+
+  def test_recursive_respects_gitignore(self, tree):
+    paths = self._paths(get_files_info(tree, ".", recursive=True))
+    assert paths == [".gitignore", "a.py", "pkg", "pkg/b.py", "pkg/sub", "pkg/sub/c.py"]
+
+  def test_single_level_unchanged(self, tree):
+    paths = self._paths(get_files_info(tree, "."))
+    assert set(paths) == {".git", ".gitignore", "a.py", "notes.txt", "pkg", "build"}
+
+  def test_max_depth_and_filters(self, tree):
+    assert self._paths(get_files_info(tree, ".", recursive=True, max_depth=2, include=["*.py"])) == ["a.py", "pkg/b.py"]
+    assert self._paths(get_files_info(tree, "pkg", recursive=True, exclude=["sub"])) == ["b.py"]
+
+  def test_max_depth_must_be_positive(self, tree):
+    assert self._paths(get_files_info(tree, ".", recursive=True, max_depth=1)) == [".gitignore", "a.py", "pkg"]
+    assert get_files_info(tree, ".", recursive=True, max_depth=0) == "Error: max_depth must be at least 1, got 0"
+
+  def test_symlinks_do_not_escape_or_loop(self, tree, tmp_path_factory):
+    outside = tmp_path_factory.mktemp("outside")
+    (outside / "secret.txt").write_text("SECRET_TOKEN_XYZ")
+    os.symlink(str(outside), os.path.join(tree, "pkg", "link"))
+    os.symlink(".", os.path.join(tree, "pkg", "loop"))
+    paths = self._paths(get_files_info(tree, ".", recursive=True))
+    assert paths == [".gitignore", "a.py", "pkg", "pkg/b.py", "pkg/loop", "pkg/sub", "pkg/sub/c.py"]
+
+  def test_paging_with_cursor(self, tree):
+    first = get_files_info(tree, ".", recursive=True, page_size=4)
+    assert self._paths(first) == [".gitignore", "a.py", "pkg", "pkg/b.py"]
+    assert "2 more entries, call again with cursor='4'" in first
+    second = get_files_info(tree, ".", recursive=True, page_size=4, cursor="4")
+    assert self._paths(second) == ["pkg/sub", "pkg/sub/c.py"]
+    assert "more entries" not in second
+
+  def test_unreadable_entry_skipped(self, tree):
+    os.symlink(os.path.join(tree, "missing"), os.path.join(tree, "dangling"))
+    result = get_files_info(tree, ".")
+    assert "a.py: file_size=10 bytes" in result
+    assert "dangling" not in result
+    assert "[Skipped 1 unreadable entries]" in result
+
+
+class TestSearchFiles:
+  """Tests for the indexed search_files tool."""
+
+  @pytest.fixture
+  def workdir(self, tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, "SEARCH_INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(search_index, "_indexes", OrderedDict())
+    root = tmp_path / "repo"
+    (root / "pkg").mkdir(parents=True)
+    (root / "pkg" / "calc.py").write_text("import os\n\nclass Calculator:\n  def evaluate(self, expr):\n    return expr\n")
+    (root / "main.py").write_text("from pkg.calc import Calculator\nprint(Calculator().evaluate('1'))\n")
+    (root / "blob.bin").write_bytes(b"\0Calculator")
+    return str(root)
+
+  def test_literal_search_with_context(self, workdir):
+    result = search_files(workdir, "def evaluate", context_lines=1)
+    assert "Found 1 matching lines in 1 files" in result
+    assert "pkg/calc.py:4: " in result
+    assert "pkg/calc.py-3- class Calculator:" in result
+    assert "blob.bin" not in result
+
+  def test_regex_and_include(self, workdir):
+    result = search_files(workdir, r"class \w+:", regex=True)
+    assert "pkg/calc.py:3: class Calculator:" in result
+    result = search_files(workdir, "calculator", include=["main.py"], context_lines=0)
+    assert "main.py:1:" in result and "main.py:2:" in result
+    assert "pkg/calc.py" not in result
+
+  def test_index_updates_after_write(self, workdir):
+    assert search_files(workdir, "fresh_symbol").startswith("No matches")
+    write_file(workdir, "new.py", "fresh_symbol = 1\n")
+    index = search_index.get_index(workdir)
+    assert "new.py" in index.candidates(["fresh_symbol"])
+    assert "new.py:1: fresh_symbol = 1" in search_files(workdir, "fresh_symbol")
+
+  def test_index_persists(self, workdir, monkeypatch):
+    search_files(workdir, "Calculator")
+    monkeypatch.setattr(search_index, "_indexes", OrderedDict())
+    index = search_index.TrigramIndex(workdir, index_dir=search_index.SEARCH_INDEX_DIR)
+    assert index.candidates(["evaluate"]) == ["main.py", "pkg/calc.py"]
+
+  def test_unwritable_or_corrupt_index_cache(self, workdir, tmp_path, monkeypatch):
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("")
+    monkeypatch.setattr(search_index, "SEARCH_INDEX_DIR", str(blocker / "index"))
+    assert "pkg/calc.py:4:" in search_files(workdir, "def evaluate")
+    monkeypatch.setattr(search_index, "SEARCH_INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(search_index, "_indexes", OrderedDict())
+    index_path = search_index.TrigramIndex.path_for(os.path.realpath(workdir), str(tmp_path / "index"))
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    with open(index_path, "wb") as f:
+      f.write(b"\x80\x05truncated")
+    assert "pkg/calc.py:4:" in search_files(workdir, "def evaluate")
+
+  def test_short_files_are_searched_and_large_ones_reported(self, workdir, monkeypatch):
+    monkeypatch.setattr(search_index, "SEARCH_MAX_FILE_BYTES", 100)
+    monkeypatch.setattr(search_files_module, "SEARCH_MAX_FILE_BYTES", 100)
+    (Path(workdir) / "ab.txt").write_text("ab")
+    (Path(workdir) / "big.txt").write_text("needle\n" * 50)
+    result = search_files(workdir, "ab")
+    assert "ab.txt:1: ab" in result
+    result = search_files(workdir, "needle")
+    assert result.startswith("No matches")
+    assert "[Skipped 1 files over 100 bytes, read them with get_file_content: big.txt]" in result
+    assert "Skipped" not in search_files(workdir, "needle", include=["*.py"])
+
+  def test_symlinks_do_not_escape_or_loop(self, workdir, tmp_path):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    (outside / "secret.txt").write_text("SECRET_TOKEN_XYZ\n")
+    os.symlink("../../outside", os.path.join(workdir, "pkg", "link"))
+    os.symlink(str(outside / "secret.txt"), os.path.join(workdir, "leak.txt"))
+    os.symlink(".", os.path.join(workdir, "loop"))
+    assert search_files(workdir, "SECRET_TOKEN").startswith("No matches")
+    index = search_index.get_index(workdir)
+    assert sorted(index.files) == ["blob.bin", "main.py", "pkg/calc.py"]
+
+  def test_recent_walk_is_reused_until_marked_stale(self, workdir):
+    assert search_files(workdir, "late_symbol").startswith("No matches")
+    # Written behind the tools' back, within the refresh interval
+    (Path(workdir) / "late.py").write_text("late_symbol = 1\n")
+    assert search_files(workdir, "late_symbol").startswith("No matches")
+    (Path(workdir) / "noop.py").write_text("pass\n")
+    run_python_file(workdir, "noop.py", use_worker_pool=False)
+    assert "late.py:1: late_symbol = 1" in search_files(workdir, "late_symbol")
+
+  def test_indexes_are_bounded_and_dropped(self, workdir, tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, "SEARCH_INDEX_CACHE_SIZE", 2)
+    roots = []
+    for name in ("a", "b", "c"):
+      (tmp_path / name).mkdir()
+      (tmp_path / name / "x.py").write_text("value = 1\n")
+      roots.append(str(tmp_path / name))
+      search_files(roots[-1], "value")
+    assert list(search_index._indexes) == [os.path.realpath(root) for root in roots[1:]]
+    index_path = search_index.get_index(roots[2]).index_path
+    assert os.path.exists(index_path)
+    search_index.drop_index(roots[2])
+    assert os.path.realpath(roots[2]) not in search_index._indexes
+    assert not os.path.exists(index_path)
+
+  def test_required_literals(self):
+    assert search_index.required_literals(r"class \w+Error") == ["class ", "Error"]
+    assert search_index.required_literals("foo|bar") == []
+    assert search_index.required_literals("colou?r_name") == ["colo", "r_name"]
+
+
 def _print_test_result(header: str, result: str):
   """Helper to print test headers and results consistently."""
   print("\n" + header)
@@ -187,6 +384,59 @@ class TestGetFileContent:
     assert "def evaluate" in result or "def _evaluate_infix" in result
 
 
+class TestGetFileContentRanges:
+  """Tests for line-windowed reads and binary detection."""
+
+  @pytest.fixture
+  def workdir(self, tmp_path):
+    (tmp_path / "big.py").write_text("".join(f"line {n}\n" for n in range(1, 5001)))
+    (tmp_path / "blob.bin").write_bytes(b"\x89PNG\0\0\0")
+    return str(tmp_path)
+
+  def test_window(self, workdir):
+    result = get_file_content(workdir, "big.py", start_line=4000, end_line=4002)
+    assert result == "[Lines 4000-4002 of 5000 in 'big.py']\nline 4000\nline 4001\nline 4002\n"
+
+  def test_open_ended_window_truncated_on_line_boundary(self, workdir):
+    result = get_file_content(workdir, "big.py", start_line=10)
+    header, body = result.split("\n", 1)
+    assert "truncated at" in header
+    assert body.startswith("line 10\n") and body.endswith("\n")
+    assert len(body) <= MAX
+    last = int(body.splitlines()[-1].split()[1])
+    assert f"Lines 10-{last} of 5000" in header
+
+  def test_over_long_line_is_not_read_in_full(self, workdir, monkeypatch):
+    with open(os.path.join(workdir, "min.js"), "w") as f:
+      f.write("x" * (MAX * 50) + "\nend\n")
+    read_sizes = []
+    original = LineIndex.read
+
+    def read(self, *args, **kwargs):
+      data = original(self, *args, **kwargs)
+      read_sizes.append(len(data))
+      return data
+
+    monkeypatch.setattr(LineIndex, "read", read)
+    result = get_file_content(workdir, "min.js", start_line=1, end_line=2)
+    header, body = result.split("\n", 1)
+    assert header == f"[Lines 1-1 of 2 in 'min.js', truncated at {MAX} characters]"
+    assert body == "x" * MAX
+    assert read_sizes == [MAX * 4]
+
+  def test_window_tracks_file_changes(self, workdir):
+    get_file_content(workdir, "big.py", start_line=1, end_line=1)
+    with open(os.path.join(workdir, "big.py"), "w") as f:
+      f.write("changed\n")
+    assert get_file_content(workdir, "big.py", start_line=1, end_line=5) == "[Lines 1-1 of 1 in 'big.py']\nchanged\n"
+
+  def test_out_of_range(self, workdir):
+    assert "past the end" in get_file_content(workdir, "big.py", start_line=6000)
+
+  def test_binary_detected(self, workdir):
+    assert "appears to be a binary file" in get_file_content(workdir, "blob.bin")
+
+
 class TestWriteFile:
   """Tests for the write_file function."""
 
@@ -221,6 +471,72 @@ class TestWriteFile:
     assert "outside the permitted working directory" in res
 
 
+class TestEditFile:
+  """Tests for transactional search/replace and unified diff edits."""
+
+  @pytest.fixture
+  def workdir(self, tmp_path):
+    (tmp_path / "a.py").write_text("def add(a, b):\n  return a + b\n\ndef sub(a, b):\n  return a - b\n")
+    (tmp_path / "b.py").write_text("VALUE = 1\n")
+    return tmp_path
+
+  def test_search_replace_across_files(self, workdir):
+    result = edit_file(str(workdir), edits=[
+      {"file_path": "a.py", "search": "return a + b", "replace": "return b + a"},
+      {"file_path": "b.py", "search": "VALUE = 1", "replace": "VALUE = 2"},
+      {"file_path": "new/c.py", "search": "", "replace": "print('c')\n"},
+    ])
+    assert result.startswith("Successfully applied edits to 3 file(s)")
+    assert "- a.py: edited, +1 -1 lines" in result
+    assert "- new/c.py: created, +1 -0 lines" in result
+    assert "return b + a" in (workdir / "a.py").read_text()
+    assert (workdir / "b.py").read_text() == "VALUE = 2\n"
+    assert (workdir / "new" / "c.py").read_text() == "print('c')\n"
+
+  def test_crlf_line_endings_are_kept(self, workdir):
+    (workdir / "win.txt").write_bytes(b"a\r\nb\r\nc\r\n")
+    result = edit_file(str(workdir), edits=[{"file_path": "win.txt", "search": "b\nc", "replace": "B\nC"}])
+    assert "+2 -2 lines" in result
+    assert (workdir / "win.txt").read_bytes() == b"a\r\nB\r\nC\r\n"
+    patch = "--- a/win.txt\n+++ b/win.txt\n@@ -1,2 +1,3 @@\n-a\n+A\n+a2\n B\n"
+    assert edit_file(str(workdir), patch=patch).startswith("Successfully")
+    assert (workdir / "win.txt").read_bytes() == b"A\r\na2\r\nB\r\nC\r\n"
+
+  def test_failed_hunk_changes_nothing(self, workdir):
+    before = {p.name: p.read_text() for p in workdir.iterdir()}
+    result = edit_file(str(workdir), edits=[
+      {"file_path": "b.py", "search": "VALUE = 1", "replace": "VALUE = 2"},
+      {"file_path": "a.py", "search": "(a, b)", "replace": "(x, y)"},
+    ])
+    assert "occurs 2 times" in result and "no files were changed" in result
+    assert {p.name: p.read_text() for p in workdir.iterdir()} == before
+
+  def test_unified_diff(self, workdir):
+    patch = (
+      "--- a/a.py\n+++ b/a.py\n"
+      "@@ -1,2 +1,3 @@\n def add(a, b):\n+  # commutative\n   return a + b\n"
+      "@@ -4,2 +5,2 @@\n def sub(a, b):\n-  return a - b\n+  return -(b - a)\n"
+      "--- a/b.py\n+++ /dev/null\n@@ -1 +0,0 @@\n-VALUE = 1\n"
+    )
+    result = edit_file(str(workdir), patch=patch)
+    assert "- a.py: edited, +2 -1 lines" in result
+    assert "- b.py: deleted" in result
+    assert (workdir / "a.py").read_text() == "def add(a, b):\n  # commutative\n  return a + b\n\ndef sub(a, b):\n  return -(b - a)\n"
+    assert not (workdir / "b.py").exists()
+
+  def test_outside_working_directory(self, workdir):
+    result = edit_file(str(workdir), edits=[{"file_path": "../x.py", "search": "", "replace": "x"}])
+    assert "outside the permitted working directory" in result
+
+  def test_write_file_is_atomic_and_keeps_mode(self, workdir):
+    path = workdir / "a.py"
+    os.chmod(path, 0o755)
+    write_file(str(workdir), "a.py", "print('new')\n")
+    assert path.read_text() == "print('new')\n"
+    assert os.stat(path).st_mode & 0o777 == 0o755
+    assert [p.name for p in workdir.iterdir() if p.name.endswith(".tmp")] == []
+
+
 class TestRunPythonFile:
   """Tests for the run_python_file function."""
 
@@ -266,6 +582,1353 @@ class TestRunPythonFile:
     assert "Error:" in result or "not a Python file" in result
 
 
+class TestBoundedOutput:
+  """Tests for bounded, incremental capture of run_python_file output."""
+
+  def test_buffer_keeps_head_and_tail(self):
+    buffer = BoundedBuffer(10)
+    for chunk in (b"abc", b"defgh", b"ijklmnop", b"qrstuvwxyz"):
+      buffer.write(chunk)
+    assert buffer.total == 26
+    assert buffer.truncated
+    assert buffer.text() == "abcde\n[... 16 bytes omitted ...]\nvwxyz"
+
+  def test_small_output_unchanged(self):
+    buffer = BoundedBuffer(10)
+    buffer.write(b"hello")
+    assert not buffer.truncated
+    assert buffer.text() == "hello"
+
+  def _chatty(self, tmp_path):
+    (tmp_path / "chatty.py").write_text(
+      "import sys\n"
+      "print('first line')\n"
+      "for i in range(200000):\n"
+      "  sys.stdout.write('x' * 50 + '\\n')\n"
+      "print('last line')\n"
+    )
+
+  @pytest.mark.parametrize("use_worker_pool", [False, True])
+  def test_large_output_truncated(self, tmp_path, monkeypatch, use_worker_pool):
+    pool = PythonWorkerPool(size=1)
+    monkeypatch.setattr(python_workers, "_pool", pool)
+    self._chatty(tmp_path)
+    try:
+      result = run_python_file(str(tmp_path), "chatty.py", use_worker_pool=use_worker_pool, max_output_bytes=1000)
+    finally:
+      pool.close()
+    assert result.startswith("STDOUT:\nfirst line\n")
+    assert "last line" in result
+    assert "bytes omitted ..." in result
+    assert "[Output truncated to 1000 bytes per stream, 10200021 bytes written in" in result
+    assert len(result) < 1200
+
+  def test_hard_limit_kills_process(self, tmp_path):
+    (tmp_path / "flood.py").write_text("import sys\nwhile True:\n  sys.stdout.write('y' * 4096)\n")
+    started = time.monotonic()
+    result = run_python_file(str(tmp_path), "flood.py", max_output_bytes=100, hard_limit=1024 * 1024)
+    assert time.monotonic() - started < 10
+    assert "Process killed after" in result
+    assert "for writing more than 1048576 bytes of output" in result
+
+  def test_stdin_is_closed(self, tmp_path):
+    (tmp_path / "ask.py").write_text("try:\n  input()\nexcept EOFError:\n  print('no input')\n")
+    assert run_python_file(str(tmp_path), "ask.py", timeout=5) == "STDOUT:\nno input\n"
+
+
+class TestResourceLimits:
+  """Tests for setrlimit caps on scripts run by run_python_file."""
+
+  def _run(self, tmp_path, source, **limits):
+    (tmp_path / "abuse.py").write_text(source)
+    return run_python_file(str(tmp_path), "abuse.py", timeout=20, limits=limits)
+
+  def test_cpu_limit(self, tmp_path):
+    result = self._run(tmp_path, "while True:\n  pass\n", cpu_seconds=1)
+    assert "Resource limit hit: CPU time limit of 1 seconds" in result
+
+  def test_memory_limit(self, tmp_path):
+    result = self._run(tmp_path, "hog = bytearray(1024 * 1024 * 1024)\n", memory_bytes=512 * 1024 * 1024)
+    assert "MemoryError" in result
+    assert f"Resource limit hit: memory (address space) limit of {512 * 1024 * 1024} bytes" in result
+
+  def test_open_files_limit(self, tmp_path):
+    result = self._run(tmp_path, "files = [open(__file__) for _ in range(100)]\n", open_files=32)
+    assert "Resource limit hit: open files limit of 32" in result
+
+  def test_file_size_limit(self, tmp_path):
+    result = self._run(tmp_path, "with open('big.bin', 'wb') as f:\n  f.write(b'z' * 2 * 1024 * 1024)\n", file_size_bytes=1024 * 1024)
+    assert "Resource limit hit: output file size limit of 1048576 bytes" in result
+    assert (tmp_path / "big.bin").stat().st_size <= 1024 * 1024
+
+  @pytest.mark.skipif(not hasattr(os, "geteuid") or os.geteuid() == 0, reason="RLIMIT_NPROC does not bind root")
+  def test_process_limit(self, tmp_path):
+    result = self._run(tmp_path, (
+      "import os, time\n"
+      "pids = []\n"
+      "try:\n"
+      "  for _ in range(100):\n"
+      "    pid = os.fork()\n"
+      "    if pid == 0:\n"
+      "      time.sleep(5)\n"
+      "      os._exit(0)\n"
+      "    pids.append(pid)\n"
+      "finally:\n"
+      "  for pid in pids:\n"
+      "    os.kill(pid, 9)\n"
+    ), processes=1)
+    assert "Resource limit hit: process count limit of 1" in result
+
+  def test_well_behaved_script_unaffected(self, tmp_path):
+    result = self._run(tmp_path, "print('fine')\n", cpu_seconds=5, memory_bytes=512 * 1024 * 1024, open_files=64, file_size_bytes=1024)
+    assert result == "STDOUT:\nfine\n"
+
+  def test_worker_pool_applies_limits(self, tmp_path, monkeypatch):
+    pool = PythonWorkerPool(size=1, limits={"memory_bytes": 512 * 1024 * 1024})
+    monkeypatch.setattr(python_workers, "_pool", pool)
+    (tmp_path / "abuse.py").write_text("hog = bytearray(1024 * 1024 * 1024)\n")
+    try:
+      result = run_python_file(str(tmp_path), "abuse.py", use_worker_pool=True)
+    finally:
+      pool.close()
+    assert "Resource limit hit: memory (address space) limit" in result
+
+
+class TestRunCache:
+  """Tests for memoized run_python_file results."""
+
+  @pytest.fixture(autouse=True)
+  def fresh_cache(self, monkeypatch):
+    cache = RunCache(max_entries=2)
+    monkeypatch.setattr(run_cache, "_run_cache", cache)
+    return cache
+
+  def _run(self, tmp_path, file_path="script.py", **kwargs):
+    return run_python_file(str(tmp_path), file_path, use_worker_pool=False, memoize=True, **kwargs)
+
+  def test_identical_run_is_replayed(self, tmp_path, fresh_cache):
+    (tmp_path / "script.py").write_text("import sys, time\nprint(time.time_ns(), sys.argv[1:])\n")
+    first = self._run(tmp_path, args=["a"])
+    second = self._run(tmp_path, args=["a"])
+    assert second == f"{CACHED_MARKER}\n{first}"
+    assert not self._run(tmp_path, args=["b"]).startswith(CACHED_MARKER)
+    assert fresh_cache.stats() == {"hits": 1, "misses": 2, "entries": 2}
+
+  def test_workspace_change_and_bypass_rerun(self, tmp_path):
+    (tmp_path / "script.py").write_text("import time\nprint(open('data.txt').read(), time.time_ns())\n")
+    (tmp_path / "data.txt").write_text("one")
+    first = self._run(tmp_path)
+    (tmp_path / "data.txt").write_text("two")
+    changed = self._run(tmp_path)
+    assert not changed.startswith(CACHED_MARKER) and "two" in changed
+    assert self._run(tmp_path).startswith(CACHED_MARKER)
+    bypassed = self._run(tmp_path, bypass_cache=True)
+    assert not bypassed.startswith(CACHED_MARKER) and bypassed != first
+
+  def test_runs_with_side_effects_are_not_cached(self, tmp_path, fresh_cache):
+    (tmp_path / "script.py").write_text("open('log.txt', 'a').write('x')\nprint('ran')\n")
+    self._run(tmp_path)
+    self._run(tmp_path)
+    assert (tmp_path / "log.txt").read_text() == "xx"
+    assert fresh_cache.stats()["entries"] == 0
+
+  def test_failed_runs_are_not_cached(self, tmp_path, fresh_cache):
+    (tmp_path / "script.py").write_text("import sys\nprint('failing')\nsys.exit(3)\n")
+    first = self._run(tmp_path)
+    assert "Process exited with code 3" in first
+    assert self._run(tmp_path) == first
+    assert fresh_cache.stats() == {"hits": 0, "misses": 2, "entries": 0}
+
+  def test_hashes_only_kept_for_live_files_and_recent_trees(self, tmp_path):
+    for name in ("a", "b", "c"):
+      (tmp_path / name).mkdir()
+      (tmp_path / name / "x.txt").write_text(name)
+    hasher = FileHasher(max_trees=2)
+    hasher.tree_digest(str(tmp_path / "a"))
+    (tmp_path / "a" / "gone.txt").write_text("soon deleted")
+    hasher.tree_digest(str(tmp_path / "a"))
+    os.remove(tmp_path / "a" / "gone.txt")
+    hasher.tree_digest(str(tmp_path / "a"))
+    assert list(hasher._trees[os.path.realpath(tmp_path / "a")]) == [os.path.realpath(tmp_path / "a" / "x.txt")]
+    hasher.tree_digest(str(tmp_path / "b"))
+    hasher.tree_digest(str(tmp_path / "c"))
+    assert list(hasher._trees) == [os.path.realpath(tmp_path / name) for name in ("b", "c")]
+
+  def test_removed_workspace_is_forgotten(self, tmp_path, fresh_cache):
+    (tmp_path / "base").mkdir()
+    (tmp_path / "base" / "script.py").write_text("print('hi')\n")
+    workspace = create_workspace(str(tmp_path / "base"), str(tmp_path / "ws"))
+    run_python_file(workspace.root, "script.py", use_worker_pool=False, memoize=True)
+    assert fresh_cache.stats()["entries"] == 1
+    workspace.remove()
+    assert fresh_cache.stats()["entries"] == 0
+    assert not fresh_cache.hasher._trees
+
+  def test_least_recently_used_is_evicted(self):
+    cache = RunCache(max_entries=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    cache.get("a")
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+
+  def test_file_hashes_are_reused_until_the_file_changes(self, tmp_path, monkeypatch):
+    (tmp_path / "a.txt").write_text("a")
+    hasher = FileHasher()
+    before = hasher.tree_digest(str(tmp_path))
+    opened = []
+    real_open = open
+    monkeypatch.setattr("builtins.open", lambda path, *args, **kwargs: opened.append(path) or real_open(path, *args, **kwargs))
+    assert hasher.tree_digest(str(tmp_path)) == before
+    assert opened == []
+    (tmp_path / "a.txt").write_text("b")
+    assert hasher.tree_digest(str(tmp_path)) != before
+
+
+class TestResultFormats:
+  """Tests for the compact tool result format."""
+
+  def test_human_size(self):
+    assert [human_size(size) for size in (0, 999, 1048, 37 * 1024, 5 * 1024 * 1024)] == ["0", "999", "1.0K", "37K", "5.0M"]
+
+  def test_tree_lines_group_paths_under_their_directory(self):
+    entries = sorted([("pkg", 4096, True), ("pkg.txt", 10, False), ("pkg/a.py", 20, False), ("deep/x/y.py", 30, False)])
+    assert tree_lines(entries) == ["deep/", " x/", "  y.py 30", "pkg/", " a.py 20", "pkg.txt 10"]
+
+  def test_compact_listing_is_shorter_and_pages(self, tmp_path):
+    for index in range(5):
+      (tmp_path / "pkg").mkdir(exist_ok=True)
+      (tmp_path / "pkg" / f"module_{index}.py").write_text("x" * 2000)
+    text = get_files_info(str(tmp_path), recursive=True)
+    compact = get_files_info(str(tmp_path), recursive=True, page_size=4, result_format="compact")
+    assert compact.splitlines() == ["pkg/", " module_0.py 2.0K", " module_1.py 2.0K", " module_2.py 2.0K", "[+2 more, cursor='4']"]
+    assert len(get_files_info(str(tmp_path), recursive=True, result_format="compact")) < len(text) / 2
+
+  def test_compact_run_and_write(self, tmp_path):
+    (tmp_path / "fail.py").write_text("import sys\nprint('out')\nsys.exit('bad')\n")
+    assert run_python_file(str(tmp_path), "fail.py", use_worker_pool=False, result_format="compact") == "out\n[stderr]\nbad\n[exit 1]"
+    assert write_file(str(tmp_path), "a.txt", "abc", result_format="compact") == "wrote a.txt (3 chars)"
+
+  def test_registry_selects_format_per_tool(self, tmp_path):
+    (tmp_path / "a.txt").write_text("abc")
+    registry = ToolRegistry(TOOLS, workspace=str(tmp_path), overrides={"get_files_info": {"result_format": "compact"}})
+    assert registry.call("get_files_info", {}) == {"result": "a.txt 3"}
+    assert registry.call("write_file", {"file_path": "b.txt", "content": "x"})["result"].startswith("Successfully wrote")
+
+  def test_registry_rejects_unsupported_format(self, tmp_path):
+    with pytest.raises(ValueError):
+      ToolRegistry(TOOLS, workspace=str(tmp_path), overrides={"search_files": {"result_format": "compact"}})
+    with pytest.raises(ValueError):
+      ToolRegistry(TOOLS, workspace=str(tmp_path), overrides={"get_files_info": {"result_format": "tiny"}})
+
+
+class TestPrefetch:
+  """Tests for speculative prefetching of likely-next files."""
+
+  def _wait(self, prefetcher):
+    prefetcher._executor.submit(lambda: None).result()
+    deadline = time.time() + 5
+    while prefetcher._pending and time.time() < deadline:
+      time.sleep(0.01)
+
+  def test_listing_warms_small_text_files(self, tmp_path):
+    (tmp_path / "a.py").write_text("print('a')\n")
+    (tmp_path / "notes.md").write_text("notes")
+    (tmp_path / "big.py").write_text("x" * 2000)
+    (tmp_path / "image.png").write_bytes(b"\0png")
+    with use_prefetcher(Prefetcher(max_file_bytes=1000)) as prefetcher:
+      get_files_info(str(tmp_path))
+      self._wait(prefetcher)
+      assert get_file_content(str(tmp_path), "a.py") == "print('a')\n"
+      assert get_file_content(str(tmp_path), "big.py") == "x" * 2000
+      stats = prefetcher.stats()
+    assert stats["prefetched"] == 2
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+    assert stats["wasted_bytes"] == len("notes")
+
+  def test_read_warms_imported_modules(self, tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "__init__.py").write_text("")
+    (tmp_path / "pkg" / "calculator.py").write_text("from .render import render\n")
+    (tmp_path / "pkg" / "render.py").write_text("def render(): pass\n")
+    (tmp_path / "main.py").write_text("import os\nfrom pkg.calculator import Calculator\n")
+    with use_prefetcher(Prefetcher()) as prefetcher:
+      get_file_content(str(tmp_path), "main.py")
+      self._wait(prefetcher)
+      assert get_file_content(str(tmp_path), "pkg/calculator.py") == "from .render import render\n"
+      self._wait(prefetcher)
+      assert get_file_content(str(tmp_path), "pkg/render.py") == "def render(): pass\n"
+      stats = prefetcher.stats()
+    assert stats["hits"] == 2
+    assert stats["wasted_bytes"] == 0
+
+  def test_changed_files_are_not_served(self, tmp_path):
+    (tmp_path / "a.py").write_text("old = 1\n")
+    with use_prefetcher(Prefetcher()) as prefetcher:
+      get_files_info(str(tmp_path))
+      self._wait(prefetcher)
+      write_file(str(tmp_path), "a.py", "new = 2\n")
+      assert get_file_content(str(tmp_path), "a.py") == "new = 2\n"
+      stats = prefetcher.stats()
+    assert (stats["hits"], stats["misses"], stats["wasted_bytes"]) == (0, 1, len("old = 1\n"))
+
+  def test_store_is_bounded(self, tmp_path):
+    for index in range(4):
+      (tmp_path / f"m{index}.py").write_text("x" * 100)
+    prefetcher = Prefetcher(max_bytes=250, workers=1)
+    try:
+      prefetcher.after_listing(str(tmp_path), [(f"m{index}.py", 100, False) for index in range(4)])
+      self._wait(prefetcher)
+      stats = prefetcher.stats()
+    finally:
+      prefetcher.close()
+    assert stats["prefetched"] == 4
+    assert prefetcher._bytes == 200
+    assert stats["wasted_bytes"] == 400
+
+
+class TestCallFunctions:
+  """Tests for concurrent dispatch of a turn's function calls."""
+
+  @pytest.fixture
+  def recorded_calls(self, monkeypatch):
+    """Replace call_function with a slow fake that records start/end times."""
+    calls = []
+    lock = threading.Lock()
+
+    def fake_call_function(function_call_part, verbose=False):
+      start = time.monotonic()
+      time.sleep(0.05)
+      with lock:
+        calls.append((function_call_part.name, function_call_part.args, start, time.monotonic()))
+      return types.Content(
+        role="tool",
+        parts=[types.Part.from_function_response(name=function_call_part.name, response={"result": dict(function_call_part.args)})],
+      )
+
+    monkeypatch.setattr(call_function_module, "call_function", fake_call_function)
+    return calls
+
+  def _call(self, name, **args):
+    return types.FunctionCall(name=name, args=args)
+
+  def test_results_in_call_order(self, recorded_calls):
+    calls = [self._call("get_file_content", file_path=f"f{i}.py") for i in range(6)]
+    results = call_function_module.call_functions(calls, max_workers=4)
+    paths = [r.parts[0].function_response.response["result"]["file_path"] for r in results]
+    assert paths == [f"f{i}.py" for i in range(6)]
+
+  def test_reads_run_in_parallel(self, monkeypatch):
+    # Every read waits for all four to be in flight; run one at a time, the barrier breaks
+    barrier = threading.Barrier(4, timeout=10)
+
+    def fake_call_function(function_call_part, verbose=False):
+      barrier.wait()
+      return types.Content(role="tool", parts=[types.Part.from_function_response(name=function_call_part.name, response={"result": "ok"})])
+
+    monkeypatch.setattr(call_function_module, "call_function", fake_call_function)
+    calls = [self._call("get_file_content", file_path=f"f{i}.py") for i in range(4)]
+    results = call_function_module.call_functions(calls, max_workers=4)
+    assert len(results) == 4
+    assert not barrier.broken
+
+  def test_writes_to_same_path_serialized(self, recorded_calls):
+    calls = [
+      self._call("write_file", file_path="a.py", content="1"),
+      self._call("get_file_content", file_path="a.py"),
+      self._call("write_file", file_path="a.py", content="2"),
+    ]
+    call_function_module.call_functions(calls, max_workers=4)
+    ordered = sorted(recorded_calls, key=lambda c: c[2])
+    assert [c[1].get("content") for c in ordered] == ["1", None, "2"]
+    for earlier, later in zip(ordered, ordered[1:]):
+      assert earlier[3] <= later[2]
+
+  def test_run_python_file_is_a_barrier(self, recorded_calls):
+    calls = [
+      self._call("get_file_content", file_path="a.py"),
+      self._call("run_python_file", file_path="main.py"),
+      self._call("get_file_content", file_path="b.py"),
+    ]
+    call_function_module.call_functions(calls, max_workers=4)
+    times = {c[1]["file_path"]: (c[2], c[3]) for c in recorded_calls}
+    assert times["a.py"][1] <= times["main.py"][0]
+    assert times["main.py"][1] <= times["b.py"][0]
+
+
+class TestToolRegistry:
+  """Tests for schema validation and per-tool limits in the tool registry."""
+
+  def _registry(self, tmp_path, *specs, **kwargs):
+    return ToolRegistry(list(specs) or TOOLS, workspace=str(tmp_path), overrides=kwargs.get("overrides", {}))
+
+  def test_coerces_arguments_to_schema_types(self, tmp_path):
+    (tmp_path / "a.txt").write_text("one\ntwo\nthree\n")
+    registry = self._registry(tmp_path)
+    response = registry.call("get_file_content", {"file_path": "a.txt", "start_line": "2", "end_line": 2.0})
+    assert "[Lines 2-2 of 3" in response["result"]
+    assert "two" in response["result"]
+
+  def test_wraps_single_value_for_array(self, tmp_path):
+    (tmp_path / "a.py").write_text("")
+    (tmp_path / "b.txt").write_text("")
+    response = self._registry(tmp_path).call("get_files_info", {"include": "*.py", "recursive": "true"})
+    assert "a.py" in response["result"]
+    assert "b.txt" not in response["result"]
+
+  def test_rejects_unknown_and_invalid_arguments(self, tmp_path):
+    registry = self._registry(tmp_path)
+    response = registry.call("run_python_file", {"file_path": "main.py", "use_worker_pool": True})
+    assert "unexpected use_worker_pool" in response["error"]
+    response = registry.call("get_file_content", {"file_path": "a.txt", "start_line": "two"})
+    assert "start_line must be an integer" in response["error"]
+
+  def test_missing_required_arguments(self, tmp_path):
+    registry = self._registry(tmp_path)
+    response = registry.call("write_file", {"file_path": "x.txt"})
+    assert response == {"error": "Invalid arguments for write_file: missing required content in arguments"}
+    assert "missing required file_path" in registry.call("get_file_content", {})["error"]
+    assert "missing required file_path in edits[0]" in registry.call("edit_file", {"edits": [{"search": "a"}]})["error"]
+    assert not (tmp_path / "x.txt").exists()
+
+  def test_tool_exception_becomes_error(self, tmp_path):
+    def broken(working_directory):
+      raise RuntimeError("disk on fire")
+    spec = ToolSpec("broken", broken, {"name": "broken", "parameters": {"type": "OBJECT", "properties": {}}})
+    assert self._registry(tmp_path, spec).call("broken", {}) == {"error": "broken failed: disk on fire"}
+
+  def test_unknown_function(self, tmp_path):
+    assert self._registry(tmp_path).call("delete_everything", {}) == {"error": "Unknown function: delete_everything"}
+
+  def test_result_cap(self, tmp_path):
+    spec = ToolSpec("echo", lambda working_directory, text: text, {"name": "echo", "parameters": {"type": "OBJECT", "properties": {"text": {"type": "STRING"}}}}, result_cap=10)
+    response = self._registry(tmp_path, spec).call("echo", {"text": "x" * 25})
+    assert response["result"] == "x" * 10 + "\n[... result truncated, 15 more characters]"
+
+  def test_timeout(self, tmp_path):
+    spec = ToolSpec("slow", lambda working_directory: time.sleep(1), {"name": "slow", "parameters": {"type": "OBJECT", "properties": {}}}, timeout=0.05)
+    response = self._registry(tmp_path, spec).call("slow", {})
+    assert response == {"error": "slow timed out after 0.05 seconds"}
+
+  def test_concurrency_limit(self, tmp_path):
+    active = []
+    peak = []
+    lock = threading.Lock()
+    def work(working_directory):
+      with lock:
+        active.append(1)
+        peak.append(len(active))
+      time.sleep(0.05)
+      with lock:
+        active.pop()
+      return "done"
+    spec = ToolSpec("work", work, {"name": "work", "parameters": {"type": "OBJECT", "properties": {}}}, read_only=True, max_concurrency=2)
+    with use_registry(self._registry(tmp_path, spec)):
+      call_function_module.call_functions([types.FunctionCall(name="work", args={}) for _ in range(6)], max_workers=6)
+    assert max(peak) == 2
+
+  def test_overrides_and_workspace(self, tmp_path):
+    (tmp_path / "main.py").write_text("print('hello')")
+    registry = self._registry(tmp_path, overrides={"run_python_file": {"timeout": 5}})
+    assert registry.specs["run_python_file"].timeout == 5
+    with use_registry(registry):
+      result = call_function_module.call_function(types.FunctionCall(name="run_python_file", args={"file_path": "main.py"}))
+    assert "hello" in result.parts[0].function_response.response["result"]
+
+  def test_access_from_metadata(self, tmp_path):
+    registry = self._registry(tmp_path)
+    assert registry.access("get_file_content", {"file_path": "pkg/./a.py"}) == ("read", "pkg/a.py")
+    assert registry.access("search_files", {"pattern": "x"}) == ("read", ".")
+    assert registry.access("write_file", {"file_path": "a.py"}) == ("write", "a.py")
+    assert registry.access("edit_file", {}) == ("barrier", None)
+
+
+class _FlakyModels:
+  """Stand-in for client.models that fails with the given errors before answering."""
+
+  def __init__(self, failures):
+    self.failures = list(failures)
+    self.calls = 0
+
+  def _maybe_fail(self):
+    self.calls += 1
+    if self.failures:
+      raise self.failures.pop(0)
+
+  def generate_content(self, model, contents, config=None):
+    self._maybe_fail()
+    return _text_response("done")
+
+  def generate_content_stream(self, model, contents, config=None):
+    self._maybe_fail()
+    yield _text_response("do")
+    yield _text_response("ne")
+
+
+class _FlakyClient:
+  def __init__(self, failures):
+    self.models = _FlakyModels(failures)
+    self.aio = type("FlakyAio", (), {})()
+    self.aio.models = self
+
+  async def generate_content(self, model, contents, config=None):
+    return self.models.generate_content(model, contents, config)
+
+
+class TestRetryingClient:
+  """Tests for retries, backoff and throttling of model requests."""
+
+  def _throttled(self, code=429, retry_delay=None):
+    details = {"error": {"code": code, "message": "slow down", "status": "RESOURCE_EXHAUSTED"}}
+    if retry_delay:
+      details["error"]["details"] = [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": retry_delay}]
+    error_type = genai_errors.ClientError if code < 500 else genai_errors.ServerError
+    return error_type(code, details)
+
+  def _client(self, failures, **kwargs):
+    kwargs.setdefault("limiter", RateLimiter(None, None))
+    return RetryingClient(_FlakyClient(failures), base_delay=0.001, **kwargs)
+
+  def _contents(self):
+    return [types.Content(role="user", parts=[types.Part(text="hi")])]
+
+  def test_retries_429_and_503(self):
+    client = self._client([self._throttled(429), self._throttled(503)])
+    response = client.models.generate_content(model="m", contents=self._contents())
+    assert response.text == "done"
+    assert client.client.models.calls == 3
+    assert client.stats()["retries"] == 2
+    assert client.stats()["failures"] == 0
+
+  def test_retries_transport_errors(self):
+    import httpx
+
+    request = httpx.Request("POST", "https://example.invalid")
+    failures = [
+      httpx.ConnectError("refused", request=request),
+      httpx.ReadTimeout("slow", request=request),
+      httpx.RemoteProtocolError("peer closed", request=request),
+    ]
+    client = self._client(failures)
+    response = client.models.generate_content(model="m", contents=self._contents())
+    assert response.text == "done"
+    assert client.stats()["retries"] == 3
+
+  def test_non_retryable_error_raised_at_once(self):
+    client = self._client([self._throttled(400)])
+    with pytest.raises(genai_errors.ClientError):
+      client.models.generate_content(model="m", contents=self._contents())
+    assert client.client.models.calls == 1
+    assert client.stats()["failures"] == 1
+
+  def test_gives_up_after_max_retries(self):
+    client = self._client([self._throttled(503) for _ in range(5)], max_retries=2)
+    with pytest.raises(genai_errors.ServerError):
+      client.models.generate_content(model="m", contents=self._contents())
+    assert client.client.models.calls == 3
+
+  def test_honours_server_retry_delay(self):
+    client = self._client([self._throttled(429, retry_delay="0.05s")])
+    start = time.monotonic()
+    client.models.generate_content(model="m", contents=self._contents())
+    assert time.monotonic() - start >= 0.05
+    assert client.stats()["backoff_seconds"] >= 0.05
+
+  def test_stream_retried_before_first_chunk(self):
+    client = self._client([self._throttled(503)])
+    chunks = list(client.models.generate_content_stream(model="m", contents=self._contents()))
+    assert "".join(chunk.text for chunk in chunks) == "done"
+    assert client.stats()["retries"] == 1
+
+  def test_async_retries(self):
+    client = self._client([self._throttled(429)])
+    response = asyncio.run(client.aio.models.generate_content(model="m", contents=self._contents()))
+    assert response.text == "done"
+    assert client.stats()["retries"] == 1
+
+  def test_token_bucket_waits_when_empty(self):
+    bucket = TokenBucket(60, capacity=1)
+    assert bucket.take() == 0
+    assert bucket.take() == pytest.approx(1.0, abs=0.05)
+    assert bucket.take() == pytest.approx(2.0, abs=0.05)
+
+  def test_shared_limiter_throttles_all_clients(self):
+    limiter = RateLimiter(requests_per_minute=1200)
+    limiter.requests = TokenBucket(1200, capacity=1)
+    clients = [self._client([], limiter=limiter) for _ in range(2)]
+    start = time.monotonic()
+    for client in clients * 2:
+      client.models.generate_content(model="m", contents=self._contents())
+    # 4 requests at 20 per second with a burst of 1
+    assert time.monotonic() - start >= 0.14
+    assert sum(client.stats()["throttled_seconds"] for client in clients) > 0
+
+  def test_token_budget_settled_from_usage(self):
+    limiter = RateLimiter(tokens_per_minute=6000)
+    client = self._client([], limiter=limiter)
+    client.models.generate_content(model="m", contents=self._contents())
+    # _text_response reports 2 tokens of usage
+    assert limiter.tokens._tokens == pytest.approx(5998, abs=1)
+
+  def test_failed_attempts_give_their_tokens_back(self):
+    contents = [types.Content(role="user", parts=[types.Part(text="x" * 4000)])]
+    for call in (
+      lambda client: client.models.generate_content(model="m", contents=contents),
+      lambda client: list(client.models.generate_content_stream(model="m", contents=contents)),
+      lambda client: asyncio.run(client.aio.models.generate_content(model="m", contents=contents)),
+    ):
+      limiter = RateLimiter(tokens_per_minute=6000)
+      client = self._client([self._throttled(429), self._throttled(503)], limiter=limiter)
+      call(client)
+      assert client.stats()["retries"] == 2
+      # Only the successful attempt's 2 tokens of usage are charged
+      assert limiter.tokens._tokens == pytest.approx(5998, abs=1)
+
+
+def _text_response(text):
+  """Build a minimal Gemini response carrying only text."""
+  return types.GenerateContentResponse(
+    candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))],
+    usage_metadata=types.GenerateContentResponseUsageMetadata(prompt_token_count=1, candidates_token_count=1),
+  )
+
+
+class _FakeAsyncModels:
+  def __init__(self):
+    self.in_flight = 0
+    self.max_in_flight = 0
+
+  async def generate_content(self, model, contents, config):
+    prompt = contents[0].parts[0].text
+    self.in_flight += 1
+    self.max_in_flight = max(self.max_in_flight, self.in_flight)
+    try:
+      await asyncio.sleep(0.01)
+      if prompt == "fail":
+        raise RuntimeError("boom")
+      return _text_response(f"echo: {prompt}")
+    finally:
+      self.in_flight -= 1
+
+
+class _FakeAsyncClient:
+  def __init__(self):
+    self.aio = type("Aio", (), {})()
+    self.aio.models = _FakeAsyncModels()
+
+
+class TestBatch:
+  """Tests for the async batch runner."""
+
+  def test_batch_writes_results_and_isolates_failures(self, tmp_path):
+    client = _FakeAsyncClient()
+    entries = [{"id": i, "prompt": "fail" if i == 2 else f"p{i}"} for i in range(6)]
+    output = tmp_path / "results.jsonl"
+    asyncio.run(run_batch(client, entries, str(output), max_sessions=2, max_iters=2))
+
+    records = {r["id"]: r for r in map(json.loads, output.read_text().splitlines())}
+    assert set(records) == set(range(6))
+    assert records[0]["status"] == "ok"
+    assert records[0]["response"] == "echo: p0"
+    assert records[2]["status"] == "max_iters"
+    assert "boom" in records[2]["errors"][0]
+    assert all("elapsed" in r for r in records.values())
+    assert client.aio.models.max_in_flight <= 2
+
+
+class _WritingAsyncModels:
+  """Each session writes its prompt into shared.txt, then finishes."""
+
+  async def generate_content(self, model, contents, config=None):
+    prompt = contents[0].parts[0].text
+    if len(contents) == 1:
+      call = types.FunctionCall(name="write_file", args={"file_path": "shared.txt", "content": prompt})
+      parts = [types.Part(function_call=call)]
+    else:
+      parts = [types.Part(text=f"wrote {prompt}")]
+    await asyncio.sleep(0.01)
+    return types.GenerateContentResponse(
+      candidates=[types.Candidate(content=types.Content(role="model", parts=parts))],
+      usage_metadata=types.GenerateContentResponseUsageMetadata(prompt_token_count=1, candidates_token_count=1),
+    )
+
+
+class TestWorkspaces:
+  """Tests for copy-on-write session workspaces."""
+
+  @pytest.fixture
+  def base(self, tmp_path):
+    base = tmp_path / "base"
+    (base / "pkg").mkdir(parents=True)
+    (base / "pkg" / "a.py").write_text("x = 1\n")
+    (base / "notes.txt").write_text("keep\n")
+    return base
+
+  def test_files_are_linked_not_copied(self, base, tmp_path):
+    workspace = create_workspace(str(base), str(tmp_path / "ws"), mode="hardlink")
+    assert os.stat(base / "pkg" / "a.py").st_ino == os.stat(tmp_path / "ws" / "pkg" / "a.py").st_ino
+    assert workspace.changes() == []
+
+  def test_links_out_of_the_workspace_are_not_followed(self, base, tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, "SEARCH_INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(search_index, "_indexes", OrderedDict())
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    (outside / "secret.txt").write_text("SECRET_TOKEN_XYZ\n")
+    os.symlink(str(outside), base / "pkg" / "shared")
+    os.symlink(str(outside / "secret.txt"), base / "leak.txt")
+    workspace = create_workspace(str(base), str(tmp_path / "ws"))
+    root = workspace.root
+
+    assert "secret" not in get_files_info(root, ".", recursive=True)
+    assert search_files(root, "SECRET_TOKEN").startswith("No matches")
+    assert get_file_content(root, "pkg/shared/secret.txt").startswith("Error:")
+    assert get_file_content(root, "leak.txt").startswith("Error:")
+    assert write_file(root, "pkg/shared/secret.txt", "changed").startswith("Error:")
+    assert (outside / "secret.txt").read_text() == "SECRET_TOKEN_XYZ\n"
+
+  @pytest.mark.parametrize("mode", ["auto", "hardlink", "copy"])
+  def test_writes_stay_in_workspace(self, base, tmp_path, mode):
+    workspace = create_workspace(str(base), str(tmp_path / "ws"), mode=mode)
+    assert write_file(workspace.root, "pkg/a.py", "x = 2\n").startswith("Successfully")
+    assert "Successfully" in edit_file(workspace.root, edits=[{"file_path": "new.py", "search": "", "replace": "y = 1\n"}])
+    os.remove(os.path.join(workspace.root, "notes.txt"))
+
+    assert (base / "pkg" / "a.py").read_text() == "x = 1\n"
+    assert (base / "notes.txt").exists()
+    assert workspace.changes() == [("added", "new.py"), ("deleted", "notes.txt"), ("modified", "pkg/a.py")]
+    diff = workspace.diff()
+    assert "--- a/pkg/a.py\n+++ b/pkg/a.py\n" in diff
+    assert "-x = 1\n+x = 2\n" in diff
+    assert "--- /dev/null\n+++ b/new.py\n" in diff
+
+  def test_export_applies_changes_and_reports_conflicts(self, base, tmp_path):
+    workspace = create_workspace(str(base), str(tmp_path / "ws"))
+    write_file(workspace.root, "pkg/a.py", "x = 2\n")
+    write_file(workspace.root, "notes.txt", "mine\n")
+    # Someone else changes notes.txt in the base meanwhile
+    (base / "notes.txt").write_text("theirs, and longer\n")
+    result = workspace.export()
+    assert result == {"exported": ["pkg/a.py"], "conflicts": ["notes.txt"]}
+    assert (base / "pkg" / "a.py").read_text() == "x = 2\n"
+    assert (base / "notes.txt").read_text() == "theirs, and longer\n"
+
+  def test_path_guard_enforces_workspace_root(self, base, tmp_path):
+    (tmp_path / "secret.txt").write_text("secret")
+    os.symlink(tmp_path / "secret.txt", base / "escape.txt")
+    workspace = create_workspace(str(base), str(tmp_path / "ws"))
+    assert "outside the permitted working directory" in get_file_content(workspace.root, "escape.txt")
+    assert "outside the permitted working directory" in write_file(workspace.root, "escape.txt", "x")
+    assert "outside the permitted working directory" in get_file_content(workspace.root, "../base/notes.txt")
+    assert (tmp_path / "secret.txt").read_text() == "secret"
+
+  def test_isolated_never_shares_inodes_with_base(self, base, tmp_path):
+    async def session():
+      async with isolated(str(base)) as workspace:
+        assert os.path.dirname(workspace.root) == str(tmp_path / ".base.workspaces")
+        assert workspace.mode in ("reflink", "copy")
+        # A script appending in place must not reach the base
+        with open(os.path.join(workspace.root, "notes.txt"), "a") as f:
+          f.write("session\n")
+        return workspace.changes()
+
+    assert asyncio.run(session()) == [("modified", "notes.txt")]
+    assert (base / "notes.txt").read_text() == "keep\n"
+    assert sorted(os.listdir(tmp_path)) == ["base"]
+
+  def test_removing_a_workspace_drops_its_search_index(self, base, tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, "SEARCH_INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(search_index, "_indexes", OrderedDict())
+    workspace = create_workspace(str(base), str(tmp_path / "ws"))
+    search_files(workspace.root, "x = 1")
+    index_path = search_index.get_index(workspace.root).index_path
+    workspace.remove()
+    assert not search_index._indexes
+    assert not os.path.exists(index_path)
+
+  def test_batch_sessions_are_isolated(self, base, tmp_path):
+    client = type("Client", (), {})()
+    client.aio = type("Aio", (), {})()
+    client.aio.models = _WritingAsyncModels()
+    entries = [{"id": i, "prompt": f"session {i}"} for i in range(4)]
+    records = asyncio.run(run_batch(client, entries, str(tmp_path / "out.jsonl"), max_sessions=4, isolate_from=str(base)))
+    for record in records:
+      assert record["status"] == "ok"
+      assert record["changes"] == [{"status": "added", "path": "shared.txt"}]
+      assert f"+{record['prompt']}" in record["diff"]
+    assert not (base / "shared.txt").exists()
+
+
+class TestCompaction:
+  """Tests for token-budgeted history compaction."""
+
+  def _turn(self, name, args, result):
+    return [
+      types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(name=name, args=args))]),
+      types.Content(role="user", parts=[types.Part.from_function_response(name=name, response={"result": result})]),
+    ]
+
+  def _results(self, messages):
+    return [
+      part.function_response.response["result"]
+      for message in messages for part in (message.parts or []) if part.function_response
+    ]
+
+  def test_repeated_reads_keep_latest(self):
+    messages = [types.Content(role="user", parts=[types.Part(text="fix it")])]
+    messages += self._turn("get_file_content", {"file_path": "a.py"}, "old " * 500)
+    messages += self._turn("get_file_content", {"file_path": "b.py"}, "bbb")
+    messages += self._turn("get_file_content", {"file_path": "a.py"}, "new")
+    messages += self._turn("get_files_info", {}, "listing")
+    saved = compact_messages(messages, token_budget=10**6, keep_recent=1)
+    results = self._results(messages)
+    assert results[0].startswith("[elided")
+    assert results[1:] == ["bbb", "new", "listing"]
+    assert saved > 0
+
+  def test_different_windows_are_kept(self):
+    messages = [types.Content(role="user", parts=[types.Part(text="go")])]
+    messages += self._turn("get_file_content", {"file_path": "a.py", "start_line": 1, "end_line": 10}, "head")
+    messages += self._turn("get_file_content", {"file_path": "a.py", "start_line": 400, "end_line": 410}, "middle")
+    messages += self._turn("write_file", {"file_path": "b.py", "content": "x"}, "ok")
+    messages += self._turn("get_files_info", {}, "listing")
+    compact_messages(messages, token_budget=10**6, keep_recent=1)
+    assert self._results(messages) == ["head", "middle", "ok", "listing"]
+
+  def test_over_budget_stubs_oldest_first(self):
+    messages = [types.Content(role="user", parts=[types.Part(text="go")])]
+    for i in range(4):
+      messages += self._turn("run_python_file", {"file_path": f"s{i}.py"}, "x" * 4000)
+    compact_messages(messages, token_budget=2500, keep_recent=1)
+    results = self._results(messages)
+    assert results[0].startswith("[elided") and results[1].startswith("[elided")
+    assert results[3] == "x" * 4000
+
+  def test_under_budget_is_untouched(self):
+    messages = [types.Content(role="user", parts=[types.Part(text="go")])]
+    messages += self._turn("run_python_file", {"file_path": "s.py"}, "ok")
+    assert compact_messages(messages, token_budget=10**6) == 0
+    assert self._results(messages) == ["ok"]
+
+
+class TestFileCache:
+  """Tests for the session-scoped file read and listing cache."""
+
+  @pytest.fixture
+  def workdir(self, tmp_path):
+    (tmp_path / "a.py").write_text("print('a')\n")
+    (tmp_path / "pkg").mkdir()
+    return str(tmp_path)
+
+  def test_repeated_reads_hit(self, workdir):
+    with use_cache(FileCache()) as cache:
+      first = get_file_content(workdir, "a.py")
+      second = get_file_content(workdir, "a.py")
+      get_files_info(workdir, ".")
+      listing = get_files_info(workdir, ".")
+    assert first == second == "print('a')\n"
+    assert "a.py: file_size=11 bytes" in listing
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 2
+
+  def test_write_file_invalidates(self, workdir):
+    with use_cache(FileCache()) as cache:
+      get_file_content(workdir, "a.py")
+      get_files_info(workdir, ".")
+      write_file(workdir, "a.py", "print('changed')\n")
+      assert get_file_content(workdir, "a.py") == "print('changed')\n"
+      assert "a.py: file_size=17 bytes" in get_files_info(workdir, ".")
+    assert cache.stats()["hits"] == 0
+
+  def test_external_change_detected(self, workdir):
+    with use_cache(FileCache()):
+      get_file_content(workdir, "a.py")
+      path = os.path.join(workdir, "a.py")
+      with open(path, "w") as f:
+        f.write("print('external change')\n")
+      assert "external change" in get_file_content(workdir, "a.py")
+
+  def test_lru_byte_budget(self, workdir):
+    for name in ("x.txt", "y.txt"):
+      with open(os.path.join(workdir, name), "w") as f:
+        f.write("z" * 60)
+    with use_cache(FileCache(max_bytes=100)) as cache:
+      get_file_content(workdir, "x.txt")
+      get_file_content(workdir, "y.txt")
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 60
+
+
+class TestPythonWorkerPool:
+  """Tests for running Python files in warm worker interpreters."""
+
+  @pytest.fixture
+  def pool(self, monkeypatch):
+    pool = PythonWorkerPool(size=1, preimports=["json"])
+    monkeypatch.setattr(python_workers, "_pool", pool)
+    yield pool
+    pool.close()
+
+  def test_output_matches_fresh_interpreter(self, pool, tmp_path):
+    script = tmp_path / "script.py"
+    script.write_text(
+      "import os, sys\n"
+      "print(sys.argv[1:], os.getcwd() == os.path.dirname(__file__), __name__)\n"
+      "print('oops', file=sys.stderr)\n"
+      "sys.exit(3)\n"
+    )
+    pooled = run_python_file(str(tmp_path), "script.py", ["a", "b"], use_worker_pool=True)
+    fresh = run_python_file(str(tmp_path), "script.py", ["a", "b"], use_worker_pool=False)
+    assert pooled == fresh
+    assert "['a', 'b'] True __main__" in pooled
+    assert "Process exited with code 3" in pooled
+
+  def test_uncaught_exception_traceback(self, pool, tmp_path):
+    (tmp_path / "boom.py").write_text("raise ValueError('bad')\n")
+    pooled = run_python_file(str(tmp_path), "boom.py", use_worker_pool=True)
+    fresh = run_python_file(str(tmp_path), "boom.py", use_worker_pool=False)
+    assert pooled == fresh
+
+  def test_workers_do_not_share_state(self, pool, tmp_path):
+    (tmp_path / "state.py").write_text(
+      "import sys\n"
+      "print(hasattr(sys, 'leaked'))\n"
+      "sys.leaked = True\n"
+    )
+    assert run_python_file(str(tmp_path), "state.py", use_worker_pool=True) == "STDOUT:\nFalse\n"
+    assert run_python_file(str(tmp_path), "state.py", use_worker_pool=True) == "STDOUT:\nFalse\n"
+
+  def test_timeout(self, pool, tmp_path):
+    (tmp_path / "slow.py").write_text("import time\ntime.sleep(5)\n")
+    with pytest.raises(Exception, match="timed out"):
+      pool.run(str(tmp_path / "slow.py"), [], str(tmp_path), timeout=0.5)
+
+
+class _FakeStreamingModels:
+  """Serves the same scripted turns through the blocking and the streaming API."""
+
+  def __init__(self, turns):
+    self.turns = turns
+    self.calls = 0
+
+  def _next_parts(self):
+    parts = self.turns[self.calls]
+    self.calls += 1
+    return parts
+
+  def generate_content(self, model, contents, config):
+    parts = self._next_parts()
+    merged = []
+    for part in parts:
+      if part.text is not None and merged and merged[-1].text is not None:
+        merged[-1] = types.Part(text=merged[-1].text + part.text)
+      else:
+        merged.append(part)
+    response = _text_response("")
+    response.candidates[0].content.parts = merged
+    return response
+
+  def generate_content_stream(self, model, contents, config):
+    for part in self._next_parts():
+      chunk = _text_response("")
+      chunk.candidates[0].content.parts = [part]
+      yield chunk
+
+
+class TestStreaming:
+  """Tests for the streaming generate_content path."""
+
+  def _run(self, stream, monkeypatch):
+    turns = [
+      [types.Part(text="Let me "), types.Part(text="look."), types.Part(function_call=types.FunctionCall(name="get_files_info", args={}))],
+      [types.Part(text="All "), types.Part(text="done.")],
+    ]
+    client = type("Client", (), {})()
+    client.models = _FakeStreamingModels(turns)
+    monkeypatch.setattr(
+      call_function_module, "call_function",
+      lambda call, verbose=False: types.Content(role="tool", parts=[types.Part.from_function_response(name=call.name, response={"result": "listing"})]),
+    )
+    messages = [types.Content(role="user", parts=[types.Part(text="hi")])]
+    tool = call_function_module.get_available_functions()
+    assert generate_content(client, messages, tool, stream=stream) is None
+    final = generate_content(client, messages, tool, stream=stream)
+    return final, messages
+
+  def test_stream_matches_blocking_history(self, monkeypatch, capsys):
+    blocking_final, blocking_messages = self._run(False, monkeypatch)
+    streamed_final, streamed_messages = self._run(True, monkeypatch)
+    assert streamed_final == blocking_final == "All done."
+    assert [m.model_dump() for m in streamed_messages] == [m.model_dump() for m in blocking_messages]
+    assert "All done." in capsys.readouterr().out
+
+
+class TestReplayBackend:
+  """Tests for the offline replay model backend."""
+
+  @pytest.fixture
+  def workdir(self, tmp_path, monkeypatch):
+    (tmp_path / "a.py").write_text("print('hello')\n")
+    monkeypatch.setattr(call_function_module, "WORKING_DIRECTORY", str(tmp_path))
+    return tmp_path
+
+  def _session(self):
+    return [
+      {"function_calls": [{"name": "get_files_info", "args": {}}]},
+      {"function_calls": [{"name": "run_python_file", "args": {"file_path": "a.py"}}]},
+      {"text": "It prints hello."},
+    ]
+
+  def test_replay_drives_agent_loop(self, workdir):
+    client = ReplayClient(self._session())
+    messages = [types.Content(role="user", parts=[types.Part(text="what does a.py do?")])]
+    tool = call_function_module.get_available_functions()
+    results = [generate_content(client, messages, tool) for _ in range(3)]
+    assert results == [None, None, "It prints hello."]
+    responses = [m.parts[0].function_response.response["result"] for m in messages if m.parts[0].function_response]
+    assert "a.py: file_size=" in responses[0]
+    assert responses[1] == "STDOUT:\nhello\n"
+    with pytest.raises(RuntimeError, match="exhausted"):
+      generate_content(client, messages, tool)
+
+  def test_recorded_session_replays(self, workdir, tmp_path):
+    path = tmp_path / "session.json"
+    recorder = RecordingClient(ReplayClient(self._session()), str(path))
+    messages = [types.Content(role="user", parts=[types.Part(text="go")])]
+    tool = call_function_module.get_available_functions()
+    for _ in range(3):
+      generate_content(recorder, messages, tool, stream=True)
+    replayed = ReplayClient.from_file(str(path))
+    assert [turn.get("text") for turn in replayed.turns] == [None, None, "It prints hello."]
+    assert replayed.turns[1]["function_calls"] == [{"name": "run_python_file", "args": {"file_path": "a.py"}}]
+
+
+class _FailingModels:
+  """Fails every call to the models in failing, forwards the rest to a ReplayClient."""
+
+  def __init__(self, replay, failing, malformed=False, code=503):
+    self.replay = replay
+    self.failing = set(failing)
+    self.malformed = malformed
+    self.code = code
+    self.calls = []
+
+  def generate_content(self, model, contents, config=None):
+    self.calls.append(model)
+    if model in self.failing:
+      if self.malformed:
+        return types.GenerateContentResponse(
+          candidates=[types.Candidate(content=types.Content(role="model", parts=[]), finish_reason=types.FinishReason.MALFORMED_FUNCTION_CALL)],
+          usage_metadata=types.GenerateContentResponseUsageMetadata(prompt_token_count=1, candidates_token_count=0),
+        )
+      error_type = genai_errors.ClientError if self.code < 500 else genai_errors.ServerError
+      raise error_type(self.code, {"error": {"code": self.code, "message": f"{model} is unavailable", "status": "UNAVAILABLE"}})
+    return self.replay.models.generate_content(model, contents, config)
+
+
+class TestRouting:
+  """Tests for per-turn model routing and escalation."""
+
+  @pytest.fixture
+  def workdir(self, tmp_path, monkeypatch):
+    (tmp_path / "a.py").write_text("print('hello')\n")
+    monkeypatch.setattr(call_function_module, "WORKING_DIRECTORY", str(tmp_path))
+    return tmp_path
+
+  def _run(self, client, router, turns):
+    messages = [types.Content(role="user", parts=[types.Part(text="go")])]
+    tool = call_function_module.get_available_functions()
+    return [generate_content(client, messages, tool, router=router) for _ in range(turns)]
+
+  def test_rules_pick_model_per_turn(self, workdir):
+    client = ReplayClient([
+      {"function_calls": [{"name": "get_file_content", "args": {"file_path": "missing.py"}}]},
+      {"function_calls": [{"name": "run_python_file", "args": {"file_path": "a.py"}}]},
+      {"text": "done"},
+    ])
+    router = Router([Route("pro", min_errors=1, max_turn=1), Route("lite", pending_tool_results=True)], default="flash")
+    assert self._run(client, router, 3) == [None, None, "done"]
+    # The read of missing.py errors, so the second turn is routed to pro
+    assert [request["model"] for request in client.requests] == ["flash", "pro", "lite"]
+    assert router.stats()["models"]["lite"]["calls"] == 1
+
+  def test_history_size_rule(self, workdir):
+    router = Router([Route("long-context", min_history_tokens=1000)], default="flash")
+    short = [types.Content(role="user", parts=[types.Part(text="hi")])]
+    long = [types.Content(role="user", parts=[types.Part(text="word " * 2000)])]
+    assert router.choose(short) == ("flash", "default")
+    assert router.choose(long) == ("long-context", "min_history_tokens=1000")
+
+  def test_escalates_on_failure(self, workdir):
+    replay = ReplayClient([{"text": "done"}])
+    client = type("Client", (), {})()
+    client.models = _FailingModels(replay, failing={"lite", "flash"})
+    router = Router(default="lite", escalation=["lite", "flash", "pro"])
+    assert self._run(client, router, 1) == ["done"]
+    assert client.models.calls == ["lite", "flash", "pro"]
+    stats = router.stats()
+    assert stats["escalations"] == 2
+    assert stats["models"]["lite"]["failures"] == 1
+    assert stats["models"]["pro"]["failures"] == 0
+    assert stats["models"]["pro"]["prompt_tokens"] == 0
+
+  def test_escalates_on_malformed_function_call(self, workdir):
+    replay = ReplayClient([{"text": "done"}])
+    client = type("Client", (), {})()
+    client.models = _FailingModels(replay, failing={"flash"}, malformed=True)
+    router = Router(default="flash", escalation=["flash", "pro"])
+    assert self._run(client, router, 1) == ["done"]
+    assert client.models.calls == ["flash", "pro"]
+
+  def test_raises_when_no_stronger_model(self, workdir):
+    client = type("Client", (), {})()
+    client.models = _FailingModels(ReplayClient([]), failing={"pro"})
+    router = Router(default="pro", escalation=["flash", "pro"])
+    with pytest.raises(genai_errors.ServerError, match="pro is unavailable"):
+      self._run(client, router, 1)
+    assert router.stats()["escalations"] == 0
+
+  def test_bad_request_is_not_escalated(self, workdir):
+    client = type("Client", (), {})()
+    client.models = _FailingModels(ReplayClient([{"text": "done"}]), failing={"lite"}, code=400)
+    router = Router(default="lite", escalation=["lite", "flash", "pro"])
+    with pytest.raises(genai_errors.ClientError):
+      self._run(client, router, 1)
+    assert client.models.calls == ["lite"]
+    assert router.stats()["escalations"] == 0
+
+  def test_escalated_call_keeps_a_route_reason(self, workdir, tmp_path):
+    trace = tmp_path / "trace.jsonl"
+    replay = ReplayClient([{"text": "done"}])
+    client = type("Client", (), {})()
+    client.models = _FailingModels(replay, failing={"flash"}, malformed=True)
+    router = Router(default="flash", escalation=["flash", "pro"])
+    with tracing.use_tracer(tracing.Tracer(str(trace))):
+      self._run(client, router, 1)
+    spans = [json.loads(line) for line in trace.read_text().splitlines()]
+    routes = [(span["model"], span["route"]) for span in spans if span["name"] == "model_call"]
+    assert routes == [("flash", "default"), ("pro", "escalated from flash")]
+
+
+class TestTracing:
+  """Tests for span tracing and session profiling."""
+
+  def _run_session(self, workdir, monkeypatch):
+    (workdir / "a.py").write_text("print('hello')\n")
+    monkeypatch.setattr(call_function_module, "WORKING_DIRECTORY", str(workdir))
+    client = ReplayClient([
+      {"function_calls": [{"name": "get_file_content", "args": {"file_path": "a.py"}}], "prompt_tokens": 7, "response_tokens": 3},
+      {"text": "done"},
+    ])
+    messages = [types.Content(role="user", parts=[types.Part(text="go")])]
+    tool = call_function_module.get_available_functions()
+    with tracing.span("iteration", index=0):
+      generate_content(client, messages, tool)
+    with tracing.span("iteration", index=1):
+      generate_content(client, messages, tool)
+
+  def test_jsonl_spans(self, tmp_path, monkeypatch):
+    trace = tmp_path / "trace.jsonl"
+    with tracing.use_tracer(tracing.Tracer(str(trace))):
+      self._run_session(tmp_path, monkeypatch)
+    spans = [json.loads(line) for line in trace.read_text().splitlines()]
+    by_name = {}
+    for s in spans:
+      by_name.setdefault(s["name"], []).append(s)
+    assert len(by_name["iteration"]) == 2
+    model_call = by_name["model_call"][0]
+    assert model_call["prompt_tokens"] == 7
+    assert model_call["payload_bytes"] > 0
+    assert model_call["parent"] == by_name["iteration"][0]["id"]
+    tool_span = by_name["call_function"][0]
+    assert tool_span["tool"] == "get_file_content"
+    assert tool_span["result_bytes"] == len("print('hello')\n")
+    assert tool_span["duration_ms"] >= 0
+
+  def test_chrome_trace(self, tmp_path, monkeypatch):
+    trace = tmp_path / "trace.json"
+    with tracing.use_tracer(tracing.Tracer(str(trace))):
+      self._run_session(tmp_path, monkeypatch)
+    events = json.loads(trace.read_text())["traceEvents"]
+    assert {e["name"] for e in events} >= {"iteration", "model_call", "call_function"}
+    assert all(e["ph"] == "X" for e in events)
+
+  def test_disabled_by_default(self, tmp_path, monkeypatch):
+    assert not tracing.enabled()
+    self._run_session(tmp_path, monkeypatch)
+
+  def test_profiling_writes_reports(self, tmp_path, monkeypatch):
+    prefix = str(tmp_path / "profile")
+    with tracing.profiling(prefix):
+      self._run_session(tmp_path, monkeypatch)
+    report = (tmp_path / "profile.txt").read_text()
+    assert "generate_content" in report
+    assert "peak=" in report
+    assert (tmp_path / "profile.prof").exists()
+
+
+class TestSessionStore:
+  """Tests for append-only session checkpoints and --resume."""
+
+  def _messages(self, n):
+    return [types.Content(role="user", parts=[types.Part(text=f"m{i}")]) for i in range(n)]
+
+  def test_round_trip_is_append_only(self, tmp_path):
+    path = str(tmp_path / "s.jsonl")
+    session = SessionStore.create(path, "prompt")
+    messages = self._messages(2)
+    session.save(messages)
+    size_after_first = os.path.getsize(path)
+    messages += self._messages(1)
+    session.save(messages)
+    session.close()
+    with open(path) as f:
+      assert len(f.read()[size_after_first:].splitlines()) == 1
+
+    loaded = SessionStore.load(path)
+    assert loaded.prompt == "prompt"
+    assert [m.parts[0].text for m in loaded.messages] == ["m0", "m1", "m0"]
+    assert loaded.final is None
+
+  def test_torn_last_line_is_dropped(self, tmp_path):
+    path = str(tmp_path / "s.jsonl")
+    session = SessionStore.create(path, "prompt")
+    session.save(self._messages(2))
+    session.close()
+    with open(path, "a") as f:
+      f.write('{"type": "message", "content": {"ro')
+
+    loaded = SessionStore.load(path)
+    assert len(loaded.messages) == 2
+    loaded.save(loaded.messages + self._messages(1))
+    loaded.finish("done")
+    loaded.close()
+    reloaded = SessionStore.load(path)
+    assert len(reloaded.messages) == 3
+    assert reloaded.final == "done"
+
+  def test_resume_continues_without_replaying_tools(self, tmp_path):
+    (tmp_path / "one.json").write_text(json.dumps({"turns": [
+      {"function_calls": [{"name": "get_files_info", "args": {}}]},
+    ]}))
+    (tmp_path / "two.json").write_text(json.dumps({"turns": [{"text": "all done"}]}))
+    session = str(tmp_path / "session.jsonl")
+    main_py = str(Path(__file__).parent / "main.py")
+
+    first = subprocess.run([sys.executable, main_py, "list files", "--backend", f"replay:{tmp_path / 'one.json'}", "--session", session], capture_output=True, text=True)
+    assert f"--resume {session}" in first.stdout
+    second = subprocess.run([sys.executable, main_py, "--resume", session, "--backend", f"replay:{tmp_path / 'two.json'}"], capture_output=True, text=True)
+    assert second.stdout.strip() == "all done"
+    assert "Calling function" not in second.stdout
+
+    loaded = SessionStore.load(session)
+    assert loaded.final == "all done"
+    assert [m.role for m in loaded.messages] == ["user", "model", "user"]
+
+  def test_resume_rejects_session(self, tmp_path):
+    main_py = str(Path(__file__).parent / "main.py")
+    result = subprocess.run([sys.executable, main_py, "--resume", str(tmp_path / "a.jsonl"), "--session", str(tmp_path / "b.jsonl")], capture_output=True, text=True)
+    assert result.returncode == 2
+    assert "--session cannot be used with --resume" in result.stderr
+
+
+class TestDaemon:
+  """Tests for serving sessions over a Unix socket."""
+
+  @pytest.fixture
+  def serve(self, tmp_path):
+    """Start an AgentDaemon on a background event loop; yields a function taking the replay turns."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    servers = []
+
+    def start(turns, **kwargs):
+      client = ReplayClient(turns)
+      daemon = AgentDaemon(client, workspace=str(tmp_path), **kwargs)
+      socket_path = str(tmp_path / "agent.sock")
+      servers.append(asyncio.run_coroutine_threadsafe(daemon.start(socket_path), loop).result())
+      return daemon, socket_path
+
+    yield start
+    for server in servers:
+      loop.call_soon_threadsafe(server.close)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+  def test_session_streams_progress_then_result(self, tmp_path, serve):
+    (tmp_path / "a.txt").write_text("hello")
+    daemon, socket_path = serve([
+      {"function_calls": [{"name": "get_file_content", "args": {"file_path": "a.txt"}}]},
+      {"text": "It says hello"},
+    ])
+    events = list(request_session(socket_path, {"prompt": "what is in a.txt?"}))
+    tools = [event["tool"] for event in events if event["type"] == "span" and event["name"] == "call_function"]
+    assert tools == ["get_file_content"]
+    assert events[-1]["type"] == "result"
+    assert events[-1]["response"] == "It says hello"
+    assert events[-1]["iterations"] == 2
+
+  def test_socket_is_private_and_not_taken_over(self, tmp_path, serve):
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(tmp_path / "agent.sock"))
+    stale.close()
+    daemon, socket_path = serve([{"text": "first"}])
+    assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+    with pytest.raises(SocketInUseError, match="already serving"):
+      serve([{"text": "second"}])
+    assert list(request_session(socket_path, {"prompt": "hi"}))[-1]["response"] == "first"
+    assert sorted(os.listdir(tmp_path)) == ["agent.sock"]
+
+  def test_concurrent_sessions_share_the_daemon(self, tmp_path, serve):
+    daemon, socket_path = serve([{"text": f"answer {i}"} for i in range(4)])
+    results = []
+    def ask(i):
+      results.append(list(request_session(socket_path, {"prompt": f"question {i}"}))[-1])
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    assert sorted(result["response"] for result in results) == [f"answer {i}" for i in range(4)]
+    assert daemon.sessions == 4
+
+  def test_file_cache_is_warm_across_sessions(self, tmp_path, serve):
+    (tmp_path / "a.txt").write_text("hello")
+    read = {"function_calls": [{"name": "get_file_content", "args": {"file_path": "a.txt"}}]}
+    daemon, socket_path = serve([read, {"text": "one"}, read, {"text": "two"}])
+    list(request_session(socket_path, {"prompt": "first"}))
+    result = list(request_session(socket_path, {"prompt": "second"}))[-1]
+    assert result["file_cache"]["hits"] >= 1
+
+  def test_bad_request_reports_error(self, tmp_path, serve):
+    daemon, socket_path = serve([])
+    events = list(request_session(socket_path, {"prompt": "hi", "workspace": str(tmp_path / "missing")}))
+    assert events == [{"type": "error", "error": f"workspace '{tmp_path / 'missing'}' is not a directory"}]
+
+  def test_cli_client(self, tmp_path, serve):
+    daemon, socket_path = serve([{"text": "from the daemon"}])
+    main_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    result = subprocess.run([sys.executable, main_py, "hi", "--daemon", "--socket", socket_path, "--workspace", str(tmp_path)], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "from the daemon"
+
+
+class TestStartup:
+  """Guards against heavy imports creeping back into CLI startup."""
+
+  def _imported(self, argv):
+    from benchmarks.startup import heavy_imports
+    return heavy_imports(argv)
+
+  def test_help_does_not_import_sdk(self):
+    assert self._imported(["--help"]) == []
+
+  def test_usage_error_does_not_import_sdk(self):
+    assert self._imported([]) == []
+
+
 if __name__ == "__main__":
   # Run tests with pytest
   pytest.main([__file__, "-v", "-s"])
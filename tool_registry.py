@@ -0,0 +1,238 @@
+import os
+import inspect
+import threading
+import contextvars
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
+
+from config import TOOL_OVERRIDES, TOOL_RESULT_CAP
+from functions import edit_file, get_file_content, get_files_info, run_python_file, search_files, write_file
+from functions.result_format import check_format
+
+@dataclass(frozen=True)
+class ToolSpec:
+  """Everything the agent needs to know about one tool.
+
+  read_only tools never modify the workspace. path_arg names the argument
+  holding the path a tool touches; a mutating tool without one (it may touch
+  any file) is scheduled as a barrier. timeout is in seconds, result_cap in
+  characters (None falls back to TOOL_RESULT_CAP). result_format is "text"
+  or, for tools taking a result_format argument, "compact".
+  """
+  name: str
+  func: object
+  schema: dict
+  read_only: bool = False
+  path_arg: str | None = None
+  timeout: float | None = None
+  max_concurrency: int | None = None
+  result_cap: int | None = None
+  result_format: str = "text"
+
+TOOLS = [
+  ToolSpec("get_files_info", get_files_info.get_files_info, get_files_info.schema_get_files_info, read_only=True, path_arg="directory"),
+  ToolSpec("write_file", write_file.write_file, write_file.schema_write_file, path_arg="file_path"),
+  ToolSpec("get_file_content", get_file_content.get_file_content, get_file_content.schema_get_file_content, read_only=True, path_arg="file_path"),
+  ToolSpec("run_python_file", run_python_file.run_python_file, run_python_file.schema_run_python_file, timeout=30, max_concurrency=2),
+  ToolSpec("search_files", search_files.search_files, search_files.schema_search_files, read_only=True),
+  ToolSpec("edit_file", edit_file.edit_file, edit_file.schema_edit_file),
+]
+
+class ToolArgumentError(ValueError):
+  pass
+
+class ToolRegistry:
+  """Name -> tool table for one workspace, built once and shared by every call.
+
+  Arguments are validated and coerced against the tool's schema before
+  dispatch, and each call is held to its tool's timeout, concurrency limit
+  and result cap.
+  """
+
+  def __init__(self, specs=TOOLS, workspace=".", overrides=TOOL_OVERRIDES):
+    self.workspace = workspace
+    self.specs = {spec.name: replace(spec, **overrides.get(spec.name, {})) for spec in specs}
+    self._limits = {
+      name: threading.BoundedSemaphore(spec.max_concurrency)
+      for name, spec in self.specs.items() if spec.max_concurrency
+    }
+    # Tools that enforce a timeout themselves (e.g. by killing a subprocess)
+    self._takes_timeout = {
+      name for name, spec in self.specs.items()
+      if "timeout" in inspect.signature(spec.func).parameters
+    }
+    for name, spec in self.specs.items():
+      check_format(spec.result_format)
+      if spec.result_format != "text" and "result_format" not in inspect.signature(spec.func).parameters:
+        raise ValueError(f"{name} has no {spec.result_format} result format")
+    self._tool = None
+
+  @property
+  def tool(self):
+    # Schemas are plain dicts so importing the tools stays cheap; they are
+    # validated into SDK declarations once, the first time a session needs them
+    if self._tool is None:
+      from google.genai import types
+      self._tool = types.Tool(function_declarations=[
+        types.FunctionDeclaration.model_validate(spec.schema) for spec in self.specs.values()
+      ])
+    return self._tool
+
+  def access(self, name, args):
+    """Return (kind, path) describing what a call touches: kind is "read", "write" or "barrier"."""
+    spec = self.specs.get(name)
+    if spec is None:
+      return "barrier", None
+    path = os.path.normpath(str((args or {}).get(spec.path_arg) or ".")) if spec.path_arg else "."
+    if spec.read_only:
+      return "read", path
+    if spec.path_arg:
+      return "write", path
+    return "barrier", None
+
+  def call(self, name, args):
+    """Run a tool and return the response dict sent back to the model."""
+    spec = self.specs.get(name)
+    if spec is None:
+      return {"error": f"Unknown function: {name}"}
+    try:
+      kwargs = validate_args(spec.schema, args or {})
+    except ToolArgumentError as e:
+      return {"error": f"Invalid arguments for {name}: {e}"}
+    kwargs["working_directory"] = self.workspace
+    if spec.result_format != "text":
+      kwargs["result_format"] = spec.result_format
+
+    limit = self._limits.get(name)
+    if limit:
+      limit.acquire()
+    try:
+      if spec.timeout and name in self._takes_timeout:
+        result = spec.func(**kwargs, timeout=spec.timeout)
+      elif spec.timeout:
+        result = _run_with_timeout(spec.func, kwargs, spec.timeout)
+      else:
+        result = spec.func(**kwargs)
+    except TimeoutError:
+      return {"error": f"{name} timed out after {spec.timeout} seconds"}
+    except Exception as e:
+      return {"error": f"{name} failed: {e}"}
+    finally:
+      if limit:
+        limit.release()
+
+    return {"result": _cap(result, spec.result_cap or TOOL_RESULT_CAP)}
+
+def _run_with_timeout(func, kwargs, timeout):
+  """Run func on a daemon thread and give up waiting after timeout seconds.
+
+  The thread cannot be interrupted, so a timed out call keeps running in the
+  background; tools that can cancel their work should accept a timeout
+  argument instead.
+  """
+  outcome = {}
+  def target():
+    try:
+      outcome["result"] = func(**kwargs)
+    except BaseException as e:
+      outcome["error"] = e
+  thread = threading.Thread(target=contextvars.copy_context().run, args=(target,), daemon=True)
+  thread.start()
+  thread.join(timeout)
+  if thread.is_alive():
+    raise TimeoutError
+  if "error" in outcome:
+    raise outcome["error"]
+  return outcome["result"]
+
+def _cap(result, cap):
+  if isinstance(result, str) and len(result) > cap:
+    return result[:cap] + f"\n[... result truncated, {len(result) - cap} more characters]"
+  return result
+
+def validate_args(schema, args):
+  """Check args against a tool schema, coercing near-misses (e.g. "3" for an INTEGER)."""
+  parameters = schema.get("parameters") or {}
+  return _coerce(dict(args), parameters, "arguments")
+
+def _coerce(value, schema, where):
+  kind = schema.get("type", "OBJECT").upper()
+  if value is None:
+    return None
+
+  if kind == "OBJECT":
+    if not isinstance(value, dict):
+      raise ToolArgumentError(f"{where} must be an object")
+    properties = schema.get("properties")
+    if properties is None:
+      return dict(value)
+    unknown = sorted(set(value) - set(properties))
+    if unknown:
+      raise ToolArgumentError(f"unexpected {', '.join(unknown)} in {where}")
+    missing = [name for name in schema.get("required", []) if value.get(name) is None]
+    if missing:
+      raise ToolArgumentError(f"missing required {', '.join(missing)} in {where}")
+    return {name: _coerce(item, properties[name], name) for name, item in value.items()}
+
+  if kind == "ARRAY":
+    # A lone value where a list is expected is a common slip; wrap it
+    items = list(value) if isinstance(value, (list, tuple)) else [value]
+    item_schema = schema.get("items") or {}
+    return [_coerce(item, item_schema, f"{where}[{i}]") for i, item in enumerate(items)] if item_schema else items
+
+  if kind == "STRING":
+    if isinstance(value, str):
+      return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+      return str(value)
+    raise ToolArgumentError(f"{where} must be a string")
+
+  if kind == "INTEGER":
+    if isinstance(value, bool):
+      raise ToolArgumentError(f"{where} must be an integer")
+    if isinstance(value, int):
+      return value
+    if isinstance(value, float) and value.is_integer():
+      return int(value)
+    if isinstance(value, str):
+      try:
+        return int(value.strip())
+      except ValueError:
+        pass
+    raise ToolArgumentError(f"{where} must be an integer, got {value!r}")
+
+  if kind == "NUMBER":
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+      return value
+    if isinstance(value, str):
+      try:
+        return float(value.strip())
+      except ValueError:
+        pass
+    raise ToolArgumentError(f"{where} must be a number, got {value!r}")
+
+  if kind == "BOOLEAN":
+    if isinstance(value, bool):
+      return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+      return value.strip().lower() == "true"
+    if isinstance(value, (int, float)) and value in (0, 1):
+      return bool(value)
+    raise ToolArgumentError(f"{where} must be true or false, got {value!r}")
+
+  return value
+
+_current_registry = ContextVar("tool_registry", default=None)
+
+def current_registry():
+  return _current_registry.get()
+
+@contextmanager
+def use_registry(registry):
+  """Make registry the tool registry for the current session (context)."""
+  token = _current_registry.set(registry)
+  try:
+    yield registry
+  finally:
+    _current_registry.reset(token)
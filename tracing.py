@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_tracer = ContextVar("tracer", default=None)
+_current_span = ContextVar("span", default=None)
+
+def current_tracer():
+  return _current_tracer.get()
+
+def enabled():
+  return _current_tracer.get() is not None
+
+@contextmanager
+def use_tracer(tracer):
+  token = _current_tracer.set(tracer)
+  try:
+    yield tracer
+  finally:
+    _current_tracer.reset(token)
+    tracer.close()
+
+@contextmanager
+def span(name, **attrs):
+  """Time the enclosed block as a span; yields a dict the caller can add attributes to."""
+  tracer = _current_tracer.get()
+  if tracer is None:
+    yield attrs
+    return
+  span_id = next(tracer._ids)
+  parent_token = _current_span.set(span_id)
+  start = time.perf_counter_ns()
+  try:
+    yield attrs
+  except BaseException as e:
+    attrs["error"] = repr(e)
+    raise
+  finally:
+    _current_span.reset(parent_token)
+    tracer.record(name, span_id, _current_span.get(), start, time.perf_counter_ns() - start, attrs)
+
+class Tracer:
+  """Collects spans and writes them as JSON lines, or as a Chrome trace if path ends in .json."""
+
+  def __init__(self, path, chrome=None):
+    self.path = path
+    self.chrome = path.endswith(".json") if chrome is None else chrome
+    self._ids = itertools.count(1)
+    self._lock = threading.Lock()
+    self._events = []
+    self._origin = time.perf_counter_ns()
+    self._file = None if self.chrome else open(path, "w")
+
+  def record(self, name, span_id, parent_id, start_ns, duration_ns, attrs):
+    with self._lock:
+      if self.chrome:
+        self._events.append({
+          "name": name,
+          "ph": "X",
+          "ts": (start_ns - self._origin) / 1000,
+          "dur": duration_ns / 1000,
+          "pid": os.getpid(),
+          "tid": threading.get_ident(),
+          "args": attrs,
+        })
+      else:
+        self._file.write(json.dumps({
+          "name": name,
+          "id": span_id,
+          "parent": parent_id,
+          "start_ms": (start_ns - self._origin) / 1e6,
+          "duration_ms": duration_ns / 1e6,
+          "thread": threading.current_thread().name,
+          **attrs,
+        }, default=str) + "\n")
+
+  def close(self):
+    with self._lock:
+      if self.chrome:
+        with open(self.path, "w") as f:
+          json.dump({"traceEvents": self._events}, f, default=str)
+      elif self._file and not self._file.closed:
+        self._file.close()
+
+@contextmanager
+def profiling(path, top=30):
+  """Profile the enclosed block with cProfile and tracemalloc.
+
+  Writes raw stats to <path>.prof and a text report of the hottest functions
+  and largest allocation sites to <path>.txt.
+  """
+  import io
+  import pstats
+  import cProfile
+  import tracemalloc
+
+  profiler = cProfile.Profile()
+  tracemalloc.start()
+  profiler.enable()
+  try:
+    yield
+  finally:
+    profiler.disable()
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    profiler.dump_stats(f"{path}.prof")
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(top)
+    report.write(f"\nMemory: current={current} bytes, peak={peak} bytes\n\nTop allocation sites:\n")
+    for stat in snapshot.statistics("lineno")[:top]:
+      report.write(f"{stat}\n")
+    with open(f"{path}.txt", "w") as f:
+      f.write(report.getvalue())
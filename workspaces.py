@@ -0,0 +1,276 @@
+import os
+import uuid
+import errno
+import shutil
+import asyncio
+import difflib
+from contextlib import asynccontextmanager
+
+from config import WORKSPACE_DIR, WORKSPACE_EXCLUDE
+from functions.atomic_write import atomic_write
+from functions.line_index import is_binary
+from functions.run_cache import get_run_cache
+from functions.search_index import drop_index
+from tool_registry import TOOLS, ToolRegistry, use_registry
+
+# Linux ioctl that makes dst share src's extents (btrfs, XFS, bcachefs, ...)
+_FICLONE = 0x40049409
+
+def _reflink(src, dst):
+  import fcntl
+
+  with open(src, "rb") as source, open(dst, "wb") as target:
+    try:
+      fcntl.ioctl(target.fileno(), _FICLONE, source.fileno())
+    except OSError:
+      target.close()
+      os.remove(dst)
+      raise
+  shutil.copystat(src, dst)
+
+def _hardlink(src, dst):
+  os.link(src, dst)
+
+def _copy(src, dst):
+  shutil.copy2(src, dst)
+
+_LINKERS = {"reflink": _reflink, "hardlink": _hardlink, "copy": _copy}
+# Methods tried in order for each mode
+_ORDERS = {
+  "auto": ("reflink", "hardlink", "copy"),
+  "private": ("reflink", "copy"),
+  **{method: (method,) for method in _LINKERS},
+}
+# Errors meaning "this filesystem (pair) can't do that", as opposed to real I/O failures
+_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.EPERM, errno.EMLINK}
+
+def _signature(st):
+  return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+class Workspace:
+  """A session's private view of a base tree, and the changes made in it.
+
+  Files start out as reflinks or hardlinks of the base's, so creating a
+  workspace costs a directory walk rather than a copy. The tools write files
+  with temp-file-plus-rename, which replaces a link with a new file: the
+  first write copies, and the base is never touched.
+
+  Hardlinks share an inode with the base, so a script that modifies an
+  existing file in place (open(path, "a")) writes through to the base. Mode
+  "private" (reflink, else copy) never shares an inode and is what
+  isolated() uses.
+  """
+
+  def __init__(self, base, root, mode, manifest):
+    self.base = base
+    self.root = root
+    self.mode = mode
+    # Relative path -> (base signature, workspace signature) when the
+    # workspace was made; a file whose signature still matches is unchanged
+    self.manifest = manifest
+
+  def _walk(self, top):
+    found = {}
+    for directory, dirnames, filenames in _walk(top):
+      relative_dir = os.path.relpath(directory, top)
+      for name in filenames:
+        relative_path = os.path.normpath(os.path.join(relative_dir, name))
+        try:
+          found[relative_path] = os.lstat(os.path.join(directory, name))
+        except FileNotFoundError:
+          continue
+    return found
+
+  def changes(self):
+    """Return sorted (status, relative_path) pairs; status is "added", "modified" or "deleted"."""
+    current = self._walk(self.root)
+    changes = []
+    for relative_path, st in current.items():
+      original = self.manifest.get(relative_path)
+      if original is None:
+        changes.append(("added", relative_path))
+      elif _signature(st) != original[1] and _differs(os.path.join(self.root, relative_path), os.path.join(self.base, relative_path)):
+        changes.append(("modified", relative_path))
+    changes.extend(("deleted", relative_path) for relative_path in self.manifest if relative_path not in current)
+    return sorted(changes, key=lambda change: change[1])
+
+  def diff(self, context=3):
+    """The session's changes as a unified diff against the base (`git apply` compatible)."""
+    lines = []
+    for status, relative_path in self.changes():
+      before_path = os.path.join(self.base, relative_path)
+      after_path = os.path.join(self.root, relative_path)
+      if any(os.path.isfile(path) and is_binary(path) for path in (before_path, after_path)):
+        lines.append(f"Binary files a/{relative_path} and b/{relative_path} differ\n")
+        continue
+      before = _read_lines(before_path) if status != "added" else []
+      after = _read_lines(after_path) if status != "deleted" else []
+      lines.extend(difflib.unified_diff(
+        before, after,
+        "/dev/null" if status == "added" else f"a/{relative_path}",
+        "/dev/null" if status == "deleted" else f"b/{relative_path}",
+        n=context,
+      ))
+    return "".join(lines)
+
+  def export(self, paths=None, force=False):
+    """Apply the session's changes to the base tree.
+
+    Files changed in the base since the workspace was created are conflicts
+    and are left alone unless force is set. Returns {"exported": [...],
+    "conflicts": [...]}.
+    """
+    exported = []
+    conflicts = []
+    for status, relative_path in self.changes():
+      if paths is not None and relative_path not in paths:
+        continue
+      base_path = os.path.join(self.base, relative_path)
+      if not force and self._base_changed(relative_path, base_path):
+        conflicts.append(relative_path)
+        continue
+      session_path = os.path.join(self.root, relative_path)
+      if status == "deleted":
+        if os.path.lexists(base_path):
+          os.remove(base_path)
+      elif os.path.islink(session_path):
+        if os.path.lexists(base_path):
+          os.remove(base_path)
+        os.makedirs(os.path.dirname(base_path), exist_ok=True)
+        os.symlink(os.readlink(session_path), base_path)
+      else:
+        os.makedirs(os.path.dirname(base_path), exist_ok=True)
+        with open(session_path, "rb") as f:
+          atomic_write(base_path, f.read())
+      exported.append(relative_path)
+    return {"exported": exported, "conflicts": conflicts}
+
+  def _base_changed(self, relative_path, base_path):
+    original = self.manifest.get(relative_path)
+    try:
+      st = os.lstat(base_path)
+    except FileNotFoundError:
+      return original is not None
+    return original is None or _signature(st) != original[0]
+
+  def remove(self):
+    shutil.rmtree(self.root, ignore_errors=True)
+    drop_index(self.root)
+    get_run_cache().forget(self.root)
+    container = os.path.dirname(self.root)
+    if container == _workspace_dir(self.base):
+      try:
+        # The default directory holding base's workspaces, once the last one is gone
+        os.rmdir(container)
+      except OSError:
+        pass
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.remove()
+
+def create_workspace(base, root=None, mode="auto"):
+  """Create a private workspace mirroring base and return it.
+
+  mode is "reflink", "hardlink", "copy", "auto" to use the cheapest one the
+  filesystem supports (falling back per file, e.g. across devices), or
+  "private" for the cheapest that shares no inode with base (reflink, else
+  copy). By default the workspace is created next to base, so links and
+  reflinks stay on one device.
+  """
+  base = os.path.realpath(base)
+  root = os.path.abspath(root or os.path.join(_workspace_dir(base), uuid.uuid4().hex))
+  if mode not in _ORDERS:
+    raise ValueError(f"Unknown workspace mode: {mode}")
+  os.makedirs(root)
+
+  order = list(_ORDERS[mode])
+  manifest = {}
+  for directory, dirnames, filenames in _walk(base):
+    relative_dir = os.path.relpath(directory, base)
+    target_dir = os.path.normpath(os.path.join(root, relative_dir))
+    os.makedirs(target_dir, exist_ok=True)
+    for name in filenames:
+      src = os.path.join(directory, name)
+      dst = os.path.join(target_dir, name)
+      relative_path = os.path.normpath(os.path.join(relative_dir, name))
+      if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+      else:
+        order = _link(src, dst, order)
+      manifest[relative_path] = (_signature(os.lstat(src)), _signature(os.lstat(dst)))
+  return Workspace(base, root, order[0] if order else "copy", manifest)
+
+def _workspace_dir(base):
+  """Where workspaces of base go: WORKSPACE_DIR if set, else a hidden sibling of base."""
+  if WORKSPACE_DIR:
+    return WORKSPACE_DIR
+  parent, name = os.path.split(base)
+  return os.path.join(parent, f".{name or 'root'}.workspaces")
+
+@asynccontextmanager
+async def isolated(base):
+  """Run the enclosed session in a fresh workspace cloned from base.
+
+  Files are reflinked or copied, never hardlinked, so not even a script
+  writing a file in place can reach the base or another session. The tools
+  are confined to the workspace for the rest of the task; it is deleted on
+  exit, so collect its changes() or diff() before leaving.
+  """
+  workspace = await asyncio.to_thread(create_workspace, base, None, "private")
+  try:
+    with use_registry(ToolRegistry(TOOLS, workspace=workspace.root)):
+      yield workspace
+  finally:
+    await asyncio.to_thread(workspace.remove)
+
+def summarize(workspace):
+  """The changes of a finished session, as stored in batch and daemon results."""
+  return {
+    "changes": [{"status": status, "path": path} for status, path in workspace.changes()],
+    "diff": workspace.diff(),
+  }
+
+def _walk(top):
+  """os.walk that skips WORKSPACE_EXCLUDE and lists symlinks to directories as files."""
+  for directory, dirnames, filenames in os.walk(top):
+    links = [name for name in dirnames if os.path.islink(os.path.join(directory, name))]
+    dirnames[:] = [name for name in dirnames if name not in WORKSPACE_EXCLUDE and name not in links]
+    yield directory, dirnames, filenames + links
+
+def _link(src, dst, order):
+  """Link src to dst with the first method in order that works; returns the order to use next time."""
+  for method in list(order):
+    try:
+      _LINKERS[method](src, dst)
+      return order
+    except OSError as e:
+      if e.errno not in _UNSUPPORTED or method == order[-1]:
+        raise
+      if method == "reflink":
+        # Reflink support is per filesystem, so don't retry it for every file
+        order = order[1:]
+  return order
+
+def _differs(path_a, path_b):
+  if os.path.islink(path_a) or os.path.islink(path_b):
+    return not (os.path.islink(path_a) and os.path.islink(path_b)) or os.readlink(path_a) != os.readlink(path_b)
+  return os.path.getsize(path_a) != os.path.getsize(path_b) or not _same_content(path_a, path_b)
+
+def _same_content(path_a, path_b, chunk_size=1024 * 1024):
+  with open(path_a, "rb") as a, open(path_b, "rb") as b:
+    while True:
+      chunk_a = a.read(chunk_size)
+      if chunk_a != b.read(chunk_size):
+        return False
+      if not chunk_a:
+        return True
+
+def _read_lines(path):
+  with open(path, "r", errors="replace") as f:
+    lines = f.readlines()
+  if lines and not lines[-1].endswith("\n"):
+    lines[-1] += "\n\\ No newline at end of file\n"
+  return lines